@@ -458,6 +458,10 @@ class SourceGenerator(ExplicitNodeVisitor):
         for comprehension in node.generators:
             self.visit(comprehension)
 
+    @enclose('()')
+    def visit_NamedExpr(self, node):
+        self.write(node.target, ' := ', node.value)
+
     @enclose('()')
     def visit_IfExp(self, node):
         self.write(node.body, ' if ', node.test, ' else ', node.orelse)
@@ -0,0 +1,219 @@
+## Persistent on-disk cache for modules that are typechecked and
+## compiled by imports.get_imported_type.
+##
+## Entries are content-addressed. A module's source key combines its
+## path, the hash of its source text, the Reticulated version, the
+## semantics, optimization and code generation flags (see
+## flags.CODEGEN_FLAGS), and the bytecode magic number of the running
+## Python. For every source key we keep a small manifest listing the
+## files the module imported; the key of the entry itself
+## additionally includes the interface hashes of those dependencies.
+## An entry holds the marshalled code object along with the module's
+## retic_type and retic_aliases, so that a module whose source and
+## whose dependencies' interfaces are unchanged never has to be
+## parsed, typechecked, or compiled again.
+##
+## Classes that a module's interface borrows from one of its
+## dependencies are pickled by reference (the dependency's file plus
+## the path to the class in its exports), since Class types are
+## compared by identity.
+##
+## All writes go through a temporary file and os.replace, so
+## concurrent processes can share one cache directory.
+
+from . import flags, retic_ast
+import hashlib, marshal, pickle, os, io, tempfile, importlib.util, collections
+
+SEMANTICS = 'TRANS'
+
+# Maps files to the hashes of their serialized interfaces. A file only
+# has an entry here once its interface is final (i.e. it has been
+# loaded from the cache or recorded with record_interface), so modules
+# that are part of an import cycle are never cached.
+interface_hashes = {}
+
+# Serialized interfaces of modules that have been typechecked but not
+# yet compiled and stored.
+interfaces = {}
+
+# Cache files that this process has recently read or written, so that
+# long-running processes (see daemon.py) don't go back to the disk.
+# Only the REMEMBERED most recently used files are kept.
+REMEMBERED = 1024
+remembered = collections.OrderedDict()
+
+def _digest(*parts)->str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def build_key(optimize:bool)->str:
+    # Everything other than the source that determines how a module is
+    # compiled (also used by compile_tree.py)
+    return _digest(flags.RETIC_VERSION, SEMANTICS, flags.optimized(), optimize, *flags.codegen_flags())
+
+def source_key(file:str, src:bytes, optimize:bool)->str:
+    return _digest(os.path.abspath(file), hashlib.sha256(src).hexdigest(), build_key(optimize),
+                   importlib.util.MAGIC_NUMBER)
+
+def entry_key(srckey:str, deps)->str:
+    return _digest(srckey, *['{}={}'.format(dep, interface_hashes[dep]) for dep in sorted(deps)])
+
+def _class_paths(ty, path, acc):
+    # Record where each named class can be found in a module's exports
+    if isinstance(ty, retic_ast.Module):
+        for k in ty.exports:
+            _class_paths(ty.exports[k], path + [k], acc)
+    elif isinstance(ty, retic_ast.Class) and id(ty) not in acc:
+        acc[id(ty)] = path
+        for k in ty.members:
+            _class_paths(ty.members[k], path + [k], acc)
+
+def _follow(ty, path):
+    for elt in path:
+        ty = ty.exports[elt] if isinstance(ty, retic_ast.Module) else ty.members[elt]
+    return ty
+
+def dump_interfaces(modules, deps)->bytes:
+    """
+    Serialize the interfaces of one or more modules, given as a
+    dictionary from files to (retic_type, retic_aliases) pairs. Classes
+    that belong to other modules that have already been typechecked
+    (preferring the given dependencies) are stored by reference.
+    """
+    from . import imports
+    owners = {}
+    others = sorted(file for file in imports.import_type_cache if file not in deps)
+    for dep in sorted(deps) + others:
+        if dep in modules:
+            continue
+        acc = {}
+        _class_paths(imports.import_type_cache[dep][0], [], acc)
+        for cls in acc:
+            owners.setdefault(cls, (dep, acc[cls]))
+
+    class InterfacePickler(pickle.Pickler):
+        def persistent_id(self, obj):
+            if isinstance(obj, retic_ast.Class) and id(obj) in owners:
+                dep, path = owners[id(obj)]
+                return dep, tuple(path)
+            return None
+
+    buf = io.BytesIO()
+    InterfacePickler(buf, protocol=pickle.HIGHEST_PROTOCOL).dump(modules)
+    return buf.getvalue()
+
+def load_interfaces(data:bytes):
+    """
+    Inverse of dump_interfaces. Classes stored by reference are
+    resolved through imports.get_imported_type.
+    """
+    from . import imports
+
+    class InterfaceUnpickler(pickle.Unpickler):
+        def persistent_load(self, pid):
+            dep, path = pid
+            return _follow(imports.get_imported_type(dep)[0], path)
+
+    return InterfaceUnpickler(io.BytesIO(data)).load()
+
+def _remember(path:str, obj):
+    remembered[path] = obj
+    remembered.move_to_end(path)
+    while len(remembered) > REMEMBERED:
+        remembered.popitem(last=False)
+    return obj
+
+def _read(path:str):
+    if path in remembered:
+        remembered.move_to_end(path)
+        return remembered[path]
+    try:
+        with open(path, 'rb') as f:
+            return _remember(path, pickle.load(f))
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError, AttributeError, ImportError):
+        return None
+
+def _write(path:str, obj):
+    _remember(path, obj)
+    _atomic_write(path, pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+def _atomic_write(path:str, data:bytes):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except:
+        os.unlink(tmp)
+        raise
+
+def load(file:str, src:bytes, optimize:bool=False):
+    """
+    Look up a module in the cache. Returns a (retic_type,
+    retic_aliases, code) triple on a hit and None on a miss. The
+    dependencies recorded for the module are resolved (and, if
+    necessary, typechecked) through imports.get_imported_type.
+    """
+    from . import imports
+    dir = flags.cache_dir()
+    if dir is None:
+        return None
+    srckey = source_key(file, src, optimize)
+    deps = _read(os.path.join(dir, srckey + '.deps'))
+    if deps is None:
+        return None
+    for dep in deps:
+        if not os.path.isfile(dep):
+            return None
+        imports.get_imported_type(dep)
+        if dep not in interface_hashes:
+            return None
+    entry = _read(os.path.join(dir, entry_key(srckey, deps) + '.retic'))
+    if entry is None:
+        return None
+    try:
+        ty, aliases = load_interfaces(entry['interface'])[file]
+        code = marshal.loads(entry['code'])
+    except (EOFError, pickle.UnpicklingError, ValueError, TypeError, KeyError, AttributeError):
+        return None
+    interface_hashes[file] = hashlib.sha256(entry['interface']).hexdigest()
+    return ty, aliases, code
+
+def record_interface(file:str, ty, aliases, deps):
+    """
+    Serialize a module's interface and record its hash, so that
+    modules which import it can be cached. Does nothing if some
+    dependency's interface is not final or if the interface cannot be
+    serialized.
+    """
+    if flags.cache_dir() is None or any(dep not in interface_hashes for dep in deps):
+        return
+    try:
+        interface = dump_interfaces({file: (ty, aliases)}, deps)
+    except (pickle.PicklingError, TypeError, AttributeError, RecursionError):
+        return
+    interfaces[file] = interface
+    interface_hashes[file] = hashlib.sha256(interface).hexdigest()
+
+def store(file:str, src:bytes, deps, code, optimize:bool=False):
+    """
+    Record a freshly compiled module whose interface has already been
+    recorded with record_interface. Does nothing if caching is
+    disabled or if the interface of the module or of one of its
+    dependencies is not available.
+    """
+    dir = flags.cache_dir()
+    if dir is None or file not in interfaces or any(dep not in interface_hashes for dep in deps):
+        return
+    srckey = source_key(file, src, optimize)
+    deps = sorted(deps)
+    try:
+        os.makedirs(dir, exist_ok=True)
+        _write(os.path.join(dir, entry_key(srckey, deps) + '.retic'),
+               {'interface': interfaces.pop(file), 'code': marshal.dumps(code)})
+        _write(os.path.join(dir, srckey + '.deps'), deps)
+    except OSError:
+        pass
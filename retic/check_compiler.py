@@ -45,7 +45,7 @@ class CheckCompiler(copy_visitor.CopyVisitor):
 
 
     def visitCheck(self, n, *args):
-        val = self.dispatch(n.value)
+        val = self.dispatch(n.value, *args)
         return ast_trans.Call(func=ast.Name(id=check_function, ctx=ast.Load(), lineno=n.lineno, col_offset=n.col_offset),
                               args=[val, n.type.to_ast(lineno=val.lineno, col_offset=val.col_offset)], keywords=[], starargs=None,
                               kwargs=None, lineno=val.lineno, col_offset=val.col_offset)
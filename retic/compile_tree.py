@@ -0,0 +1,130 @@
+## Ahead-of-time compilation of a whole source tree (retic
+## --compile-tree SRC OUT).
+##
+## Every Python file under SRC is typechecked and transient-compiled,
+## and the result is written (along with its .pyc file) to the same
+## relative location under OUT. The emitted modules import the
+## Reticulated runtime directly, so the output tree runs under plain
+## python3 with no import hook and no typechecking at process start;
+## other files are copied over unchanged.
+##
+## OUT also receives a manifest recording, for every module, the hash
+## of its source, the hash of its interface, and the interface hashes
+## of the modules it imports at the time it was built. On a rebuild,
+## the interfaces of all modules are recomputed (which does not
+## require typechecking function bodies), and only modules whose
+## source changed or whose dependencies' interfaces changed are
+## checked and compiled again.
+
+from . import static, imports, cache, flags
+import os, sys, json, hashlib, shutil, py_compile, importlib.util
+
+MANIFEST = 'retic-manifest.json'
+
+def read_manifest(out:str, key:str):
+    try:
+        with open(os.path.join(out, MANIFEST), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('key') != key:
+        return {}
+    return manifest.get('modules', {})
+
+def write_manifest(out:str, key:str, modules):
+    cache._atomic_write(os.path.join(out, MANIFEST),
+                        json.dumps({'key': key, 'modules': modules}, indent=1, sort_keys=True).encode('utf-8'))
+
+def source_files(src:str):
+    for root, dirs, files in os.walk(src):
+        dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+        for file in sorted(files):
+            yield os.path.join(root, file)
+
+def interface_hash(file:str, hashes)->str:
+    # Memoized in hashes, since a module's entry in
+    # imports.deferred_modules goes away once it is compiled
+    if file not in hashes:
+        if not os.path.isfile(file):
+            return None
+        ty, aliases = imports.get_imported_type(file)
+        deps = imports.deferred_modules[file][3] if file in imports.deferred_modules else set()
+        hashes[file] = hashlib.sha256(cache.dump_interfaces({file: (ty, aliases)}, deps)).hexdigest()
+    return hashes[file]
+
+def emit_file(file:str, target:str, optimize:bool):
+    """
+    Fully typecheck and compile a module whose interface has already
+    been computed by imports.get_imported_type, and write it to
+    target. Returns the set of files it imports. Any module in the
+    tree may be imported by code outside of it, so modules are
+    optimized the way imported modules are.
+    """
+    raw, st, srcdata, deps = imports.deferred_modules.pop(file)
+    imports.import_dependencies.append((file, deps))
+    try:
+        st = static.typecheck_module(st, srcdata)
+    finally:
+        imports.import_dependencies.pop()
+    st = static.transient_compile_module(st, optimize, library=True)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'w', encoding='utf-8') as f:
+        static.emit_module(st, file=f)
+    py_compile.compile(target, doraise=True)
+    return deps
+
+def compile_tree(src:str, out:str, optimize:bool=True, stream=sys.stdout):
+    src = os.path.abspath(src)
+    out = os.path.abspath(out)
+    if not os.path.isdir(src):
+        raise IOError('Source tree {} is not a directory'.format(src))
+    sys.path.insert(1, src)
+    # The manifest takes care of incremental rebuilds
+    flags.USE_CACHE = False
+
+    key = cache.build_key(optimize)
+    old = read_manifest(out, key)
+    files = list(source_files(src))
+    modules = [file for file in files if file.endswith('.py')]
+
+    for file in modules:
+        imports.get_imported_type(file)
+    hashes = {}
+    for file in modules:
+        interface_hash(file, hashes)
+
+    manifest = {}
+    rebuilt = 0
+    for file in modules:
+        rel = os.path.relpath(file, src)
+        target = os.path.join(out, rel)
+        with open(file, 'rb') as f:
+            srchash = hashlib.sha256(f.read()).hexdigest()
+        entry = old.get(rel)
+        if entry is not None and entry['source'] == srchash and os.path.isfile(target) and \
+           all(interface_hash(dep, hashes) == entry['deps'][dep] for dep in entry['deps']):
+            manifest[rel] = entry
+            manifest[rel]['interface'] = hashes[file]
+            imports.deferred_modules.pop(file, None)
+            continue
+        deps = emit_file(file, target, optimize)
+        manifest[rel] = {'source': srchash, 'interface': hashes[file],
+                         'deps': {dep: interface_hash(dep, hashes) for dep in sorted(deps) if dep != file}}
+        rebuilt += 1
+
+    for file in files:
+        if not file.endswith('.py'):
+            target = os.path.join(out, os.path.relpath(file, src))
+            if not os.path.isfile(target) or os.path.getmtime(target) < os.path.getmtime(file):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(file, target)
+
+    for rel in old:
+        if rel not in manifest:
+            for stale in [os.path.join(out, rel), importlib.util.cache_from_source(os.path.join(out, rel))]:
+                if os.path.isfile(stale):
+                    os.unlink(stale)
+
+    os.makedirs(out, exist_ok=True)
+    write_manifest(out, key, manifest)
+    print('Compiled {} of {} modules into {}'.format(rebuilt, len(modules), out), file=stream)
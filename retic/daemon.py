@@ -0,0 +1,243 @@
+## A long-lived Reticulated process that keeps typechecking state warm
+## between runs (retic --daemon SOCKET), and the client used to talk to
+## it (retic --connect SOCKET program.py).
+##
+## The daemon listens on a UNIX socket for requests, one JSON object
+## per line, of the form
+##
+##   {"command": "check" | "compile" | "status" | "stop",
+##    "file": "/path/to/program.py", "optimize": true}
+##
+## and answers with a JSON object with a "status" of "ok" or "error",
+## an "output" field holding whatever Reticulated printed (such as
+## static type errors), and for "compile", a "source" field containing
+## the transient-compiled program.
+##
+## Interfaces of imported modules live on in imports.import_type_cache
+## and the on-disk cache entries they were loaded from are remembered
+## by cache.py. A watcher thread polls every file the daemon has seen;
+## when one changes, it and every module that (transitively) imports it
+## are dropped from memory. Dropped modules are then restored from the
+## cache when the next request needs them, which only succeeds if the
+## interfaces of their imports are unchanged -- so only changed modules
+## and dependents whose imported interfaces actually changed are
+## typechecked again. Results for requested files are memoized the same
+## way, keyed by the interface hashes of their imports. Without the
+## on-disk cache (retic --no-cache, or an empty RETIC_CACHE_DIR),
+## dropped modules can't be restored and results aren't memoized; the
+## daemon says so when it starts and in its status.
+
+from . import static, imports, importhook, cache, retic_ast, flags
+import os, sys, io, stat, errno, json, socket, socketserver, threading, contextlib
+
+POLL_INTERVAL = 0.5
+
+NO_CACHE = 'The on-disk cache is disabled: requested programs, changed modules ' + \
+           'and every module that imports them will always be typechecked again\n'
+
+class Daemon:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.stamps = {}
+        self.results = {}
+        self.requests = 0
+
+    def stamp(self, file:str):
+        try:
+            st = os.stat(file)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def watch(self, file:str):
+        if file not in self.stamps:
+            self.stamps[file] = self.stamp(file)
+
+    def refresh(self):
+        """
+        Drop the state of every file that changed on disk, along with
+        everything that depends on it.
+        """
+        with self.lock:
+            for file in list(imports.dependencies):
+                self.watch(file)
+            changed = {file for file in self.stamps if self.stamp(file) != self.stamps[file]}
+            if not changed:
+                return
+            dependents = {}
+            for file in imports.dependencies:
+                for dep in imports.dependencies[file]:
+                    dependents.setdefault(dep, set()).add(file)
+            stale = set()
+            worklist = list(changed)
+            while worklist:
+                file = worklist.pop()
+                if file not in stale:
+                    stale.add(file)
+                    worklist.extend(dependents.get(file, ()))
+            for file in stale:
+                self.forget(file)
+            for file in changed:
+                self.stamps[file] = self.stamp(file)
+
+    def forget(self, file:str):
+        imports.import_type_cache.pop(file, None)
+        imports.deferred_modules.pop(file, None)
+        imports.dependencies.pop(file, None)
+        imports.import_cycles.discard(file)
+        importhook.import_cache.pop(file, None)
+        cache.interface_hashes.pop(file, None)
+        cache.interfaces.pop(file, None)
+
+    def forget_placeholders(self):
+        # A module whose typechecking was cut short by a static type
+        # error is left with a placeholder type
+        for file in [file for file in imports.import_type_cache \
+                     if not isinstance(imports.import_type_cache[file][0], retic_ast.Module)]:
+            self.forget(file)
+
+    def memo_key(self, file:str, src:bytes, optimize:bool):
+        return cache.source_key(file, src, optimize)
+
+    def cached_result(self, slot, key, command):
+        # Only the latest version of each file is kept
+        if slot not in self.results or self.results[slot][0] != key:
+            return None
+        _, deps, result = self.results[slot]
+        for dep in deps:
+            imports.get_imported_type(dep)
+            if cache.interface_hashes.get(dep) != deps[dep]:
+                return None
+        return result.get(command)
+
+    def process(self, file:str, command:str, optimize:bool):
+        with open(file, 'rb') as data:
+            src = data.read()
+        slot = file, optimize
+        key = self.memo_key(file, src, optimize)
+        result = self.cached_result(slot, key, command)
+        if result is not None:
+            return result
+
+        directory = os.path.dirname(file)
+        if directory not in sys.path:
+            sys.path.insert(1, directory)
+
+        deps = set()
+        out = io.StringIO()
+        imports.import_dependencies.append((file, deps))
+        try:
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+                with open(file, 'r') as data:
+                    st, srcdata = static.parse_module(data)
+                st = static.typecheck_module(st, srcdata, exit=False)
+                # Finish off imported modules, so that they are stored
+                # in the cache and can be restored cheaply after
+                # one of their own dependencies changes
+                while st is not None and imports.deferred_modules:
+                    imports.compile_deferred(next(iter(imports.deferred_modules)))
+                source = None
+                if st is not None and command == 'compile':
+                    st = static.transient_compile_module(st, optimize)
+                    srcout = io.StringIO()
+                    static.emit_module(st, file=srcout)
+                    source = srcout.getvalue()
+        except SystemExit:
+            st = None
+        finally:
+            imports.import_dependencies.pop()
+
+        for dep in deps:
+            self.watch(dep)
+        self.watch(file)
+        if st is None:
+            self.forget_placeholders()
+            return {'status': 'error', 'output': out.getvalue()}
+
+        result = {'status': 'ok', 'output': out.getvalue()}
+        if source is not None:
+            result['source'] = source
+        if all(dep in cache.interface_hashes for dep in deps):
+            hashes = {dep: cache.interface_hashes[dep] for dep in deps}
+            old = self.results.get(slot)
+            results = old[2] if old is not None and old[:2] == (key, hashes) else {}
+            results[command] = result
+            self.results[slot] = key, hashes, results
+        return result
+
+    def handle(self, request):
+        command = request.get('command')
+        with self.lock:
+            self.requests += 1
+            if command == 'status':
+                return {'status': 'ok', 'output': '{} modules loaded, {} requests served\n{}'.format(len(imports.import_type_cache), self.requests, NO_CACHE if flags.cache_dir() is None else '')}
+            elif command in ['check', 'compile']:
+                self.refresh()
+                try:
+                    return self.process(os.path.abspath(request['file']), command, request.get('optimize', True))
+                except (IOError, KeyError) as e:
+                    return {'status': 'error', 'output': '{}\n'.format(e)}
+            else:
+                return {'status': 'error', 'output': 'Unknown command {}\n'.format(command)}
+
+    def poll(self, stop):
+        while not stop.wait(POLL_INTERVAL):
+            self.refresh()
+
+def is_socket(path:str)->bool:
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+def serve(path:str):
+    # A socket left at path by an earlier daemon is replaced, but
+    # anything else there is an error rather than something to delete
+    if os.path.lexists(path) and not is_socket(path):
+        raise FileExistsError(errno.EEXIST, 'Not a socket', path)
+    if flags.cache_dir() is None:
+        print(NO_CACHE, end='')
+    daemon = Daemon()
+    stop = threading.Event()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                request = json.loads(self.rfile.readline().decode('utf-8'))
+            except ValueError:
+                response = {'status': 'error', 'output': 'Malformed request\n'}
+            else:
+                if request.get('command') == 'stop':
+                    stop.set()
+                    response = {'status': 'ok', 'output': ''}
+                else:
+                    response = daemon.handle(request)
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+    # The socket is bound before the server listens on it, so it's set
+    # up under a temporary name and only moved to path (replacing any
+    # old socket there) once clients can connect to it
+    temp = path + '.tmp'
+    if is_socket(temp):
+        os.unlink(temp)
+    server = socketserver.UnixStreamServer(temp, Handler)
+    os.replace(temp, path)
+    watcher = threading.Thread(target=daemon.poll, args=(stop,), daemon=True)
+    watcher.start()
+    server.timeout = POLL_INTERVAL
+    try:
+        while not stop.is_set():
+            server.handle_request()
+    finally:
+        stop.set()
+        server.server_close()
+        if is_socket(path):
+            os.unlink(path)
+
+def request(path:str, command:str, file:str=None, optimize:bool=True):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps({'command': command, 'file': file and os.path.abspath(file),
+                                 'optimize': optimize}).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as response:
+            return json.loads(response.readline().decode('utf-8'))
@@ -17,7 +17,9 @@ class StaticImportError(StaticTypeError): pass
 class UnimplementedException(Exception): pass
 class InternalReticulatedError(Exception): pass
 
-def handle_static_type_error(error:StaticTypeError, srcdata:{'filename':str, 'src':str}, exit=True, stream=sys.stderr):
+def handle_static_type_error(error:StaticTypeError, srcdata:{'filename':str, 'src':str}, exit=True, stream=None):
+    # sys.stderr is looked up at call time so that it can be redirected
+    stream = sys.stderr if stream is None else stream
     print('\nStatic type error:', file=stream)
     if error.node:
         print('  File "{}", line {}'.format(srcdata.filename, error.node.lineno), file=stream)
@@ -30,7 +32,8 @@ def handle_static_type_error(error:StaticTypeError, srcdata:{'filename':str, 'sr
     if exit:
         quit()
 
-def handle_malformed_type_error(error:MalformedTypeError, srcdata:{'filename':str, 'src':str}, exit=True, stream=sys.stderr):
+def handle_malformed_type_error(error:MalformedTypeError, srcdata:{'filename':str, 'src':str}, exit=True, stream=None):
+    stream = sys.stderr if stream is None else stream
     print('\nMalformed type annotation:', file=stream)
     if error.node:
         print('  File "{}", line {}'.format(srcdata.filename, error.node.lineno), file=stream)
@@ -1,11 +1,80 @@
-import sys
+import sys, os
 
 PY_VERSION = sys.version_info.major
 PY3_VERSION = sys.version_info.minor
-RETIC_VERSION = '0.1.0'
+RETIC_VERSION = '0.1.1'
+
+# Set to False (e.g. by retic --no-cache) to always recompile imported
+# modules instead of consulting the on-disk cache in cache.py.
+USE_CACHE = True
+
+# Set to True (e.g. by retic --check-stats) to report how many checks
+# the optimizer removed from each module.
+CHECK_STATS = False
+
+# Set to True (e.g. by retic --inline-checks) to compile checks into
+# inline isinstance tests instead of calls to the runtime check
+# functions (see opt_check_compiler.py).
+INLINE_CHECKS = False
+
+# Set to True (e.g. by retic --profile-checks) to compile checks so
+# that the runtime counts and times them by site, and reports the
+# hottest sites when the program exits (see opt_transient.py).
+PROFILE_CHECKS = False
+
+# Set to True (e.g. by retic --count-checks) to compile checks so that
+# the runtime counts their executions and failures by site, and
+# periodically writes the counts to a metrics file (see
+# opt_transient.py).
+COUNT_CHECKS = False
+
+# Set to True (e.g. by retic --check-levels) to compile modules so
+# that how much they check can be chosen when they start running,
+# through the RETIC_CHECK_LEVEL and RETIC_CHECK_LEVELS environment
+# variables (see opt_transient.py).
+CHECK_LEVELS = False
+
+# Set to True (e.g. by retic --optimize-imports) to also run the
+# trust-based optimizer on imported modules, which are optimized one at
+# a time, assuming that their exports are used by arbitrary code (see
+# passes.py).
+OPTIMIZE_IMPORTS = False
+
+# The number of processes (set by retic -j) that may be used to
+# typecheck imports and to solve the optimizer's constraints (see
+# parallel.py and trust/solve.py).
+JOBS = 1
+
+# Budgets for the optimizer's constraint solver (set by retic
+# --solve-time-budget, --solve-size-budget and --solve-round-budget):
+# the wall time in seconds for solving a module, and the number of
+# constraints and of solver rounds for each independent component of a
+# module's constraints. When a budget is exceeded, the checks that
+# depend on the unsolved part of the module are only optimized the way
+# check_optimizer.py does. None means no limit.
+SOLVE_TIME_BUDGET = None
+SOLVE_SIZE_BUDGET = None
+SOLVE_ROUND_BUDGET = None
 
 def strict_annotations():
     return False
 
 def optimized():
     return True
+
+def cache_dir():
+    # The RETIC_CACHE_DIR environment variable overrides the default
+    # location; setting it to the empty string disables caching.
+    if not USE_CACHE:
+        return None
+    dir = os.environ.get('RETIC_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'retic'))
+    return dir if dir else None
+
+# The flags above that change how a module is compiled. Anything that
+# stores compiled modules (cache.py, compile_tree.py) keys them on
+# these, and worker processes (parallel.py) are given their values.
+CODEGEN_FLAGS = ['INLINE_CHECKS', 'PROFILE_CHECKS', 'COUNT_CHECKS', 'CHECK_LEVELS', 'OPTIMIZE_IMPORTS',
+                 'SOLVE_TIME_BUDGET', 'SOLVE_SIZE_BUDGET', 'SOLVE_ROUND_BUDGET']
+
+def codegen_flags():
+    return [(name, globals()[name]) for name in CODEGEN_FLAGS]
@@ -56,8 +56,11 @@ def make_importer(typing_context):
                 return import_cache[srcfile]
                 
             from . import imports
-            assert srcfile not in imports.import_type_cache
+            # Modules that were only typechecked for their interfaces
+            # get their bodies checked and compiled now
             imports.get_imported_type(srcfile)
+            if srcfile not in import_cache:
+                imports.compile_deferred(srcfile)
             return import_cache[srcfile]
 
 
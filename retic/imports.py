@@ -1,4 +1,4 @@
-from . import visitors, exc, typing, retic_ast, importhook, flags
+from . import visitors, exc, typing, retic_ast, importhook, flags, cache
 import os.path, sys, ast
 
 
@@ -59,27 +59,102 @@ HOSTILE_IMPORTS = (['clock', 'sys', 'random'] + # TEMPORARY
                    )
 import_type_cache = {}
 
+# Modules whose interfaces have been computed by get_imported_type
+# but whose bodies have not yet been typechecked and compiled. Maps
+# files to (source, ast, srcdata, dependencies) tuples, whose ast and
+# srcdata are None if the module still has to be parsed; entries are
+# consumed by compile_deferred when the module is actually executed.
+deferred_modules = {}
+
+# One (file, dependencies) pair per module currently being processed
+# by get_imported_type or compile_deferred. The dependencies are the
+# files the module imports, whose interfaces key the module's entry in
+# cache.py.
+import_dependencies = []
+
+# Maps every module processed by get_imported_type to the set of
+# files it imports (including, once it has been compiled, imports in
+# function bodies).
+dependencies = {}
+
+# Files whose interfaces are still being computed, and files that
+# (transitively) imported one of them while it was in progress. The
+# latter saw a placeholder type for part of an import cycle and are
+# never cached.
+interfaces_in_progress = set()
+import_cycles = set()
+
 def get_imported_type(file):
+    """
+    Returns the type and the aliases exported by the module at
+    file. Only the module's interface is computed here; checking and
+    compiling its function bodies is deferred until it is executed
+    (see compile_deferred).
+    """
     from . import static
+    if file is not None and import_dependencies:
+        import_dependencies[-1][1].add(file)
     if file is None:
         return retic_ast.Dyn(), {}
     elif file in import_type_cache:
+        if file in interfaces_in_progress:
+            import_cycles.update(mod for mod, _ in import_dependencies)
         return import_type_cache[file]
     else:
-        with open(file, 'r') as data:
-            st, srcdata = static.parse_module(data)
-        
+        with open(file, 'rb') as data:
+            raw = data.read()
+
         # Put a placeholder type here to prevent divergence
         import_type_cache[file] = retic_ast.Dyn(), {}
-        st = static.typecheck_module(st, srcdata)
-        import_type_cache[file] = st.retic_type, st.retic_aliases
+        interfaces_in_progress.add(file)
+        deps = dependencies[file] = set()
+        import_dependencies.append((file, deps))
+        try:
+            cached = cache.load(file, raw, flags.OPTIMIZE_IMPORTS)
+            if cached is not None:
+                ty, aliases, code = cached
+                import_type_cache[file] = ty, aliases
+                importhook.import_cache[file] = code
+                return ty, aliases
+            
+            with open(file, 'r') as data:
+                st, srcdata = static.parse_module(data)
+            st = static.typecheck_interface(st, srcdata)
+            import_type_cache[file] = st.retic_type, st.retic_aliases
+            deferred_modules[file] = raw, st, srcdata, deps
+        finally:
+            import_dependencies.pop()
+            interfaces_in_progress.discard(file)
+
+        if file not in import_cycles:
+            cache.record_interface(file, st.retic_type, st.retic_aliases, deps)
+        return st.retic_type, st.retic_aliases
+
+def compile_deferred(file):
+    """
+    Fully typechecks and compiles a module whose interface was
+    computed by get_imported_type, storing the resulting code in
+    importhook.import_cache.
+    """
+    from . import static
+    raw, st, srcdata, deps = deferred_modules.pop(file)
+    if st is None:
+        # The interface was computed by another process (see
+        # parallel.py)
+        with open(file, 'r') as data:
+            st, srcdata = static.parse_module(data)
+    import_dependencies.append((file, deps))
+    try:
         st = static.typecheck_module(st, srcdata)
         compile_file(st, srcdata, file)
-        return st.retic_type, st.retic_aliases
+    finally:
+        import_dependencies.pop()
+    if file not in import_cycles:
+        cache.store(file, raw, deps, importhook.import_cache[file], flags.OPTIMIZE_IMPORTS)
             
 def compile_file(st, srcdata, file):
     from . import static
-    st = static.transient_compile_module(st, False)
+    st = static.transient_compile_module(st, flags.OPTIMIZE_IMPORTS, library=True)
     code = compile(st, srcdata.filename, 'exec')
     importhook.import_cache[file] = code
 
@@ -114,6 +189,13 @@ class ImportProcessor(visitors.InPlaceVisitor):
             body = self.dispatch_statements(n.body, path, srcdata)
         else: body = self.empty_stmt()
         return self.combine_stmt_expr(body, self.combine_expr(largs, decorator))
+
+class InterfaceImportProcessor(ImportProcessor):
+    # Used when only the interface of a module is needed: imports
+    # inside of functions are not visible from outside the module, so
+    # they are left for the full ImportProcessor pass.
+    def visitFunctionDef(self, n, *args):
+        pass
         
 
 # Finds the names of modules that will be imported (or have members
@@ -436,3 +518,16 @@ class ExportFinder(visitors.DictGatheringVisitor):
 
     def visitImportFrom(self, n):
         return n.retic_env
+
+class InterfaceExportFinder(ExportFinder):
+    # Like ExportFinder, but reads the types of variables from the
+    # module's scope rather than from a typechecked AST, for use by
+    # static.typecheck_interface.
+    def __init__(self, env):
+        super().__init__()
+        self.env = env
+
+    def visitName(self, n: ast.Name)->typing.Set[ast.expr]:
+        if isinstance(n.ctx, ast.Store):
+            return { n.id: self.env[n.id] }
+        else: return {}
@@ -0,0 +1,279 @@
+## Hoisting of loop-invariant transient checks.
+##
+## A check inside a while or for loop is executed on every iteration,
+## even when what it checks -- a variable, or an attribute x.attr of
+## one -- can't change while the loop runs. InvariantCheckHoister
+## moves such checks into a pre-header in front of the loop, and drops
+## every check of the same path against the same type from the loop's
+## test and body.
+##
+## Moving a check must not make it fail where the original program
+## didn't, so a check is only hoisted if it is anticipated: the first
+## iteration is certain to reach it, having done nothing observable
+## beforehand besides binding variables and other checks. The scan
+## for anticipated checks therefore stops at the first break,
+## continue, return, raise, try, call, or any other statement or
+## operation that may run code we can't see or leave the iteration.
+## Checks in the pre-header are guarded by the loop's own condition:
+## for while loops the test is evaluated once more, which is only done
+## when it's free of side effects, and for loops must iterate over a
+## builtin collection or a range, whose truth value says whether the
+## loop will run at all. A loop's else clause and any checks inside
+## nested functions are left alone. If the first iteration would have
+## failed before reaching a hoisted check anyway, the error reported
+## may be the check's.
+##
+## A check is invariant if its path isn't bound anywhere in the loop,
+## and, for attribute paths and variables that other code can rebind
+## (globals, nonlocals), if nothing in the loop may run code we can't
+## see. See redundant_checks.py for those definitions.
+
+from . import copy_visitor, retic_ast
+from .check_optimizer import Tombstone
+from .redundant_checks import stable, type_of, path, effects, local_names, runs_code
+import ast
+
+ITERABLE = (retic_ast.Str, retic_ast.List, retic_ast.Set, retic_ast.Dict, retic_ast.Tuple, retic_ast.HTuple)
+
+def constant_true(n)->bool:
+    return (isinstance(n, ast.NameConstant) and n.value is True) or \
+        (isinstance(n, ast.Num) and bool(n.n))
+
+def scan(n, found)->bool:
+    """
+    Add the checks that evaluating n is certain to reach to found, in
+    evaluation order, and return whether evaluation continues quietly
+    past n.
+    """
+    if isinstance(n, list):
+        return all(scan(s, found) for s in n)
+    elif isinstance(n, (ast.Num, ast.Str, ast.Bytes, ast.NameConstant, ast.Ellipsis)):
+        return True
+    elif isinstance(n, ast.Name):
+        return True
+    elif isinstance(n, (retic_ast.Check, retic_ast.ProtCheck)):
+        if scan(n.value, found) and stable(n.type):
+            found.append(n)
+            return True
+        else: return False
+    elif isinstance(n, ast.Attribute):
+        return isinstance(n.ctx, ast.Load) and scan(n.value, found) and not runs_code(n)
+    elif isinstance(n, ast.Subscript):
+        return scan(n.value, found) and scan(n.slice, found) and not runs_code(n)
+    elif isinstance(n, ast.Index):
+        return scan(n.value, found)
+    elif isinstance(n, ast.Slice):
+        return all(scan(bound, found) for bound in [n.lower, n.upper, n.step] if bound)
+    elif isinstance(n, ast.BinOp):
+        return scan(n.left, found) and scan(n.right, found) and not runs_code(n)
+    elif isinstance(n, ast.UnaryOp):
+        return scan(n.operand, found) and not runs_code(n)
+    elif isinstance(n, ast.Compare):
+        # Later comparisons in a chain may be skipped
+        return len(n.ops) == 1 and scan(n.left, found) and scan(n.comparators[0], found) and \
+            (isinstance(n.ops[0], (ast.Is, ast.IsNot)) or not runs_code(n))
+    elif isinstance(n, ast.BoolOp):
+        # Only the first operand is certain to be evaluated
+        scan(n.values[0], found)
+        return False
+    elif isinstance(n, ast.IfExp):
+        scan(n.test, found)
+        return False
+    elif isinstance(n, (ast.Tuple, ast.List)):
+        return all(scan(elt, found) if isinstance(n.ctx, ast.Load) else target(elt) for elt in n.elts)
+    elif isinstance(n, ast.Starred):
+        return target(n.value)
+    elif isinstance(n, ast.Expr):
+        return scan(n.value, found)
+    elif isinstance(n, ast.Assign):
+        return scan(n.value, found) and all(target(t) for t in n.targets)
+    elif isinstance(n, ast.AugAssign):
+        return isinstance(n.target, ast.Name) and scan(n.value, found) and not runs_code(n)
+    elif isinstance(n, ast.Pass):
+        return True
+    elif isinstance(n, retic_ast.ExpandSeq):
+        return scan(n.body, found)
+    elif isinstance(n, ast.If):
+        scan(n.test, found)
+        return False
+    else: return False
+
+def target(n)->bool:
+    # Binding variables is the only kind of assignment we move checks
+    # in front of
+    if isinstance(n, ast.Name):
+        return True
+    elif isinstance(n, (ast.Tuple, ast.List)):
+        return all(target(elt) for elt in n.elts)
+    elif isinstance(n, ast.Starred):
+        return target(n.value)
+    else: return False
+
+def copy_path(n):
+    if isinstance(n, ast.Name):
+        ret = ast.Name(id=n.id, ctx=ast.Load(), lineno=n.lineno, col_offset=n.col_offset)
+    else:
+        ret = ast.Attribute(value=copy_path(n.value), attr=n.attr, ctx=ast.Load(),
+                            lineno=n.lineno, col_offset=n.col_offset)
+    if hasattr(n, 'retic_type'):
+        ret.retic_type = n.retic_type
+    return ret
+
+def check_of(n):
+    return n.__class__(value=copy_path(n.value), type=n.type, lineno=n.lineno, col_offset=n.col_offset)
+
+class CheckDropper(copy_visitor.CopyVisitor):
+    # Removes the checks of the given (path, type) pairs, outside of
+    # nested functions, which might run after the loop is done
+
+    def __init__(self, checked):
+        super().__init__()
+        self.checked = checked
+
+    def statements(self, ns, lst):
+        lst = [l for l in lst if not isinstance(l, Tombstone)]
+        return lst if lst or not ns else [ast.Pass()]
+
+    def dispatch_statements(self, ns, *args):
+        if not hasattr(self, 'visitor'):
+            self.visitor = self
+        return self.statements(ns, [self.dispatch(s, *args) for s in ns])
+
+    def visitCheck(self, n, *args):
+        val = self.dispatch(n.value, *args)
+        if (path(val), n.type) in self.checked:
+            return val
+        return n.__class__(value=val, type=n.type, lineno=n.lineno, col_offset=n.col_offset)
+
+    def visitProtCheck(self, n, *args):
+        return self.visitCheck(n, *args)
+
+    def visitExpr(self, n, *args):
+        val = self.dispatch(n.value, *args)
+        if isinstance(n.value, (retic_ast.Check, retic_ast.ProtCheck)) and \
+           not isinstance(val, (retic_ast.Check, retic_ast.ProtCheck)):
+            return Tombstone()
+        else:
+            return ast.Expr(value=val, lineno=n.lineno)
+
+    def visitLambda(self, n, *args):
+        return n
+
+class InvariantCheckHoister(copy_visitor.CopyVisitor):
+    examine_functions = True
+
+    def preorder(self, tree, *args):
+        self.locals = set()
+        self.temps = 0
+        self.shadowed = effects(tree.body)[0] if isinstance(tree, ast.Module) else {'range'}
+        return super().preorder(tree, *args)
+
+    def visitFunctionDef(self, n, *args):
+        saved = self.locals
+        self.locals = local_names(n)
+        try:
+            return super().visitFunctionDef(n, *args)
+        finally:
+            self.locals = saved
+
+    def visitClassDef(self, n, *args):
+        saved = self.locals
+        self.locals = set()
+        try:
+            return super().visitClassDef(n, *args)
+        finally:
+            self.locals = saved
+
+    def invariant(self, checks, ns, code):
+        """
+        The (path, type) pairs of the given checks whose outcome can't
+        change while executing ns.
+        """
+        names, runs = effects(ns)
+        invariant = []
+        for check in checks:
+            p = path(check.value)
+            if p is None or p[0] in names or (p, check.type) in invariant:
+                continue
+            if (code or runs) and not (len(p) == 1 and p[0] in self.locals):
+                continue
+            invariant.append((p, check.type))
+        return invariant
+
+    def preheader(self, checks, checked, done):
+        # One check for each checked pair that isn't done yet, copied
+        # from the first check of it
+        pre = []
+        for check in checks:
+            key = path(check.value), check.type
+            if key in checked and key not in done:
+                done.append(key)
+                pre.append(ast.Expr(value=check_of(check), lineno=check.lineno, col_offset=check.col_offset))
+        return pre
+
+    def guarded(self, test, body, n):
+        if not body:
+            return []
+        elif test is None:
+            return body
+        else: return [ast.If(test=test, body=body, orelse=[], lineno=n.lineno, col_offset=n.col_offset)]
+
+    def visitWhile(self, n, *args):
+        orig = n
+        n = super().visitWhile(n, *args)
+        tested = []
+        if not scan(n.test, tested):
+            return n
+        found = tested[:]
+        scan(n.body, found)
+        checked = self.invariant(found, [n.test] + n.body, False)
+        if not checked:
+            return n
+
+        dropper = CheckDropper(checked)
+        test = dropper.preorder(n.test)
+        body = dropper.dispatch_statements(n.body)
+        # Checks in the test run even if the loop body never does
+        done = []
+        pre = self.preheader(tested, checked, done)
+        inner = self.preheader(found, checked, done)
+        guard = None if constant_true(test) else dropper.preorder(n.test)
+        loop = ast.While(test=test, body=body, orelse=n.orelse, lineno=orig.lineno, col_offset=orig.col_offset)
+        return retic_ast.ExpandSeq(body=pre + self.guarded(guard, inner, orig) + [loop],
+                                   lineno=orig.lineno, col_offset=orig.col_offset)
+
+    def is_range(self, n):
+        return isinstance(n, ast.Call) and isinstance(n.func, ast.Name) and n.func.id == 'range' and \
+            'range' not in self.shadowed
+
+    def visitFor(self, n, *args):
+        orig = n
+        n = super().visitFor(n, *args)
+        iterable = isinstance(type_of(n.iter), ITERABLE) or self.is_range(n.iter)
+        found = []
+        if not iterable or not target(n.target):
+            return n
+        scan(n.body, found)
+        checked = self.invariant(found, [n.target] + n.body, False)
+        if not checked:
+            return n
+
+        body = CheckDropper(checked).dispatch_statements(n.body)
+        if isinstance(n.iter, ast.Name):
+            pre = []
+            iter = n.iter
+        else:
+            # The iterable is evaluated in front of the loop, where it
+            # would have been evaluated anyway, so that the guard can
+            # look at it
+            self.temps += 1
+            name = '__retic_iter_{}__'.format(self.temps)
+            pre = [ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store(), lineno=orig.lineno, col_offset=orig.col_offset)],
+                              value=n.iter, lineno=orig.lineno, col_offset=orig.col_offset)]
+            iter = ast.Name(id=name, ctx=ast.Load(), lineno=orig.lineno, col_offset=orig.col_offset)
+            iter.retic_type = getattr(n.iter, 'retic_type', retic_ast.Dyn())
+        guard = copy_path(iter)
+        loop = ast.For(target=n.target, iter=iter, body=body, orelse=n.orelse,
+                       lineno=orig.lineno, col_offset=orig.col_offset)
+        return retic_ast.ExpandSeq(body=pre + self.guarded(guard, self.preheader(found, checked, []), orig) + [loop],
+                                   lineno=orig.lineno, col_offset=orig.col_offset)
@@ -12,5 +12,5 @@ class MacroExpander(copy_visitor.CopyVisitor):
             if n.func.id == '__typeof':
                 return ast.Str(s=str(n.args[0].retic_type))
             else:
-                return super().visitCall(n)
-        else: return super().visitCall(n)
+                return super().visitCall(n, *args)
+        else: return super().visitCall(n, *args)
@@ -28,7 +28,13 @@ def __retic_cast_module__(val, src, trg, line, col):
 
 def __retic_cast_class__(val, src, trg, line, col, ty):
     add_cast(val, src, trg, line, col)
-    return val if ty in getattr(val, 'mro', lambda: [])() else error('Value {} is not a subtype of {}'.format(val, ty))
+    try:
+        if isinstance(val, type) and issubclass(val, ty):
+            return val
+    except TypeError:
+        # ty isn't a class
+        pass
+    return error('Value {} is not a subtype of {}'.format(val, ty))
 
 def __retic_cast_union__(val, src, trg, line, col, alts):
     add_cast(val, src, trg, line, col)
@@ -151,7 +157,13 @@ def __retic_blame_check_class__(val, resp, tag, ty):
             val.__retic_pointers__ = { resp: tag }
         except AttributeError:
             pass
-    return val if ty in getattr(val, 'mro', lambda: [])() else blame(val, resp, tag, 'Value {} is not a subtype of {}'.format(val, ty))
+    try:
+        if isinstance(val, type) and issubclass(val, ty):
+            return val
+    except TypeError:
+        # ty isn't a class
+        pass
+    return blame(val, resp, tag, 'Value {} is not a subtype of {}'.format(val, ty))
 
 def __retic_blame_check_union__(val, resp, tag, alts):
     if hasattr(val, '__retic_pointers__'): 
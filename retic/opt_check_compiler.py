@@ -2,15 +2,495 @@
 ## transient checks, where they're represented with the
 ## retic_ast.Check node, into a regular Python representation that can
 ## be outputted or executed.
+##
+## With flags.INLINE_CHECKS, checks against primitive, collection,
+## tuple, instance and class types are instead compiled into conditional
+## expressions such as
+##
+##   (x if __retic_isinstance__(x, __retic_int__) else __retic_check_int__(x))
+##
+## which only call the runtime check function, and through it
+## __retic_error__, when the check fails. The checked value must only
+## be evaluated once, so this is only done when it is a variable or a
+## constant; checks of other expressions are still calls. The names
+## used to refer to builtins are aliases defined in opt_transient, so
+## that checks are unaffected by programs shadowing the builtins.
+##
+## The checks of a function's arguments at the start of its body are
+## compiled the same way, whether or not checks are otherwise inlined,
+## but into a single test
+##
+##   if not (__retic_isinstance__(x, __retic_int__) and ...):
+##       __retic_check_int__(x)
+##       ...
+##
+## so that calls whose arguments are all well-typed do one branch
+## instead of a call per argument.
+##
+## Checks against a union type call a predicate that is defined once
+## per distinct union, at the top of the module. It tests the value
+## against its primitive, collection and instance alternatives with a
+## single isinstance, then against the tuple, None, structural and
+## callable ones, and leaves any alternatives it can't test, and the
+## error message, to the generic __retic_check_union__. Unions with
+## class alternatives, or with instances of classes that might not be
+## bound at module level, are checked generically.
+##
+## With flags.PROFILE_CHECKS or flags.COUNT_CHECKS, none of the above
+## is done: each check is instead compiled into a call to
+## __retic_profile_check__ that passes the site of the check along with
+## its runtime check function, or to __retic_count_check__, which is
+## passed the id of the site in a table that the module registers with
+## the runtime when it starts.
+##
+## Every global name that compiled checks refer to -- the runtime
+## functions and aliases above, and the classes that instance and
+## class checks test against -- goes through CheckCompiler.reference.
+## When a function refers to one of them more than once, or from
+## within a loop, it is bound to a local variable at the start of the
+## function, so that each check loads it with LOAD_FAST. This is only
+## done for classes whose path starts with a name bound once in the
+## module, by a top-level class definition or import that comes before
+## the function (or encloses it), so the binding holds the same object
+## the check would have looked up. Classes nested in other classes
+## are additionally resolved once, into a module-level variable,
+## right after the definition of the outermost class.
+##
+## With flags.CHECK_LEVELS, modules start by calling
+## __retic_select_checks__, which lets the runtime rebind the check
+## functions in the module's namespace according to the check level
+## chosen for it when it is run (see opt_transient). Checks at the
+## module's boundaries -- those of the arguments of its exported
+## functions and methods, and of values read from, or returned by
+## functions of, imported modules -- instead call the check functions
+## through __retic_checks__, which is only rebound when checks are
+## turned off. Checks are then neither inlined nor fused, and unions
+## are checked generically, so that every check goes through a check
+## function that can be rebound.
+##
+## Module-level functions that are bound once and have argument checks
+## get a second, unchecked entry point: a copy of the function without
+## those checks (or default arguments), defined in front of it and
+## bound to __retic_unchecked_f__. Calls from within the module that
+## pass every argument positionally call it directly when each
+## argument is statically known to pass the check of its parameter:
+## a literal, a value that has just been checked, a local variable
+## (which transient checks guard when they're bound), or a builtin
+## operation on those. Like the caches of classes, this assumes that
+## other modules don't rebind the function.
 
-from . import copy_visitor, retic_ast, ast_trans, exc
-import ast
+from . import copy_visitor, retic_ast, ast_trans, exc, flags
+from .redundant_checks import binds, children, type_of, builtin, local_names
+import ast, copy
 
 check_function = '__retic_check__'
 
+# The parameter of the predicates defined for union types
+inline_temporary = '__retic_v__'
+
+INLINE_CLASSES = {
+    retic_ast.Int: '__retic_int__',
+    retic_ast.SingletonInt: '__retic_int__',
+    retic_ast.Float: '__retic_float__',
+    retic_ast.Complex: '__retic_complex__',
+    retic_ast.Str: '__retic_str__',
+    retic_ast.Bool: '__retic_bool__',
+    retic_ast.Set: '__retic_set__',
+    retic_ast.List: '__retic_list__',
+    retic_ast.Dict: '__retic_dict__',
+    retic_ast.HTuple: '__retic_tuple__',
+    retic_ast.Tuple: '__retic_tuple__',
+}
+
+def get_type(ty):
+    if isinstance(ty, retic_ast.OutputAlias) or isinstance(ty, retic_ast.ClassOutputAlias):
+        return ty.underlying
+    else: return ty
+
+def class_path(ty)->str:
+    if isinstance(ty, (retic_ast.OutputAlias, retic_ast.ClassOutputAlias)):
+        return ty.path
+    elif isinstance(ty, retic_ast.Instance):
+        return ty.instanceof.name
+    else: return ty.name
+
+def path_ast(path:str, lineno:int, col_offset:int)->ast.expr:
+    path = path.split('.')
+    st = ast.Name(id=path[0], ctx=ast.Load(), lineno=lineno, col_offset=col_offset)
+    for elt in path[1:]:
+        st = ast.Attribute(value=st, attr=elt, ctx=ast.Load(), lineno=lineno, col_offset=col_offset)
+    return st
+
+def cached_class(path:str)->str:
+    return '__retic_class_{}__'.format(path.replace('.', '_'))
+
+def fast_local(path:str)->str:
+    return '__retic_fast_{}__'.format(path.strip('_').replace('.', '_'))
+
+def unchecked(name:str)->str:
+    return '__retic_unchecked_{}__'.format(name)
+
+def binding_counts(body):
+    # How many times each name is bound anywhere in a module, or None
+    # if it has a star import
+    counts = {}
+    worklist = list(body)
+    while worklist:
+        n = worklist.pop()
+        for name in binds(n) | ({n.arg} if isinstance(n, ast.arg) else set()):
+            counts[name] = counts.get(name, 0) + 1
+        worklist.extend(children(n))
+    return None if '*' in counts else counts
+
+def stable_roots(body):
+    """
+    The names that are bound exactly once in a module, by one of its
+    top-level class definitions or imports, mapped to the index of
+    that statement and whether it is a class definition.
+    """
+    counts = binding_counts(body)
+    if counts is None:
+        return {}
+    roots = {}
+    for i, s in enumerate(body):
+        if isinstance(s, ast.ClassDef):
+            defined = binds(s)
+        elif isinstance(s, (ast.Import, ast.ImportFrom)):
+            defined = set().union(*[binds(alias) for alias in s.names])
+        else: continue
+        for name in defined:
+            if counts[name] == 1:
+                roots[name] = i, isinstance(s, ast.ClassDef)
+    return roots
+
+def dual_entries(body):
+    """
+    The module-level functions that can get an unchecked entry point,
+    mapped to the index of their definition, their number of
+    parameters, and the checks of their parameters by position.
+    """
+    counts = binding_counts(body)
+    if counts is None:
+        return {}
+    entries = {}
+    for i, s in enumerate(body):
+        if not isinstance(s, ast.FunctionDef) or counts[s.name] != 1 or s.decorator_list or \
+           s.args.vararg or s.args.kwonlyargs or s.args.kwarg:
+            continue
+        params = [arg.arg for arg in s.args.args]
+        checks = {}
+        for p in s.body:
+            if not protector(p) or p.value.value.id not in params:
+                break
+            checks[params.index(p.value.value.id)] = p.value
+        if checks:
+            entries[s.name] = i, len(params), checks
+    return entries
+
+def implies(ty, other)->bool:
+    # Whether every value of static type ty passes checks against other
+    ty, other = get_type(ty), get_type(other)
+    if isinstance(other, retic_ast.Dyn):
+        return True
+    elif ty is None or isinstance(ty, (retic_ast.Dyn, retic_ast.Bot)):
+        return False
+    elif isinstance(other, retic_ast.Int):
+        return isinstance(ty, (retic_ast.Int, retic_ast.SingletonInt, retic_ast.Bool))
+    elif isinstance(other, retic_ast.Float):
+        return isinstance(ty, (retic_ast.Float, retic_ast.Int, retic_ast.SingletonInt, retic_ast.Bool))
+    elif isinstance(other, retic_ast.Complex):
+        return isinstance(ty, (retic_ast.Complex, retic_ast.Float, retic_ast.Int, retic_ast.SingletonInt, retic_ast.Bool))
+    elif isinstance(other, retic_ast.Function):
+        return isinstance(ty, retic_ast.Function)
+    else: return ty == other
+
+def trusted(n, locals)->bool:
+    # Whether the value of n is certain to have its static type
+    if isinstance(n, (retic_ast.Check, retic_ast.ProtCheck, ast.Num, ast.Str, ast.Bytes, ast.NameConstant,
+                      ast.List, ast.Tuple, ast.Set, ast.Dict, ast.ListComp, ast.SetComp, ast.DictComp,
+                      ast.GeneratorExp, ast.Lambda)):
+        return True
+    elif isinstance(n, ast.Name):
+        return n.id in locals
+    elif isinstance(n, (ast.Call, ast.Attribute, ast.Subscript)):
+        # Their checks are only left out when they're unnecessary
+        return True
+    elif isinstance(n, ast.BinOp):
+        return trusted(n.left, locals) and trusted(n.right, locals) and builtin(n.left, n.right)
+    elif isinstance(n, ast.UnaryOp):
+        return trusted(n.operand, locals) and builtin(n.operand)
+    else: return False
+
+def inlinable(ty)->bool:
+    return type(ty) in INLINE_CLASSES or isinstance(ty, (retic_ast.Void, retic_ast.Instance, retic_ast.Class))
+
+def protector(s)->bool:
+    # The argument protectors CheckInserter puts at the start of
+    # function bodies (which check_optimizer may have turned into
+    # Checks)
+    return isinstance(s, ast.Expr) and isinstance(s.value, (retic_ast.Check, retic_ast.ProtCheck)) and \
+        isinstance(s.value.value, ast.Name)
+
+class Renamer(ast.NodeTransformer):
+    # Replaces the given nodes (by identity) with local variables
+    def __init__(self, locals):
+        self.locals = locals
+
+    def visit(self, node):
+        if id(node) in self.locals:
+            return ast.copy_location(ast.Name(id=self.locals[id(node)], ctx=ast.Load()), node)
+        return super().visit(node)
+
 class CheckCompiler(copy_visitor.CopyVisitor):
     examine_functions = True
 
+    # self.references maps the paths of the globals referred to by
+    # checks in the current function (None outside of functions) to
+    # the nodes referring to them, and self.weights to how often
+    # they're likely to be used per call. self.caches holds the paths
+    # of nested classes that get module-level variables, by the index
+    # of the statement defining their outermost class. self.unions
+    # holds the Union types that have predicates, with their
+    # definitions. self.entries holds the functions that can get
+    # unchecked entry points (see dual_entries), and self.called the
+    # ones that calls were compiled to use. self.locals holds the
+    # local variables of the current function.
+    references = None
+    locals = frozenset()
+
+    # Whether an assignment expression can bind the inline temporary
+    # where we are: they aren't allowed within comprehensions
+    temporaries = True
+
+    # Whether the checks being compiled are at the module's boundary,
+    # and whether we're in a scope whose functions the module exports
+    boundary = False
+    exporting = True
+
+    def preorder(self, tree, *args):
+        self.references, self.weights, self.loops = None, {}, 0
+        self.roots, self.statement, self.caches = {}, 0, {}
+        self.referred = {}
+        self.unions = []
+        self.sites = []
+        self.imported = set()
+        self.entries, self.called = {}, []
+        return super().preorder(tree, *args)
+
+    def stable(self, root:str)->bool:
+        if root not in self.roots:
+            return False
+        i = self.roots[root][0]
+        return i < self.statement or (i == self.statement and self.references is not None)
+
+    def reference(self, path:str, lineno:int, col_offset:int, weight:int=1)->ast.expr:
+        root = path.split('.')[0]
+        if '.' in path and self.stable(root) and self.roots[root][1]:
+            self.caches.setdefault(self.roots[root][0], [])
+            if path not in self.caches[self.roots[root][0]]:
+                self.caches[self.roots[root][0]].append(path)
+            path = cached_class(path)
+        node = path_ast(path, lineno, col_offset)
+        if self.references is not None and (path.startswith('__retic_') or self.stable(root)):
+            self.references.setdefault(path, []).append(node)
+            self.weights[path] = self.weights.get(path, 0) + weight * (2 if self.loops else 1)
+            self.referred[id(node)] = path
+        return node
+
+    def again(self, node:ast.expr)->ast.expr:
+        # Another reference to the same thing as node, which isn't
+        # counted as a use
+        if id(node) in self.referred:
+            return self.reference(self.referred[id(node)], node.lineno, node.col_offset, weight=0)
+        else: return copy.deepcopy(node)
+
+    def visitModule(self, n, *args):
+        self.roots = stable_roots(n.body)
+        self.entries = dual_entries(n.body)
+        for s in n.body:
+            if isinstance(s, (ast.Import, ast.ImportFrom)):
+                self.imported |= set().union(*[binds(alias) for alias in s.names])
+        body = []
+        ends = []
+        for i, s in enumerate(n.body):
+            self.statement = i
+            body += self.dispatch_scope([s], *args)
+            ends.append(len(body))
+        # Compiling an unchecked entry point may make calls to other ones
+        variants = {}
+        for name in self.called:
+            i = self.entries[name][0]
+            self.statement = i
+            variants[i] = self.unchecked_entry(n.body[i], *args)
+        for i in reversed(range(len(n.body))):
+            s = n.body[i]
+            body[ends[i]:ends[i]] = [ast.Assign(targets=[ast.Name(id=cached_class(path), ctx=ast.Store(), lineno=s.lineno, col_offset=s.col_offset)],
+                                                value=path_ast(path, s.lineno, s.col_offset), lineno=s.lineno, col_offset=s.col_offset) \
+                                     for path in self.caches.get(i, [])]
+            if i in variants:
+                start = ends[i - 1] if i else 0
+                body[start:start] = variants[i]
+        # Predicates go after the docstring and future imports
+        ins = 0
+        while ins < len(body) and ((isinstance(body[ins], ast.ImportFrom) and body[ins].module == '__future__') or \
+                                   (isinstance(body[ins], ast.Expr) and isinstance(body[ins].value, ast.Str))):
+            ins += 1
+        body[ins:ins] = [pred for _, pred in self.unions]
+        if self.sites:
+            body[ins:ins] = [self.site_table()]
+        if flags.CHECK_LEVELS:
+            body[ins:ins] = [self.select_checks()]
+        return ast.Module(body=body)
+
+    def select_checks(self):
+        # __retic_select_checks__(__name__, __retic_globals__())
+        def call(fn, *args):
+            return ast_trans.Call(func=ast.Name(id=fn, ctx=ast.Load(), lineno=1, col_offset=0), args=list(args), keywords=[],
+                                  starargs=None, kwargs=None, lineno=1, col_offset=0)
+        return ast.Expr(value=call('__retic_select_checks__', ast.Name(id='__name__', ctx=ast.Load(), lineno=1, col_offset=0),
+                                   call('__retic_globals__')),
+                        lineno=1, col_offset=0)
+
+    def site_table(self):
+        # __retic_executions__, __retic_failures__ = __retic_register_sites__(__name__, ((line, col, type), ...))
+        def name(id, ctx=ast.Load):
+            return ast.Name(id=id, ctx=ctx(), lineno=1, col_offset=0)
+        sites = ast.Tuple(elts=[ast.Tuple(elts=[ast.Num(n=line, lineno=1, col_offset=0), ast.Num(n=col, lineno=1, col_offset=0),
+                                                ast.Str(s=ty, lineno=1, col_offset=0)], ctx=ast.Load(), lineno=1, col_offset=0)
+                                for line, col, ty in self.sites], ctx=ast.Load(), lineno=1, col_offset=0)
+        return ast.Assign(targets=[ast.Tuple(elts=[name('__retic_executions__', ast.Store), name('__retic_failures__', ast.Store)],
+                                             ctx=ast.Store(), lineno=1, col_offset=0)],
+                          value=ast_trans.Call(func=name('__retic_register_sites__'), args=[name('__name__'), sites], keywords=[],
+                                               starargs=None, kwargs=None, lineno=1, col_offset=0),
+                          lineno=1, col_offset=0)
+
+    def visitFunctionDef(self, n, *args):
+        # Default arguments and decorators are evaluated outside of
+        # the function
+        fargs = self.dispatch(n.args, *args)
+        decorator_list = [self.dispatch(dec, *args) for dec in n.decorator_list]
+        saved = self.references, self.weights, self.loops, self.exporting, self.locals
+        self.references, self.weights, self.loops, self.locals = {}, {}, 0, local_names(n)
+        try:
+            count = 0
+            while count < len(n.body) and protector(n.body[count]):
+                count += 1
+            self.boundary = self.exporting and (not n.name.startswith('_') or n.name.endswith('__'))
+            try:
+                protected = self.protect(n.body[:count], n.lineno, n.col_offset, *args)
+            finally:
+                self.boundary = False
+            self.exporting = False
+            body = protected + self.dispatch_scope(n.body[count:], *args)
+            hot = [path for path in self.references if self.weights[path] > 1]
+            if hot:
+                renamed = {id(node): fast_local(path) for path in hot for node in self.references[path]}
+                body = [Renamer(renamed).visit(s) for s in body]
+                prologue = [ast.Assign(targets=[ast.Name(id=fast_local(path), ctx=ast.Store(), lineno=n.lineno, col_offset=n.col_offset)],
+                                       value=path_ast(path, n.lineno, n.col_offset), lineno=n.lineno, col_offset=n.col_offset) \
+                            for path in hot]
+                docstring = 1 if isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Str) else 0
+                body = body[:docstring] + prologue + body[docstring:]
+        finally:
+            self.references, self.weights, self.loops, self.exporting, self.locals = saved
+        return ast.FunctionDef(name=n.name, args=fargs,
+                               body=body, decorator_list=decorator_list,
+                               returns=n.returns, lineno=n.lineno)
+
+    def unchecked_entry(self, n, *args):
+        # The function without the checks of its parameters, defined
+        # under its own name so that tracebacks look the same, and then
+        # bound to __retic_unchecked_f__:
+        #   def f(x): ...
+        #   __retic_unchecked_f__ = f
+        count = len(self.entries[n.name][2])
+        fargs = ast.arguments(args=n.args.args, vararg=None, kwonlyargs=[], kw_defaults=[], kwarg=None, defaults=[])
+        fn = ast.FunctionDef(name=n.name, args=fargs, body=n.body[count:] or [ast.Pass(lineno=n.lineno, col_offset=n.col_offset)],
+                             decorator_list=[], returns=n.returns, lineno=n.lineno, col_offset=n.col_offset)
+        return [self.dispatch(fn, *args),
+                ast.Assign(targets=[ast.Name(id=unchecked(n.name), ctx=ast.Store(), lineno=n.lineno, col_offset=n.col_offset)],
+                           value=ast.Name(id=n.name, ctx=ast.Load(), lineno=n.lineno, col_offset=n.col_offset),
+                           lineno=n.lineno, col_offset=n.col_offset)]
+
+    def visitCall(self, n, *args):
+        call = super().visitCall(n, *args)
+        if not isinstance(n.func, ast.Name) or n.func.id not in self.entries or n.keywords or \
+           getattr(n, 'starargs', None) or getattr(n, 'kwargs', None) or \
+           any(isinstance(arg, ast.Starred) for arg in n.args):
+            return call
+        i, params, checks = self.entries[n.func.id]
+        if len(n.args) != params or (self.references is None and i >= self.statement):
+            return call
+        for pos in checks:
+            if not trusted(n.args[pos], self.locals) or not implies(type_of(n.args[pos]), checks[pos].type):
+                return call
+        if n.func.id not in self.called:
+            self.called.append(n.func.id)
+        # The entry point is bound in front of the function, so it's
+        # only safe to load it early if the function comes first
+        if i < self.statement or (i == self.statement and self.references is not None):
+            call.func = self.reference(unchecked(n.func.id), n.func.lineno, n.func.col_offset)
+        else: call.func = ast.Name(id=unchecked(n.func.id), ctx=ast.Load(), lineno=n.func.lineno, col_offset=n.func.col_offset)
+        return call
+
+    def protect(self, protectors, lineno, col_offset, *args):
+        # The checks of the arguments that can be inlined are combined
+        # into a single test, which only calls the runtime check
+        # functions, in the original order, when one of them fails
+        types = {id(s): self.check_type(s.value, *args) for s in protectors}
+        fused = [s for s in protectors if inlinable(get_type(types[id(s)]))]
+        if len(fused) < 2 or flags.PROFILE_CHECKS or flags.COUNT_CHECKS or flags.CHECK_LEVELS:
+            return self.dispatch_scope(protectors, *args)
+        tests = []
+        for s in fused:
+            val = self.dispatch(s.value.value, *args)
+            tests.append(self.inline_test(get_type(types[id(s)]), self.runtime_check(types[id(s)], val)[1],
+                                          lambda: copy.deepcopy(val), lineno, col_offset))
+        fail = []
+        for s in protectors:
+            val = self.dispatch(s.value.value, *args)
+            check = self.runtime_check(types[id(s)], val, weight=0)
+            if check is not None:
+                fn, fargs = check
+                fail.append(ast.Expr(value=ast_trans.Call(func=self.reference(fn, lineno, col_offset, weight=0), args=[val] + fargs,
+                                                          keywords=[], starargs=None, kwargs=None, lineno=lineno, col_offset=col_offset),
+                                     lineno=lineno, col_offset=col_offset))
+        test = ast.UnaryOp(op=ast.Not(), operand=ast.BoolOp(op=ast.And(), values=tests, lineno=lineno, col_offset=col_offset),
+                           lineno=lineno, col_offset=col_offset)
+        rest = [s for s in protectors if s not in fused]
+        return [ast.If(test=test, body=fail, orelse=self.dispatch_scope(rest, *args), lineno=lineno, col_offset=col_offset)]
+
+    def check_type(self, n, *args):
+        # The type that the check n is compiled against
+        return n.type
+
+    def visitClassDef(self, n, *args):
+        # Methods of top-level classes are exported like functions
+        saved = self.exporting
+        self.exporting = self.exporting and self.references is None
+        try:
+            return super().visitClassDef(n, *args)
+        finally:
+            self.exporting = saved
+
+    def loop(self, visit):
+        self.loops += 1
+        try:
+            return visit()
+        finally:
+            self.loops -= 1
+
+    def visitFor(self, n, *args):
+        return ast.For(target=self.dispatch(n.target, *args),
+                       iter=self.dispatch(n.iter, *args),
+                       body=self.loop(lambda: self.dispatch_statements(n.body, *args)),
+                       orelse=self.dispatch_statements(n.orelse, *args))
+
+    def visitWhile(self, n, *args):
+        return ast.While(test=self.loop(lambda: self.dispatch(n.test, *args)),
+                         body=self.loop(lambda: self.dispatch_statements(n.body, *args)),
+                         orelse=self.dispatch_statements(n.orelse, *args))
+
     def reduce(self, ns, *args):
         lst = [self.dispatch(n, *args) for n in ns]
         rlist = []
@@ -48,7 +528,7 @@ class CheckCompiler(copy_visitor.CopyVisitor):
         return n.to_ast(n.lineno, n.col_offset)
 
     def visitUseCheck(self, n, *args):
-        val = self.dispatch(n.value)
+        val = self.dispatch(n.value, *args)
         return val
 
 
@@ -56,66 +536,265 @@ class CheckCompiler(copy_visitor.CopyVisitor):
         return self.visitCheck(n, *args)
 
     def visitCheck(self, n, *args):
-        def get_type(ty):
-            if isinstance(ty, retic_ast.OutputAlias) or isinstance(ty, retic_ast.ClassOutputAlias):
-                return ty.underlying
-            else: return ty
         val = self.dispatch(n.value, *args)
-        
+        check = self.runtime_check(n.type, val)
+        if check is None:
+            return val
+        fn, args = check
+        if flags.CHECK_LEVELS and (self.boundary or self.imports(n.value)):
+            fn = '__retic_checks__.' + fn
+
+        if flags.PROFILE_CHECKS:
+            return self.profiled(fn, val, args, n.type, n.lineno, n.col_offset)
+        elif flags.COUNT_CHECKS:
+            return self.counted(fn, val, args, n.type, n.lineno, n.col_offset)
+        if flags.INLINE_CHECKS and not flags.CHECK_LEVELS:
+            inlined = self.inline(fn, val, args, get_type(n.type), n.lineno, n.col_offset)
+            if inlined is not None:
+                return inlined
+
+        return ast_trans.Call(func=self.reference(fn, n.lineno, n.col_offset),
+                              args=[val] + args, keywords=[], starargs=None,
+                              kwargs=None, lineno=val.lineno, col_offset=val.col_offset)
+
+    def imports(self, n)->bool:
+        # Whether n reads a value from an imported module, or calls one
+        # of its functions
+        if isinstance(n, ast.Call):
+            n = n.func
+        while isinstance(n, ast.Attribute):
+            n = n.value
+        return isinstance(n, ast.Name) and n.id in self.imported
+
+    def profiled(self, fn, val, args, ty, lineno, col_offset):
+        # The check, run through the runtime's profiler, tagged with its
+        # site: the module, position and the type checked against
+        site = [ast.Name(id='__name__', ctx=ast.Load(), lineno=lineno, col_offset=col_offset),
+                ast.Num(n=lineno, lineno=lineno, col_offset=col_offset),
+                ast.Num(n=col_offset, lineno=lineno, col_offset=col_offset),
+                ast.Str(s=str(get_type(ty)), lineno=lineno, col_offset=col_offset)]
+        return ast_trans.Call(func=self.reference('__retic_profile_check__', lineno, col_offset),
+                              args=site + [self.reference(fn, lineno, col_offset), val] + args, keywords=[],
+                              starargs=None, kwargs=None, lineno=lineno, col_offset=col_offset)
+
+    def counted(self, fn, val, args, ty, lineno, col_offset):
+        # The check, counted by the runtime under the next site id
+        self.sites.append((lineno, col_offset, str(get_type(ty))))
+        counts = [self.reference('__retic_executions__', lineno, col_offset), self.reference('__retic_failures__', lineno, col_offset),
+                  ast.Num(n=len(self.sites) - 1, lineno=lineno, col_offset=col_offset)]
+        return ast_trans.Call(func=self.reference('__retic_count_check__', lineno, col_offset),
+                              args=counts + [self.reference(fn, lineno, col_offset), val] + args, keywords=[],
+                              starargs=None, kwargs=None, lineno=lineno, col_offset=col_offset)
 
+    def runtime_check(self, ty, val, weight=1):
+        # The runtime function that checks val against ty, and the
+        # arguments it takes besides val, or None if there's nothing
+        # to check
         args = []
-        if isinstance(get_type(n.type), retic_ast.Int) or isinstance(get_type(n.type), retic_ast.SingletonInt):
+        if isinstance(get_type(ty), retic_ast.Int) or isinstance(get_type(ty), retic_ast.SingletonInt):
             fn = '__retic_check_int__'
-        elif isinstance(get_type(n.type), retic_ast.Float):
+        elif isinstance(get_type(ty), retic_ast.Float):
             fn = '__retic_check_float__'
-        elif isinstance(get_type(n.type), retic_ast.Complex):
+        elif isinstance(get_type(ty), retic_ast.Complex):
             fn = '__retic_check_complex__'
-        elif isinstance(get_type(n.type), retic_ast.Void):
+        elif isinstance(get_type(ty), retic_ast.Void):
             fn = '__retic_check_none__'
-        elif isinstance(get_type(n.type), retic_ast.Str):
+        elif isinstance(get_type(ty), retic_ast.Str):
             fn = '__retic_check_str__'
-        elif isinstance(get_type(n.type), retic_ast.Bool):
+        elif isinstance(get_type(ty), retic_ast.Bool):
             fn = '__retic_check_bool__'
-        elif isinstance(get_type(n.type), retic_ast.Function):
+        elif isinstance(get_type(ty), retic_ast.Function):
             fn = '__retic_check_callable__'
-        elif isinstance(get_type(n.type), retic_ast.Set):
+        elif isinstance(get_type(ty), retic_ast.Set):
             fn = '__retic_check_set__'
-        elif isinstance(get_type(n.type), retic_ast.List):
+        elif isinstance(get_type(ty), retic_ast.List):
             fn = '__retic_check_list__'
-        elif isinstance(get_type(n.type), retic_ast.Dict):
+        elif isinstance(get_type(ty), retic_ast.Dict):
             fn = '__retic_check_dict__'
-        elif isinstance(get_type(n.type), retic_ast.Tuple):
+        elif isinstance(get_type(ty), retic_ast.Tuple):
             fn = '__retic_check_tuple__'
-            args = [ast.Num(n=len(get_type(n.type).elts), lineno=val.lineno, col_offset=val.col_offset)]
-        elif isinstance(get_type(n.type), retic_ast.HTuple):
+            args = [ast.Num(n=len(get_type(ty).elts), lineno=val.lineno, col_offset=val.col_offset)]
+        elif isinstance(get_type(ty), retic_ast.HTuple):
             fn = '__retic_check_htuple__'
-        elif isinstance(get_type(n.type), retic_ast.Dict):
+        elif isinstance(get_type(ty), retic_ast.Dict):
             fn = '__retic_check_dict__'
-        elif isinstance(get_type(n.type), retic_ast.Module):
+        elif isinstance(get_type(ty), retic_ast.Module):
             fn = '__retic_check_module__'
-        elif isinstance(get_type(n.type), retic_ast.Instance):
+        elif isinstance(get_type(ty), retic_ast.Instance):
             fn = '__retic_check_instance__'
-            args = [n.type.to_ast(lineno=val.lineno, col_offset=val.col_offset)]
-        elif isinstance(get_type(n.type), retic_ast.Class):
+            args = [self.reference(class_path(ty), val.lineno, val.col_offset, weight)]
+        elif isinstance(get_type(ty), retic_ast.Class):
             fn = '__retic_check_class__'
-            args = [n.type.to_ast(lineno=val.lineno, col_offset=val.col_offset).args[0]]
-        elif isinstance(get_type(n.type), retic_ast.Union):
-            fn = '__retic_check_union__'
-            args = [n.type.to_ast(lineno=val.lineno, col_offset=val.col_offset).args[0]]
-        elif isinstance(get_type(n.type), retic_ast.Structural):
+            args = [self.reference(class_path(ty), val.lineno, val.col_offset, weight)]
+        elif isinstance(get_type(ty), retic_ast.Union):
+            fn = None if flags.CHECK_LEVELS else self.union_predicate(get_type(ty), val.lineno, val.col_offset)
+            if fn is None:
+                fn = '__retic_check_union__'
+                args = [ty.to_ast(lineno=val.lineno, col_offset=val.col_offset).args[0]]
+        elif isinstance(get_type(ty), retic_ast.Structural):
             fn = '__retic_check_structural__'
-            args = [ast.List(elts=[ast.Str(s=k, lineno=val.lineno, col_offset=val.col_offset) for k in get_type(n.type).members], 
-                             ctx=ast.Load(), lineno=val.lineno, col_offset=val.col_offset)]
-        elif isinstance(get_type(n.type), retic_ast.Subscriptable):
+            args = [ast.Tuple(elts=[ast.Str(s=k, lineno=val.lineno, col_offset=val.col_offset) for k in get_type(ty).members], 
+                              ctx=ast.Load(), lineno=val.lineno, col_offset=val.col_offset)]
+        elif isinstance(get_type(ty), retic_ast.Subscriptable):
             fn = '__retic_check_structural__'
-            args = [ast.List(elts=[ast.Str(s='__getattr__', lineno=val.lineno, col_offset=val.col_offset)], 
-                             ctx=ast.Load(), lineno=val.lineno, col_offset=val.col_offset)]
-        elif isinstance(get_type(n.type), retic_ast.Bot):
+            args = [ast.Tuple(elts=[ast.Str(s='__getattr__', lineno=val.lineno, col_offset=val.col_offset)], 
+                              ctx=ast.Load(), lineno=val.lineno, col_offset=val.col_offset)]
+        elif isinstance(get_type(ty), retic_ast.Bot):
             fn = 'BOTCHECK'
-        elif isinstance(get_type(n.type), retic_ast.Dyn):
-            return val
-        else: raise exc.InternalReticulatedError(n.type)
+        elif isinstance(get_type(ty), retic_ast.Dyn):
+            return None
+        else: raise exc.InternalReticulatedError(ty)
+        return fn, args
 
-        return ast_trans.Call(func=ast.Name(id=fn, ctx=ast.Load(), lineno=n.lineno, col_offset=n.col_offset),
-                              args=[val] + args, keywords=[], starargs=None,
-                              kwargs=None, lineno=val.lineno, col_offset=val.col_offset)
+    def union_predicate(self, ty, lineno, col_offset):
+        # The name of the module-level function that checks values
+        # against the union ty, defining it if this is the first check
+        # against ty, or None if it refers to classes that might not
+        # be the ones visible at module level
+        for other, pred in self.unions:
+            if other == ty:
+                return pred.name
+        def name(id, ctx=ast.Load):
+            return ast.Name(id=id, ctx=ctx(), lineno=lineno, col_offset=col_offset)
+        def call(fn, *args):
+            return ast_trans.Call(func=name(fn), args=list(args), keywords=[], starargs=None,
+                                  kwargs=None, lineno=lineno, col_offset=col_offset)
+
+        # Each test accepts only values that the generic check
+        # (transient.__retic_check__) accepts for some alternative. The
+        # classes are the ones that the generic check is given, so that
+        # e.g. Complex doesn't accept ints and Set doesn't accept
+        # frozensets, like __retic_check_union__ and unlike
+        # __retic_check_complex__ and __retic_check_set__
+        classes, tests = [], []
+        tuples, none, function = [], False, False
+        structural = []
+        for alt in ty.alternatives:
+            if isinstance(alt, retic_ast.Class):
+                # Unions of classes are left entirely to the generic
+                # check (see transient.__retic_type_marker__)
+                return None
+            elif isinstance(alt, retic_ast.Instance) and not self.stable(class_path(alt).split('.')[0]):
+                return None
+            elif isinstance(alt, retic_ast.Tuple):
+                tuples.append(len(alt.elts))
+            elif isinstance(alt, retic_ast.Float):
+                # The generic check accepts ints where floats are expected
+                classes.extend([name('float'), name('int')])
+            elif type(alt) in INLINE_CLASSES:
+                classes.append(alt.to_ast(lineno, col_offset))
+            elif isinstance(alt, retic_ast.Instance):
+                classes.append(path_ast(class_path(alt), lineno, col_offset))
+            elif isinstance(alt, retic_ast.Void):
+                none = True
+            elif isinstance(alt, retic_ast.Function):
+                function = True
+            elif isinstance(alt, retic_ast.Structural):
+                structural.append(list(alt.members))
+        # Any other alternatives are left to the generic check, which
+        # also reports the failure
+        if classes:
+            tests.append(call('__retic_isinstance__', name(inline_temporary),
+                              ast.Tuple(elts=classes, ctx=ast.Load(), lineno=lineno, col_offset=col_offset) if len(classes) > 1 else classes[0]))
+        for n in tuples:
+            tests.append(ast.BoolOp(op=ast.And(), values=[call('__retic_isinstance__', name(inline_temporary), name('__retic_tuple__')),
+                                                          ast.Compare(left=call('__retic_len__', name(inline_temporary)), ops=[ast.Eq()],
+                                                                      comparators=[ast.Num(n=n, lineno=lineno, col_offset=col_offset)],
+                                                                      lineno=lineno, col_offset=col_offset)],
+                                    lineno=lineno, col_offset=col_offset))
+        if none:
+            tests.append(ast.Compare(left=name(inline_temporary), ops=[ast.Is()],
+                                     comparators=[ast.NameConstant(value=None, lineno=lineno, col_offset=col_offset)],
+                                     lineno=lineno, col_offset=col_offset))
+        for members in structural:
+            tests.append(ast.BoolOp(op=ast.And(), values=[call('__retic_hasattr__', name(inline_temporary), ast.Str(s=k, lineno=lineno, col_offset=col_offset))
+                                                          for k in members] or [ast.NameConstant(value=True, lineno=lineno, col_offset=col_offset)],
+                                    lineno=lineno, col_offset=col_offset))
+        if function:
+            tests.append(call('__retic_callable__', name(inline_temporary)))
+        if not tests:
+            return None
+
+        pred = ast.FunctionDef(name='__retic_union_{}__'.format(len(self.unions) + 1),
+                               args=ast.arguments(args=[ast.arg(arg=inline_temporary, annotation=None, lineno=lineno, col_offset=col_offset)],
+                                                  vararg=None, kwonlyargs=[], kw_defaults=[], kwarg=None, defaults=[]),
+                               body=[ast.If(test=ast.BoolOp(op=ast.Or(), values=tests, lineno=lineno, col_offset=col_offset) if len(tests) > 1 else tests[0],
+                                            body=[ast.Return(value=name(inline_temporary), lineno=lineno, col_offset=col_offset)],
+                                            orelse=[], lineno=lineno, col_offset=col_offset),
+                                     ast.Return(value=call('__retic_check_union__', name(inline_temporary),
+                                                           ty.to_ast(lineno=lineno, col_offset=col_offset).args[0]),
+                                                lineno=lineno, col_offset=col_offset)],
+                               decorator_list=[], returns=None, lineno=lineno, col_offset=col_offset)
+        self.unions.append((ty, pred))
+        return pred.name
+
+    def inline(self, fn, val, args, ty, lineno, col_offset):
+        def name(id, ctx=ast.Load):
+            return ast.Name(id=id, ctx=ctx(), lineno=lineno, col_offset=col_offset)
+
+        # Only checks of values that can be evaluated more than once
+        # are inlined
+        if isinstance(val, ast.Name):
+            ref = lambda: name(val.id)
+        elif isinstance(val, (ast.Num, ast.Str, ast.NameConstant)):
+            ref = lambda: copy.deepcopy(val)
+        else: return None
+
+        test = self.inline_test(ty, args, ref, lineno, col_offset)
+        if test is None:
+            return None
+        # The runtime check function reports the failure
+        fail = ast_trans.Call(func=self.reference(fn, lineno, col_offset, weight=0), args=[ref()] + [self.again(arg) for arg in args], keywords=[], starargs=None,
+                              kwargs=None, lineno=lineno, col_offset=col_offset)
+        return ast.IfExp(test=test, body=ref(), orelse=fail, lineno=lineno, col_offset=col_offset)
+
+    def inline_test(self, ty, args, ref, lineno, col_offset):
+        # A test of whether the value (produced by ref()) passes the
+        # check against ty, if it can be inlined
+        def isinstance_of(value, cls):
+            return ast_trans.Call(func=self.reference('__retic_isinstance__', lineno, col_offset), args=[value, cls], keywords=[], starargs=None,
+                                  kwargs=None, lineno=lineno, col_offset=col_offset)
+
+        if type(ty) in INLINE_CLASSES:
+            test = isinstance_of(ref(), self.reference(INLINE_CLASSES[type(ty)], lineno, col_offset))
+            if isinstance(ty, retic_ast.Tuple):
+                length = ast_trans.Call(func=self.reference('__retic_len__', lineno, col_offset), args=[ref()], keywords=[], starargs=None,
+                                        kwargs=None, lineno=lineno, col_offset=col_offset)
+                test = ast.BoolOp(op=ast.And(), values=[test, ast.Compare(left=length, ops=[ast.Eq()], comparators=[copy.deepcopy(args[0])],
+                                                                          lineno=lineno, col_offset=col_offset)],
+                                  lineno=lineno, col_offset=col_offset)
+        elif isinstance(ty, retic_ast.Void):
+            test = ast.Compare(left=ref(), ops=[ast.Is()], comparators=[ast.NameConstant(value=None, lineno=lineno, col_offset=col_offset)],
+                               lineno=lineno, col_offset=col_offset)
+        elif isinstance(ty, retic_ast.Instance):
+            test = ast.BoolOp(op=ast.Or(), values=[isinstance_of(ref(), args[0]),
+                                                   ast.Compare(left=ref(), ops=[ast.Is()],
+                                                               comparators=[ast.NameConstant(value=None, lineno=lineno, col_offset=col_offset)],
+                                                               lineno=lineno, col_offset=col_offset)],
+                              lineno=lineno, col_offset=col_offset)
+        elif isinstance(ty, retic_ast.Class):
+            test = ast.BoolOp(op=ast.And(), values=[isinstance_of(ref(), self.reference('__retic_type__', lineno, col_offset)),
+                                                    ast_trans.Call(func=self.reference('__retic_issubclass__', lineno, col_offset), args=[ref(), args[0]],
+                                                                   keywords=[], starargs=None, kwargs=None, lineno=lineno, col_offset=col_offset)],
+                              lineno=lineno, col_offset=col_offset)
+        else: return None
+        return test
+
+    def comprehension(self, visit):
+        self.loops += 1
+        try:
+            return visit()
+        finally:
+            self.loops -= 1
+
+    def visitListComp(self, n, *args):
+        return self.comprehension(lambda: super(CheckCompiler, self).visitListComp(n, *args))
+
+    def visitSetComp(self, n, *args):
+        return self.comprehension(lambda: super(CheckCompiler, self).visitSetComp(n, *args))
+
+    def visitDictComp(self, n, *args):
+        return self.comprehension(lambda: super(CheckCompiler, self).visitDictComp(n, *args))
+
+    def visitGeneratorExp(self, n, *args):
+        return self.comprehension(lambda: super(CheckCompiler, self).visitGeneratorExp(n, *args))
@@ -1,9 +1,33 @@
 ## Runtime module used by Transient
 
-__all__ = ['__retic_check_int__', '__retic_check_float__', '__retic_check_complex__', '__retic_check_list__', '__retic_check_set__', '__retic_check_dict__', '__retic_check_instance__', '__retic_check_class__', '__retic_check_structural__', '__retic_check_none__', '__retic_check_callable__', '__retic_check_str__', '__retic_check_bool__', '__retic_check_tuple__', '__retic_check_htuple__']
+__all__ = ['__retic_check_int__', '__retic_check_float__', '__retic_check_complex__', '__retic_check_list__', '__retic_check_set__', '__retic_check_dict__', '__retic_check_instance__', '__retic_check_class__', '__retic_check_structural__', '__retic_check_none__', '__retic_check_callable__', '__retic_check_str__', '__retic_check_bool__', '__retic_check_tuple__', '__retic_check_htuple__', '__retic_check_module__', '__retic_check_union__', '__retic_error__', '__retic_isinstance__', '__retic_len__', '__retic_int__', '__retic_bool__', '__retic_str__', '__retic_float__', '__retic_complex__', '__retic_list__', '__retic_set__', '__retic_dict__', '__retic_tuple__', '__retic_callable__', '__retic_hasattr__', '__retic_type__', '__retic_issubclass__', '__retic_profile_check__', '__retic_register_sites__', '__retic_count_check__', '__retic_checks__', '__retic_select_checks__', '__retic_globals__']
 
 ENABLE_EXCEPTHOOK = True
 
+# The profiling and counting runtimes below import what they need
+# here, so that it isn't loaded through Reticulated's import hook
+import atexit as _atexit, json as _json, os as _os, sys as _sys, tempfile as _tempfile, threading as _threading, time as _time
+
+# Checks inlined by opt_check_compiler, and the predicates it defines
+# for union types, refer to builtins through these names, which
+# programs are unlikely to shadow
+__retic_isinstance__ = isinstance
+__retic_len__ = len
+__retic_int__ = int
+__retic_bool__ = bool
+__retic_str__ = str
+__retic_float__ = (float, int)
+__retic_complex__ = (complex, float, int)
+__retic_list__ = list
+__retic_set__ = (set, frozenset)
+__retic_dict__ = dict
+__retic_tuple__ = tuple
+__retic_callable__ = callable
+__retic_hasattr__ = hasattr
+__retic_type__ = type
+__retic_issubclass__ = issubclass
+__retic_globals__ = globals
+
 def __retic_error__(msg):
     from . import base_runtime_exception
     class RuntimeCheckError(base_runtime_exception.NormalRuntimeError): pass
@@ -60,17 +84,76 @@ def __retic_check_module__(val):
     return val if isinstance(val, ModuleType) else __retic_error__('Value {} is not a module'.format(val))
 
 def __retic_check_class__(val, ty):
-    return val if ty in getattr(val, 'mro', lambda: [])() else __retic_error__('Value {} is not a subtype of {}'.format(val, ty))
+    try:
+        if isinstance(val, type) and issubclass(val, ty):
+            return val
+    except TypeError:
+        # ty isn't a class
+        pass
+    return __retic_error__('Value {} is not a subtype of {}'.format(val, ty))
 
 def __retic_check_union__(val, alts):
-    # We can optimize this by having the compiler provide a list of check functions to apply to val.
+    # Union checks are usually compiled into specialized predicates,
+    # which only come here when their own tests fail
     from . import transient
     return transient.__retic_check__(val, transient.__retic_union__(alts))
 
+# The members of structural types that a class provides itself, as
+# methods or other plain class attributes, can't go missing from its
+# instances, so they are looked up once per class. __retic_shapes__
+# maps the id of each class seen to a weak reference to it, which
+# removes the entry when the class goes away, and to a table from the
+# members checked to the ones that still need checking on each value,
+# along with what the class provided for the others. Classes can be
+# mutated by any code at all, so what they provided is looked up on
+# the class again, which is cheaper than on an instance, and the entry
+# is recomputed if anything changed.
+__retic_shapes__ = {}
+
+__retic_missing__ = object()
+
+def __retic_shape__(cls, ty):
+    import types, weakref
+    if id(cls) not in __retic_shapes__:
+        i = id(cls)
+        __retic_shapes__[i] = weakref.ref(cls, lambda ref: __retic_shapes__.pop(i, None)), {}
+    if cls.__getattribute__ is not object.__getattribute__:
+        rest = ty
+        provided = ()
+    else:
+        rest = []
+        provided = [('__getattribute__', object.__getattribute__)]
+        for k in ty:
+            for c in cls.__mro__:
+                if k in c.__dict__:
+                    attr = c.__dict__[k]
+                    # Class methods are bound anew every time they're
+                    # looked up, so they can't be compared
+                    if hasattr(type(attr), '__get__') and \
+                       not isinstance(attr, (types.FunctionType, types.BuiltinFunctionType, staticmethod,
+                                             type(list.append), type(object.__init__))):
+                        rest.append(k)
+                    else: provided.append((k, getattr(cls, k, __retic_missing__)))
+                    break
+            else: rest.append(k)
+        rest = tuple(rest)
+        provided = tuple(provided)
+    __retic_shapes__[id(cls)][1][ty] = rest, provided
+    return rest
+
 def __retic_check_structural__(val, ty):
+    cls = type(val)
+    try:
+        rest, provided = __retic_shapes__[id(cls)][1][ty]
+        for k, attr in provided:
+            if getattr(cls, k, __retic_missing__) is not attr:
+                rest = __retic_shape__(cls, ty)
+                break
+    except KeyError:
+        rest = __retic_shape__(cls, ty)
     mk = ''
     try:
-        for k in ty:
+        for k in rest:
             mk = k
             getattr(val, k)
         return val
@@ -85,3 +168,164 @@ def __retic_check_set__(val):
 
 def __retic_check_dict__(val):
     return val if isinstance(val, dict) else __retic_error__('Value {} is not a dictionary'.format(val))
+
+# With --profile-checks, every check is compiled into a call to
+# __retic_profile_check__, which tallies the number of times the check
+# at each (module, line, column, type) site ran and the time it took.
+# The hottest sites are printed when the program exits, and all of
+# them are written as JSON to the file named by the
+# RETIC_CHECK_PROFILE environment variable (retic-check-profile.json
+# by default).
+__retic_check_profile__ = {}
+
+PROFILE_REPORT_SITES = 20
+
+def __retic_profile_check__(module, line, col, ty, check, val, *args):
+    start = _time.perf_counter()
+    try:
+        return check(val, *args)
+    finally:
+        elapsed = _time.perf_counter() - start
+        site = module, line, col, ty
+        tally = __retic_check_profile__.get(site)
+        if tally is None:
+            if not __retic_check_profile__:
+                _atexit.register(__retic_report_profile__)
+            tally = __retic_check_profile__[site] = [0, 0.0]
+        tally[0] += 1
+        tally[1] += elapsed
+
+def __retic_report_profile__():
+    sites = sorted(__retic_check_profile__.items(), key=lambda site: site[1][1], reverse=True)
+    report = [{'module': module, 'line': line, 'column': col, 'type': ty, 'count': count, 'seconds': seconds}
+              for (module, line, col, ty), (count, seconds) in sites]
+    file = _os.environ.get('RETIC_CHECK_PROFILE', 'retic-check-profile.json')
+    try:
+        with open(file, 'w') as out:
+            _json.dump(report, out, indent=1)
+    except OSError as e:
+        print('Could not write check profile:', e, file=_sys.stderr)
+    print('{:>12} {:>12} {:>10}  {}'.format('checks', 'total ms', 'avg us', 'site'), file=_sys.stderr)
+    for site in report[:PROFILE_REPORT_SITES]:
+        print('{:>12} {:>12.3f} {:>10.3f}  {}:{}:{} {}'.format(site['count'], site['seconds'] * 1e3, site['seconds'] * 1e6 / site['count'],
+                                                             site['module'], site['line'], site['column'], site['type']), file=_sys.stderr)
+    print('{} sites, {} checks, {:.3f} ms in total'.format(len(report), sum(site['count'] for site in report),
+                                                           sum(site['seconds'] for site in report) * 1e3), file=_sys.stderr)
+
+# With --count-checks, each module numbers its check sites and
+# registers them with __retic_register_sites__, which gives it a list
+# of execution counts and one of failure counts, indexed by site. Every
+# check goes through __retic_count_check__, which does nothing else
+# but increment them. The counts of all modules are written to the
+# file named by the RETIC_CHECK_METRICS environment variable
+# (retic-check-metrics.prom by default) every
+# RETIC_CHECK_METRICS_INTERVAL seconds (60 by default) and at exit, in
+# the Prometheus text format, or as JSON if the file name ends in
+# .json.
+__retic_site_tables__ = []
+
+def __retic_register_sites__(module, sites):
+    executions, failures = [0] * len(sites), [0] * len(sites)
+    if not __retic_site_tables__:
+        interval = float(_os.environ.get('RETIC_CHECK_METRICS_INTERVAL', 60))
+        _threading.Thread(target=__retic_flush_periodically__, args=(interval,), daemon=True).start()
+        _atexit.register(__retic_flush_counts__)
+    __retic_site_tables__.append((module, sites, executions, failures))
+    return executions, failures
+
+def __retic_count_check__(executions, failures, site, check, val, *args):
+    executions[site] += 1
+    try:
+        return check(val, *args)
+    except:
+        failures[site] += 1
+        raise
+
+def __retic_flush_periodically__(interval):
+    while True:
+        _time.sleep(interval)
+        __retic_flush_counts__()
+
+__retic_flush_lock__ = _threading.Lock()
+
+def __retic_flush_counts__():
+    file = _os.environ.get('RETIC_CHECK_METRICS', 'retic-check-metrics.prom')
+    sites = [(module, line, col, ty, executions[i], failures[i])
+             for module, table, executions, failures in list(__retic_site_tables__)
+             for i, (line, col, ty) in enumerate(table)]
+    if file.endswith('.json'):
+        text = _json.dumps([{'module': module, 'line': line, 'column': col, 'type': ty, 'executions': execs, 'failures': fails}
+                            for module, line, col, ty, execs, fails in sites], indent=1)
+    else:
+        def label(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        lines = []
+        for metric, help, index in [('retic_check_executions_total', 'Transient checks executed', 4),
+                                    ('retic_check_failures_total', 'Transient checks failed', 5)]:
+            lines.append('# HELP {} {}'.format(metric, help))
+            lines.append('# TYPE {} counter'.format(metric))
+            lines += ['{}{{module="{}",line="{}",column="{}",type="{}"}} {}'.format(metric, label(site[0]), site[1], site[2], label(site[3]), site[index])
+                      for site in sites]
+        text = '\n'.join(lines) + '\n'
+    # Readers never see a partly written file, and the periodic and
+    # exit-time flushes don't interfere with each other
+    with __retic_flush_lock__:
+        try:
+            fd, temp = _tempfile.mkstemp(dir=_os.path.dirname(_os.path.abspath(file)), prefix='.tmp-')
+            try:
+                with _os.fdopen(fd, 'w') as out:
+                    out.write(text)
+                _os.replace(temp, file)
+            except:
+                _os.unlink(temp)
+                raise
+        except OSError as e:
+            print('Could not write check metrics:', e, file=_sys.stderr)
+
+# Modules compiled with --check-levels start by calling
+# __retic_select_checks__, which picks how much they check from the
+# RETIC_CHECK_LEVELS environment variable, a comma-separated list of
+# module=level entries (an entry for a package covers its submodules),
+# or else from RETIC_CHECK_LEVEL, and by default checks fully. At the
+# boundary level, the module's own bindings of the check functions are
+# replaced by ones that don't check, which leaves only the checks at
+# its boundaries: those of the arguments of its exported functions and
+# of values read from imported modules. The compiler makes those go
+# through __retic_checks__, which is replaced too when checks are off.
+class __retic_checks__:
+    pass
+
+class __retic_no_checks__:
+    pass
+
+def __retic_unchecked__(val, *args):
+    return val
+
+for _name in __all__:
+    if _name.startswith('__retic_check_'):
+        setattr(__retic_checks__, _name, globals()[_name])
+        setattr(__retic_no_checks__, _name, __retic_unchecked__)
+del _name
+
+CHECK_LEVELS = ['full', 'boundary', 'off']
+
+def __retic_check_level__(module):
+    level = _os.environ.get('RETIC_CHECK_LEVEL', 'full')
+    prefix = ''
+    for entry in _os.environ.get('RETIC_CHECK_LEVELS', '').split(','):
+        name, _, entry_level = entry.strip().partition('=')
+        if (module == name or module.startswith(name + '.')) and len(name) > len(prefix):
+            prefix, level = name, entry_level.strip()
+    if level not in CHECK_LEVELS:
+        print('Unknown check level {} for module {}, checking fully'.format(level, module), file=_sys.stderr)
+        return 'full'
+    return level
+
+def __retic_select_checks__(module, namespace):
+    level = __retic_check_level__(module)
+    if level != 'full':
+        for name in vars(__retic_no_checks__):
+            if name.startswith('__retic_check_'):
+                namespace[name] = __retic_unchecked__
+    if level == 'off':
+        namespace['__retic_checks__'] = __retic_no_checks__
@@ -0,0 +1,224 @@
+## Parallel typechecking of the interfaces of the modules imported by
+## a program.
+##
+## By default, imports.ImportProcessor computes the interfaces of the
+## modules that a program imports one at a time, depth first.
+## check_imports instead parses the whole transitive import graph up
+## front, condenses it into strongly connected components (import
+## cycles, which within a component are still handled by the
+## placeholder types in imports.get_imported_type), and computes the
+## interfaces of independent components concurrently in a process
+## pool. Only the imports that interface checking follows are part of
+## the graph, i.e. not those inside function bodies. Workers ship back
+## the serialized interfaces of their components, which are installed
+## into imports.import_type_cache. As in serial mode, the bodies of
+## the modules are left in imports.deferred_modules, to be typechecked
+## and compiled if and when they are executed, so a program behaves
+## the same with or without -j.
+
+from . import imports, importhook, cache, static, flags, exc, retic_ast
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import os, sys, io, marshal, contextlib
+
+class DependencyFinder(imports.ImportFinder):
+    # Resolves imports to files like ImportFinder, but records the
+    # files rather than typechecking them. Like
+    # imports.InterfaceImportProcessor, looks inside class bodies but
+    # not function bodies.
+    examine_functions = False
+
+    def __init__(self):
+        super().__init__()
+        self.files = set()
+
+    def visitClassDef(self, n, *args):
+        return self.dispatch_statements(n.body, *args)
+
+    def get_module_type(self, directory):
+        file, ispackage = self.get_module_definitions(directory)
+        if file:
+            self.files.add(file)
+        return retic_ast.Dyn(), {}, ispackage
+
+    # Imports that cannot be resolved are left for the typechecker to
+    # report
+    def visitImport(self, n, *args):
+        try:
+            super().visitImport(n, *args)
+        except exc.StaticImportError:
+            pass
+
+    def visitImportFrom(self, n, *args):
+        try:
+            super().visitImportFrom(n, *args)
+        except exc.StaticImportError:
+            pass
+
+def module_dependencies(st, filename, path):
+    finder = DependencyFinder()
+    finder.preorder(st.body, os.path.sep.join(filename.split(os.path.sep)[:-1]), path)
+    return finder.files
+
+def import_graph(st, srcdata, path):
+    """
+    Find every file transitively imported by a module. Returns a
+    dictionary mapping each file to the set of files it imports.
+    """
+    graph = {}
+    worklist = list(module_dependencies(st, srcdata.filename, path))
+    while worklist:
+        file = worklist.pop()
+        if file in graph:
+            continue
+        with open(file, 'r') as data:
+            fst, fsrcdata = static.parse_module(data)
+        graph[file] = module_dependencies(fst, fsrcdata.filename, path)
+        worklist.extend(graph[file])
+    return graph
+
+def components(graph):
+    """
+    Tarjan's algorithm. Returns the strongly connected components of
+    the graph as lists of files, in reverse topological order (each
+    component comes after every component it imports).
+    """
+    index = {}
+    lowlink = {}
+    stack = []
+    onstack = set()
+    result = []
+
+    def connect(file):
+        index[file] = lowlink[file] = len(index)
+        stack.append(file)
+        onstack.add(file)
+        for dep in sorted(graph[file]):
+            if dep not in index:
+                connect(dep)
+                lowlink[file] = min(lowlink[file], lowlink[dep])
+            elif dep in onstack:
+                lowlink[file] = min(lowlink[file], index[dep])
+        if lowlink[file] == index[file]:
+            component = []
+            while True:
+                dep = stack.pop()
+                onstack.discard(dep)
+                component.append(dep)
+                if dep == file:
+                    break
+            result.append(sorted(component))
+
+    for file in sorted(graph):
+        if file not in index:
+            connect(file)
+    return result
+
+def reset_worker(path, settings):
+    # Workers may be started fresh rather than forked, so they are
+    # given the parent's flags explicitly
+    sys.path[:] = path
+    for name, value in settings:
+        setattr(flags, name, value)
+    imports.import_type_cache.clear()
+    imports.deferred_modules.clear()
+    imports.import_cycles.clear()
+    importhook.import_cache.clear()
+    cache.interface_hashes.clear()
+    cache.interfaces.clear()
+
+def check_component(files, dependencies, path, settings):
+    """
+    Runs in a worker process. Installs the interfaces of the
+    component's (transitive) dependencies, then computes the
+    interfaces of the files of the component. Returns the serialized
+    interfaces of the component, the interface hashes used by the
+    on-disk cache, the marshalled code of the files that were found in
+    the cache, and, for every other file, its source, its
+    dependencies, and its serialized interface for the cache (if it
+    can be cached). Returns None if any interface can't be computed,
+    in which case the component is left to the serial typechecker,
+    which reports the error.
+    """
+    reset_worker(path, settings)
+    for data, hashes in dependencies:
+        imports.import_type_cache.update(cache.load_interfaces(data))
+        cache.interface_hashes.update(hashes)
+
+    try:
+        with contextlib.redirect_stderr(io.StringIO()):
+            for file in files:
+                imports.get_imported_type(file)
+    except (Exception, SystemExit):
+        return None
+
+    data = cache.dump_interfaces({file: imports.import_type_cache[file] for file in files}, set())
+    hashes = {file: cache.interface_hashes[file] for file in files if file in cache.interface_hashes}
+    codes = {file: marshal.dumps(importhook.import_cache[file]) for file in files if file in importhook.import_cache}
+    deferred = {file: (imports.deferred_modules[file][0], imports.deferred_modules[file][3], cache.interfaces.get(file))
+                for file in files if file in imports.deferred_modules}
+    return data, hashes, codes, deferred
+
+def install(data, hashes, codes, deferred):
+    imports.import_type_cache.update(cache.load_interfaces(data))
+    cache.interface_hashes.update(hashes)
+    for file in codes:
+        importhook.import_cache[file] = marshal.loads(codes[file])
+    for file, (raw, deps, interface) in deferred.items():
+        # The module is parsed again when it is compiled (see
+        # imports.compile_deferred)
+        imports.deferred_modules[file] = raw, None, None, deps
+        imports.dependencies[file] = deps
+        if interface is not None:
+            cache.interfaces[file] = interface
+
+def check_imports(st, srcdata, jobs:int, path=None):
+    """
+    Compute the interfaces of every module transitively imported by
+    st using up to `jobs` worker processes.
+    """
+    path = sys.path if path is None else path
+    graph = import_graph(st, srcdata, path)
+    comps = [comp for comp in components(graph) if not all(file in imports.import_type_cache for file in comp)]
+    if len(comps) < 2 or jobs < 2:
+        return
+
+    owner = {file: i for i, comp in enumerate(comps) for file in comp}
+    deps = [{owner[dep] for file in comp for dep in graph[file] if dep in owner} - {i} for i, comp in enumerate(comps)]
+    # Components are already in reverse topological order, so
+    # transitive dependencies can be accumulated in one pass
+    closure = []
+    for i in range(len(comps)):
+        closure.append(set(deps[i]).union(*[closure[dep] for dep in deps[i]]))
+
+    settings = [('USE_CACHE', flags.USE_CACHE)] + flags.codegen_flags()
+    results = {}
+    installed = []
+    submitted = set()
+    # Components that failed, and the components that import them,
+    # which are left to the serial typechecker so that errors are
+    # reported the same way as without -j
+    failed = set()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {}
+        while len(installed) + len(failed) < len(comps):
+            for i in range(len(comps)):
+                if i in submitted or i in failed:
+                    continue
+                elif deps[i] & failed:
+                    failed.add(i)
+                elif all(dep in results for dep in deps[i]):
+                    shipped = [results[dep][:2] for dep in installed if dep in closure[i]]
+                    futures[pool.submit(check_component, comps[i], shipped, list(path), settings)] = i
+                    submitted.add(i)
+            if not futures:
+                continue
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = futures.pop(future)
+                result = future.result()
+                if result is None:
+                    failed.add(i)
+                else:
+                    results[i] = result
+                    install(*result)
+                    installed.append(i)
@@ -0,0 +1,184 @@
+## The pass manager behind static.transient_compile_module.
+##
+## Each Pass declares the pieces of compilation state, besides the AST
+## itself, that it reads (requires) and produces (provides), and
+## whether it transforms the AST. schedule() works backwards from the
+## results the caller wants: passes that transform the AST always run,
+## other passes only run if a later pass needs what they provide. This
+## is how the statistics-only passes are skipped unless statistics are
+## requested. Adjacent passes that have a fused counterpart in FUSIONS
+## are then replaced by it, so that their work is done in a single
+## traversal of the tree.
+
+from . import annot_stripper, check_inserter, macro_expander, check_optimizer, type_localizer, \
+    check_compiler, opt_check_compiler, redundant_checks, invariant_checks, flags
+from .trust import cscopes, constrgen, usage_check_inserter, return_constrgen, solve, opt, checkcounter, openworld
+
+class Pass:
+    def __init__(self, name:str, run, requires=(), provides=(), transforms=False):
+        # run takes the AST and a dictionary holding the compilation
+        # state, and returns the (possibly new) AST
+        self.name = name
+        self.run = run
+        self.requires = set(requires)
+        self.provides = set(provides)
+        self.transforms = transforms
+
+    def __repr__(self):
+        return 'Pass({})'.format(self.name)
+
+def schedule(passes, wanted=()):
+    needed = set(wanted)
+    live = []
+    for p in reversed(passes):
+        if p.transforms or p.provides & needed:
+            live.append(p)
+            needed |= p.requires
+    live.reverse()
+
+    fused = []
+    for p in live:
+        if fused and (fused[-1].name, p.name) in FUSIONS:
+            fused[-1] = FUSIONS[fused[-1].name, p.name]
+        else:
+            fused.append(p)
+    return fused
+
+def run(passes, st, state=None):
+    state = {} if state is None else state
+    for p in passes:
+        st = p.run(st, state)
+    return st
+
+def fuse(first:Pass, second:Pass, run)->Pass:
+    return Pass(first.name + '+' + second.name, run,
+                requires=first.requires | (second.requires - first.provides),
+                provides=first.provides | second.provides,
+                transforms=first.transforms or second.transforms)
+
+## PASSES ##
+
+def strip_annotations(st, state):
+    return annot_stripper.AnnotationStripper().preorder(st)
+
+def insert_checks(st, state):
+    return check_inserter.CheckInserter().preorder(st)
+
+def expand_macros(st, state):
+    return macro_expander.MacroExpander().preorder(st)
+
+def save_unoptimized(st, state):
+    # Copy visitors don't modify their input, so the tree can be
+    # shared until it is optimized differently
+    state['unoptimized'] = st
+    return st
+
+def insert_usage_checks(st, state):
+    return usage_check_inserter.UsageCheckInserter().preorder(st)
+
+def generate_constraints(st, state):
+    cscopes.ImportProcessor().preorder(st)
+    constraints = cscopes.ScopeFinder().preorder(st, None)
+    constraints |= constrgen.ConstraintGenerator().preorder(st)
+    constraints |= return_constrgen.ReturnConstraintGenerator().preorder(st)
+    if state.get('library'):
+        # Other modules may call the functions of an imported module
+        # and rebind its globals with anything
+        constraints |= openworld.OpenWorld().preorder(st)
+    #print('Constraints generated')
+    #    print(constraints)
+    state['constraints'] = constraints
+    return st
+
+def solve_constraints(st, state):
+    # Parts of the system that can't be solved, or that go over the
+    # solver's budgets, are left out of the solution and listed in
+    # state['unsolved']; None means that nothing was solved
+    try:
+        state['solution'], state['unsolved'] = solve.solve_vars(state['constraints'], st.retic_cctbl)
+    except Exception as ex:
+        print('#Could not solve constraint system:', *(ex.args if isinstance(ex, solve.BailOut) else [repr(ex)]))
+        state['solution'], state['unsolved'] = [], None
+    return st
+
+def remove_trusted_checks(st, state):
+    if state['unsolved'] is None:
+        return check_optimizer.CheckRemover().preorder(state['unoptimized'])
+    return opt.CheckRemover(state['unsolved']).preorder(st, state['solution'])
+
+def report_check_statistics(st, state):
+    stn = checkcounter.CheckCounter().preorder(st)
+    old_st = check_optimizer.CheckRemover().preorder(state['unoptimized'])
+    ostn = checkcounter.CheckCounter().preorder(old_st)
+    print('#{}/{} checks remaining ({} removed, for a {}% reduction)'.format(stn, ostn, ostn-stn, (1-(stn/(ostn if ostn else 1)))*100))
+    state['check statistics'] = stn, ostn
+    return st
+
+def remove_checks(st, state):
+    return check_optimizer.CheckRemover().preorder(st)
+
+def hoist_invariant_checks(st, state):
+    return invariant_checks.InvariantCheckHoister().preorder(st)
+
+def remove_redundant_checks(st, state):
+    return redundant_checks.RedundantCheckRemover().preorder(st)
+
+def localize_types(st, state):
+    type_localizer.TypeLocalizer().preorder(st)
+    return st
+
+def compile_checks(st, state):
+    if not flags.optimized():
+        return check_compiler.CheckCompiler().preorder(st)
+    else:
+        return opt_check_compiler.CheckCompiler().preorder(st)
+
+## FUSED PASSES ##
+
+class ExpandingCheckInserter(macro_expander.MacroExpander, check_inserter.CheckInserter):
+    # Macro calls are replaced before CheckInserter would have wrapped
+    # them in a check, which MacroExpander would have left checking a
+    # string literal
+    pass
+
+def insert_checks_and_expand_macros(st, state):
+    return ExpandingCheckInserter().preorder(st)
+
+class LocalizingCheckCompiler(type_localizer.LocalizingCompiler, check_compiler.CheckCompiler): pass
+class LocalizingOptCheckCompiler(type_localizer.LocalizingCompiler, opt_check_compiler.CheckCompiler): pass
+
+def localize_types_and_compile_checks(st, state):
+    if not flags.optimized():
+        return LocalizingCheckCompiler().preorder(st)
+    else:
+        return LocalizingOptCheckCompiler().preorder(st)
+
+STRIP_ANNOTATIONS = Pass('strip_annotations', strip_annotations, transforms=True)
+INSERT_CHECKS = Pass('insert_checks', insert_checks, transforms=True)
+EXPAND_MACROS = Pass('expand_macros', expand_macros, transforms=True)
+SAVE_UNOPTIMIZED = Pass('save_unoptimized', save_unoptimized, provides={'unoptimized'})
+INSERT_USAGE_CHECKS = Pass('insert_usage_checks', insert_usage_checks, transforms=True)
+GENERATE_CONSTRAINTS = Pass('generate_constraints', generate_constraints, provides={'constraints'})
+SOLVE_CONSTRAINTS = Pass('solve_constraints', solve_constraints, requires={'constraints'}, provides={'solution'})
+REMOVE_TRUSTED_CHECKS = Pass('remove_trusted_checks', remove_trusted_checks, requires={'solution', 'unoptimized'}, transforms=True)
+REPORT_CHECK_STATISTICS = Pass('report_check_statistics', report_check_statistics,
+                               requires={'unoptimized'}, provides={'check statistics'})
+REMOVE_CHECKS = Pass('remove_checks', remove_checks, transforms=True)
+HOIST_INVARIANT_CHECKS = Pass('hoist_invariant_checks', hoist_invariant_checks, transforms=True)
+REMOVE_REDUNDANT_CHECKS = Pass('remove_redundant_checks', remove_redundant_checks, transforms=True)
+LOCALIZE_TYPES = Pass('localize_types', localize_types, transforms=True)
+COMPILE_CHECKS = Pass('compile_checks', compile_checks, transforms=True)
+
+FUSIONS = {
+    ('insert_checks', 'expand_macros'): fuse(INSERT_CHECKS, EXPAND_MACROS, insert_checks_and_expand_macros),
+    ('localize_types', 'compile_checks'): fuse(LOCALIZE_TYPES, COMPILE_CHECKS, localize_types_and_compile_checks),
+}
+
+def transient_passes(optimize:bool):
+    if optimize:
+        optimization = [SAVE_UNOPTIMIZED, INSERT_USAGE_CHECKS, GENERATE_CONSTRAINTS, SOLVE_CONSTRAINTS,
+                        REMOVE_TRUSTED_CHECKS, HOIST_INVARIANT_CHECKS, REMOVE_REDUNDANT_CHECKS,
+                        REPORT_CHECK_STATISTICS]
+    else:
+        optimization = [REMOVE_CHECKS, HOIST_INVARIANT_CHECKS, REMOVE_REDUNDANT_CHECKS]
+    return [STRIP_ANNOTATIONS, INSERT_CHECKS, EXPAND_MACROS] + optimization + [LOCALIZE_TYPES, COMPILE_CHECKS]
@@ -0,0 +1,517 @@
+## Flow-sensitive removal of redundant transient checks.
+##
+## check_optimizer.CheckRemover and trust.opt.CheckRemover look at
+## each check in isolation. RedundantCheckRemover instead walks each
+## scope in execution order, keeping track of which access paths -- a
+## variable x, or an attribute x.attr of one -- are known to hold
+## values that have already passed a check against some type, and
+## drops later Checks and ProtChecks of the same path against the same
+## type.
+##
+## A fact about a path is forgotten when the path is assigned or
+## deleted. Facts that other code could invalidate behind our back
+## (attribute paths, and variables that are global, nonlocal, or
+## rebound by a nested function) are also forgotten whenever code we
+## can't see may run: calls, yields, imports, subscript stores, and
+## operators, subscripts, and attribute loads and stores on values not
+## statically known to be builtins (or, for attributes, modules). Any
+## other object may belong to a class -- possibly an untyped subclass
+## of its static type -- whose properties, descriptors, __getattr__ or
+## __setattr__ run arbitrary code, so attribute paths of such objects
+## never keep any facts. Facts are only recorded for types whose checks
+## depend on nothing but the class of the value, since structural
+## checks can be invalidated by mutation.
+##
+## Control flow is handled structurally. Branches are intersected
+## where they join, loop headers keep only the facts that nothing in
+## the loop can invalidate, and exception handlers and finally blocks
+## assume that the block they protect may have stopped anywhere.
+
+from . import copy_visitor, retic_ast, ast_trans
+import ast
+
+class Tombstone(ast.stmt): pass
+
+STABLE = (retic_ast.Primitive, retic_ast.Function, retic_ast.List, retic_ast.Set, retic_ast.Dict,
+          retic_ast.Tuple, retic_ast.HTuple, retic_ast.Instance, retic_ast.Class)
+BUILTIN = (retic_ast.Primitive, retic_ast.List, retic_ast.Set, retic_ast.Dict, retic_ast.Tuple, retic_ast.HTuple)
+PLAIN = BUILTIN + (retic_ast.Module,)
+NESTED = (ast.FunctionDef, ast.Lambda, ast.ClassDef, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+def stable(ty):
+    return isinstance(ty, STABLE)
+
+def type_of(n):
+    # Checks aren't always given a retic_type of their own
+    if isinstance(n, (retic_ast.Check, retic_ast.ProtCheck)):
+        return n.type
+    else: return getattr(n, 'retic_type', None)
+
+def builtin(*ns):
+    return all(isinstance(type_of(n), BUILTIN) for n in ns)
+
+def plain(n):
+    # Whether n's attributes are loaded and stored without running any
+    # code
+    return isinstance(type_of(n), PLAIN)
+
+def path(n):
+    if isinstance(n, ast.Name):
+        return (n.id,)
+    elif isinstance(n, ast.Attribute) and isinstance(n.value, ast.Name):
+        return (n.value.id, n.attr)
+    else: return None
+
+def children(n):
+    # Reticulated's own nodes don't declare their fields
+    if isinstance(n, (retic_ast.Check, retic_ast.ProtCheck, retic_ast.UseCheck)):
+        return [n.value]
+    elif isinstance(n, retic_ast.ExpandSeq):
+        return n.body
+    elif isinstance(n, retic_ast.Flattened):
+        return n.body + [n.value]
+    elif isinstance(n, list):
+        return n
+    else: return list(ast.iter_child_nodes(n))
+
+def runs_code(n)->bool:
+    # Whether evaluating n itself (not its children) may run code that
+    # we can't see
+    if isinstance(n, (ast.Call, ast.Yield, ast.YieldFrom, ast.Import, ast.ImportFrom, ast.With,
+                      ast.ClassDef, ast.Delete)) or \
+       (isinstance(n, (retic_ast.Check, retic_ast.ProtCheck)) and not stable(n.type)):
+        return True
+    elif isinstance(n, ast.Attribute):
+        return not plain(n.value)
+    elif isinstance(n, ast.Subscript) and not isinstance(n.ctx, ast.Load):
+        return True
+    elif isinstance(n, ast.Subscript):
+        return not builtin(n.value)
+    elif isinstance(n, ast.BinOp):
+        return not builtin(n.left, n.right)
+    elif isinstance(n, ast.UnaryOp):
+        return not builtin(n.operand)
+    elif isinstance(n, ast.Compare):
+        return not builtin(n.left, *n.comparators)
+    elif isinstance(n, ast.AugAssign):
+        return not builtin(n.target, n.value)
+    elif isinstance(n, ast.For):
+        return not builtin(n.iter)
+    else: return False
+
+def binds(n):
+    # The names bound by n itself
+    if isinstance(n, ast.Name) and not isinstance(n.ctx, ast.Load):
+        return {n.id}
+    elif isinstance(n, (ast.FunctionDef, ast.ClassDef)):
+        return {n.name}
+    elif isinstance(n, ast.alias):
+        return {(n.asname or n.name).split('.')[0]}
+    elif isinstance(n, ast.ExceptHandler) and n.name:
+        return {n.name}
+    else: return set()
+
+def effects(ns):
+    """
+    The names that may be bound by executing the nodes ns, and whether
+    they may run code we can't see.
+    """
+    names = set()
+    code = False
+    worklist = list(ns)
+    while worklist:
+        n = worklist.pop()
+        names |= binds(n)
+        code = code or runs_code(n)
+        worklist.extend(children(n))
+    return names, code
+
+def local_names(n:ast.FunctionDef):
+    """
+    The variables local to a function whose values can only be changed
+    by the function itself: its parameters and the names it binds,
+    except for those declared global or nonlocal, and those that a
+    nested function declares nonlocal.
+    """
+    args = n.args
+    bound = {arg.arg for arg in args.args + args.kwonlyargs + [args.vararg, args.kwarg] if arg}
+    escaping = set()
+    worklist = [(s, False) for s in n.body]
+    while worklist:
+        s, nested = worklist.pop()
+        if isinstance(s, (ast.Global, ast.Nonlocal)):
+            escaping.update(s.names)
+        elif not nested:
+            bound |= binds(s)
+        worklist.extend((c, nested or isinstance(s, NESTED)) for c in children(s))
+    return bound - escaping
+
+def join(*factss):
+    factss = [facts for facts in factss if facts is not None]
+    if not factss:
+        return None
+    joined = {}
+    for p in factss[0]:
+        tys = [ty for ty in factss[0][p] if all(ty in facts.get(p, []) for facts in factss[1:])]
+        if tys:
+            joined[p] = tys
+    return joined
+
+class RedundantCheckRemover(copy_visitor.CopyVisitor):
+    # self.facts maps paths to the types they are known to have been
+    # checked against, or is None in unreachable code. self.locals
+    # holds the variables whose facts survive unknown code, and
+    # self.breaks has one list per enclosing loop, holding the facts
+    # at each break out of it.
+
+    examine_functions = True
+
+    def preorder(self, tree, *args):
+        self.facts = {}
+        self.locals = set()
+        self.breaks = []
+        return super().preorder(tree, *args)
+
+    def statements(self, ns, lst):
+        lst = [l for l in lst if not isinstance(l, Tombstone)]
+        return lst if lst or not ns else [ast.Pass()]
+
+    def reduce(self, ns, *args):
+        return self.statements(ns, [self.dispatch(n, *args) for n in ns])
+
+    def dispatch_scope(self, ns, *args):
+        return self.statements(ns, [self.dispatch(s, *args) for s in ns])
+
+    def dispatch_statements(self, ns, *args):
+        if not hasattr(self, 'visitor'): # preorder may not have been called
+            self.visitor = self
+        return self.statements(ns, [self.dispatch(s, *args) for s in ns])
+
+## FACTS ##
+    def copy(self):
+        return None if self.facts is None else {p: self.facts[p][:] for p in self.facts}
+
+    def known(self, p, ty):
+        return self.facts is not None and p is not None and ty in self.facts.get(p, [])
+
+    def learn(self, p, ty):
+        if self.facts is not None and p is not None and stable(ty) and ty not in self.facts.get(p, []):
+            self.facts[p] = self.facts.get(p, []) + [ty]
+
+    def forget(self, names):
+        if self.facts is not None:
+            self.facts = {p: self.facts[p] for p in self.facts if p[0] not in names}
+
+    def clobber(self):
+        # Unknown code may have run
+        if self.facts is not None:
+            self.facts = {p: self.facts[p] for p in self.facts if len(p) == 1 and p[0] in self.locals}
+
+    def without(self, facts, ns, code=False):
+        # The facts that hold everywhere during the execution of ns,
+        # given that they hold before it
+        saved = self.facts
+        self.facts = facts
+        names, runs = effects(ns)
+        self.forget(names)
+        if code or runs:
+            self.clobber()
+        facts = self.facts
+        self.facts = saved
+        return facts
+
+    def scope(self, locals, visit):
+        saved = self.facts, self.locals, self.breaks
+        self.facts, self.locals, self.breaks = {}, locals, []
+        try:
+            return visit()
+        finally:
+            self.facts, self.locals, self.breaks = saved
+
+## CUSTOM NODES ##
+    def visitCheck(self, n, *args):
+        val = self.dispatch(n.value, *args)
+        if self.known(path(val), n.type):
+            return val
+        self.learn(path(val), n.type)
+        if not stable(n.type):
+            self.clobber()
+        return n.__class__(value=val, type=n.type, lineno=n.lineno, col_offset=n.col_offset)
+
+    def visitProtCheck(self, n, *args):
+        return self.visitCheck(n, *args)
+
+## STATEMENTS ##
+    def visitFunctionDef(self, n, *args):
+        fargs = self.dispatch(n.args, *args)
+        decorator_list = [self.dispatch(dec, *args) for dec in n.decorator_list]
+        body = self.scope(local_names(n), lambda: self.dispatch_scope(n.body, *args))
+        self.forget({n.name})
+        return ast.FunctionDef(name=n.name, args=fargs,
+                               body=body, decorator_list=decorator_list,
+                               returns=n.returns, lineno=n.lineno)
+
+    def visitClassDef(self, n, *args):
+        bases = self.reduce(n.bases, *args)
+        starargs = self.dispatch(n.starargs, *args) if getattr(n, 'starargs', None) else None
+        kwargs = self.dispatch(n.kwargs, *args) if getattr(n, 'kwargs', None) else None
+        keywords = [ast.keyword(k.arg, self.dispatch(k.value, *args)) for k in \
+                    getattr(n, 'keywords', [])]
+        decorator_list = self.reduce(n.decorator_list, *args)
+        body = self.scope(set(), lambda: self.dispatch_statements(n.body, *args))
+        self.clobber()
+        self.forget({n.name})
+        return ast_trans.ClassDef(name=n.name,
+                                  bases=bases,
+                                  keywords=keywords,
+                                  starargs=starargs,
+                                  kwargs=kwargs,
+                                  body=body,
+                                  decorator_list=decorator_list)
+
+    def visitReturn(self, n, *args):
+        ret = super().visitReturn(n, *args)
+        self.facts = None
+        return ret
+
+    def visitRaise(self, n, *args):
+        ret = super().visitRaise(n, *args)
+        self.facts = None
+        return ret
+
+    def visitBreak(self, n, *args):
+        if self.breaks:
+            self.breaks[-1].append(self.copy())
+        self.facts = None
+        return ast.Break()
+
+    def visitContinue(self, n, *args):
+        self.facts = None
+        return ast.Continue()
+
+    def visitAssign(self, n, *args):
+        val = self.dispatch(n.value, *args)
+        tys = []
+        if isinstance(val, (retic_ast.Check, retic_ast.ProtCheck)):
+            tys.append(val.type)
+        inner = val.value if isinstance(val, (retic_ast.Check, retic_ast.ProtCheck)) else val
+        if self.facts is not None and path(inner) in self.facts:
+            tys += self.facts[path(inner)]
+        targets = []
+        for target in n.targets:
+            targets.append(self.dispatch(target, *args))
+            # A store that runs code may not store the value at all
+            if not runs_code(targets[-1]):
+                for ty in tys:
+                    self.learn(path(targets[-1]), ty)
+        return ast.Assign(targets=targets, value=val, lineno=n.lineno)
+
+    def visitAugAssign(self, n, *args):
+        value = self.dispatch(n.value, *args)
+        if runs_code(n):
+            self.clobber()
+        target = self.dispatch(n.target, *args)
+        return ast.AugAssign(target=target, op=n.op, value=value)
+
+    def visitImport(self, n, *args):
+        self.clobber()
+        self.forget(effects(n.names)[0])
+        return super().visitImport(n, *args)
+
+    def visitImportFrom(self, n, *args):
+        self.clobber()
+        self.forget(effects(n.names)[0])
+        return super().visitImportFrom(n, *args)
+
+    def visitExpr(self, n, *args):
+        val = self.dispatch(n.value, *args)
+        if isinstance(n.value, (retic_ast.Check, retic_ast.ProtCheck)) and isinstance(val, ast.Name):
+            return Tombstone()
+        else:
+            return ast.Expr(value=val, lineno=n.lineno)
+
+    # Control flow stuff
+    def visitIf(self, n, *args):
+        test = self.dispatch(n.test, *args)
+        entry = self.copy()
+        body = self.dispatch_statements(n.body, *args)
+        after = self.facts
+        self.facts = entry
+        orelse = self.dispatch_statements(n.orelse, *args)
+        self.facts = join(after, self.facts)
+        return ast.If(test=test, body=body, orelse=orelse)
+
+    def visitWhile(self, n, *args):
+        self.facts = self.without(self.facts, [n])
+        test = self.dispatch(n.test, *args)
+        exit = self.copy()
+        self.breaks.append([])
+        body = self.dispatch_statements(n.body, *args)
+        breaks = self.breaks.pop()
+        self.facts = exit
+        orelse = self.dispatch_statements(n.orelse, *args)
+        self.facts = join(self.facts, *breaks)
+        return ast.While(test=test, body=body, orelse=orelse)
+
+    def visitFor(self, n, *args):
+        iter = self.dispatch(n.iter, *args)
+        self.facts = self.without(self.facts, [n.target] + n.body, runs_code(n))
+        exit = self.copy()
+        target = self.dispatch(n.target, *args)
+        self.breaks.append([])
+        body = self.dispatch_statements(n.body, *args)
+        breaks = self.breaks.pop()
+        self.facts = exit
+        orelse = self.dispatch_statements(n.orelse, *args)
+        self.facts = join(self.facts, *breaks)
+        return ast.For(target=target, iter=iter, body=body, orelse=orelse)
+
+    def exits(self, start, adjust):
+        # Apply adjust to the facts at every break recorded since start
+        if self.breaks:
+            self.breaks[-1][start:] = [adjust(facts) for facts in self.breaks[-1][start:]]
+
+    def visitTry(self, n, *args):
+        entry = self.copy()
+        start = len(self.breaks[-1]) if self.breaks else 0
+        body = self.dispatch_statements(n.body, *args)
+        orelse = self.dispatch_statements(n.orelse, *args)
+        normal = [self.facts]
+        handlers = []
+        for handler in n.handlers:
+            self.facts = self.without(entry, n.body)
+            handlers.append(self.dispatch(handler, *args))
+            normal.append(self.facts)
+        self.facts = join(*normal)
+        if n.finalbody:
+            reached = self.facts is not None
+            self.facts = join(self.facts, self.without(entry, n.body + n.handlers + n.orelse))
+            finalbody = self.dispatch_statements(n.finalbody, *args)
+            self.exits(start, lambda facts: self.without(facts, n.finalbody))
+            if not reached:
+                self.facts = None
+        else: finalbody = []
+        return ast.Try(body=body, handlers=handlers, orelse=orelse, finalbody=finalbody)
+
+    def visitExceptHandler(self, n, *args):
+        type = self.dispatch(n.type, *args) if n.type else None
+        if n.name:
+            self.forget({n.name})
+        return ast.ExceptHandler(type=type, name=n.name,
+                                 body=self.dispatch_statements(n.body, *args))
+
+    def visitWith(self, n, *args):
+        items = []
+        for item in n.items:
+            context = self.dispatch(item.context_expr, *args)
+            self.clobber()
+            optional_vars = self.dispatch(item.optional_vars, *args) if item.optional_vars else None
+            items.append(ast.withitem(context_expr=context, optional_vars=optional_vars))
+        entry = self.copy()
+        start = len(self.breaks[-1]) if self.breaks else 0
+        body = self.dispatch_statements(n.body, *args)
+        # __exit__ runs on the way out, and may swallow an exception
+        # raised anywhere in the body
+        self.facts = join(self.facts, self.without(entry, n.body))
+        self.clobber()
+        self.exits(start, lambda facts: self.without(facts, [n]))
+        return ast.With(items=items, body=body)
+
+## EXPRESSIONS ##
+    def visitBoolOp(self, n, *args):
+        values = [self.dispatch(n.values[0], *args)]
+        exits = [self.copy()]
+        for value in n.values[1:]:
+            values.append(self.dispatch(value, *args))
+            exits.append(self.copy())
+        self.facts = join(*exits)
+        return ast.BoolOp(op=n.op, values=values)
+
+    def visitIfExp(self, n, *args):
+        test = self.dispatch(n.test, *args)
+        entry = self.copy()
+        body = self.dispatch(n.body, *args)
+        after = self.facts
+        self.facts = entry
+        orelse = self.dispatch(n.orelse, *args)
+        self.facts = join(after, self.facts)
+        return ast.IfExp(test=test, body=body, orelse=orelse)
+
+    def visitCompare(self, n, *args):
+        # Chained comparisons stop at the first false one
+        left = self.dispatch(n.left, *args)
+        comparators = []
+        exits = []
+        for comparator in n.comparators:
+            comparators.append(self.dispatch(comparator, *args))
+            if runs_code(n):
+                self.clobber()
+            exits.append(self.copy())
+        self.facts = join(*exits)
+        return ast.Compare(left=left, ops=n.ops, comparators=comparators)
+
+    def visitBinOp(self, n, *args):
+        ret = super().visitBinOp(n, *args)
+        if runs_code(n):
+            self.clobber()
+        return ret
+
+    def visitUnaryOp(self, n, *args):
+        ret = super().visitUnaryOp(n, *args)
+        if runs_code(n):
+            self.clobber()
+        return ret
+
+    def visitCall(self, n, *args):
+        ret = super().visitCall(n, *args)
+        self.clobber()
+        return ret
+
+    def visitYield(self, n, *args):
+        ret = super().visitYield(n, *args)
+        self.clobber()
+        return ret
+
+    def visitYieldFrom(self, n, *args):
+        ret = super().visitYieldFrom(n, *args)
+        self.clobber()
+        return ret
+
+    def visitAttribute(self, n, *args):
+        ret = super().visitAttribute(n, *args)
+        if runs_code(n):
+            self.clobber()
+        return ret
+
+    def visitSubscript(self, n, *args):
+        ret = super().visitSubscript(n, *args)
+        if runs_code(n):
+            self.clobber()
+        return ret
+
+    def visitName(self, n, *args):
+        if not isinstance(n.ctx, ast.Load):
+            self.forget({n.id})
+        return super().visitName(n, *args)
+
+    # Nested scopes
+    def nested(self, n, visit):
+        facts = self.copy()
+        ret = self.scope(self.locals, visit)
+        self.facts = self.without(facts, [n])
+        return ret
+
+    def visitLambda(self, n, *args):
+        return self.nested(n, lambda: super(RedundantCheckRemover, self).visitLambda(n, *args))
+
+    def visitListComp(self, n, *args):
+        return self.nested(n, lambda: super(RedundantCheckRemover, self).visitListComp(n, *args))
+
+    def visitSetComp(self, n, *args):
+        return self.nested(n, lambda: super(RedundantCheckRemover, self).visitSetComp(n, *args))
+
+    def visitDictComp(self, n, *args):
+        return self.nested(n, lambda: super(RedundantCheckRemover, self).visitDictComp(n, *args))
+
+    def visitGeneratorExp(self, n, *args):
+        return self.nested(n, lambda: super(RedundantCheckRemover, self).visitGeneratorExp(n, *args))
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-from . import static, exc, repl
+from . import static, exc, repl, flags, parallel, compile_tree, daemon
 import sys, argparse, os, os.path, ast
 
 """ The Reticulated Python entry module. Run this on the command line!"""
@@ -15,6 +15,34 @@ def main():
                         default=False, help='instead of executing the program, print out the modified program (comments and formatting will be lost)')
     parser.add_argument('-n', '--no-opt', dest='optimize', action='store_false', 
                         default=True, help='do not optimize transient checks')
+    parser.add_argument('--check-stats', dest='check_stats', action='store_true',
+                        default=False, help='report how many transient checks the optimizer removed from each module')
+    parser.add_argument('--inline-checks', dest='inline_checks', action='store_true',
+                        default=False, help='compile transient checks of variables and constants into inline isinstance tests rather than calls to check functions')
+    parser.add_argument('--profile-checks', dest='profile_checks', action='store_true',
+                        default=False, help='count and time the transient checks executed at each site, and report the hottest sites at exit')
+    parser.add_argument('--count-checks', dest='count_checks', action='store_true',
+                        default=False, help='count the transient checks executed and failed at each site, and periodically write the counts to a metrics file')
+    parser.add_argument('--check-levels', dest='check_levels', action='store_true',
+                        default=False, help='compile modules so that their transient checks can be limited to module boundaries, or turned off, when they are run (see RETIC_CHECK_LEVEL)')
+    parser.add_argument('--optimize-imports', dest='optimize_imports', action='store_true',
+                        default=False, help='also optimize the transient checks of imported modules, assuming nothing about how their exports are used')
+    parser.add_argument('--solve-time-budget', dest='solve_time_budget', action='store', type=float, metavar='SECONDS',
+                        default=None, help='stop optimizing a module after SECONDS spent solving its constraints, and only remove the checks that are trivially unneeded from the rest')
+    parser.add_argument('--solve-size-budget', dest='solve_size_budget', action='store', type=int, metavar='N',
+                        default=None, help='give up on optimizing parts of a module whose constraints grow to more than N')
+    parser.add_argument('--solve-round-budget', dest='solve_round_budget', action='store', type=int, metavar='N',
+                        default=None, help='give up on optimizing parts of a module whose constraints take more than N rounds to solve')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        default=True, help='do not read or write the on-disk cache of compiled imports')
+    parser.add_argument('-j', '--jobs', dest='jobs', action='store', type=int,
+                        default=1, help='typecheck imported modules, and solve the optimizer\'s constraints, using up to JOBS processes')
+    parser.add_argument('--compile-tree', dest='compile_tree', action='store', nargs=2, metavar=('SRC', 'OUT'),
+                        default=None, help='typecheck and compile every module under SRC into a tree under OUT that runs without Reticulated\'s import hook')
+    parser.add_argument('--daemon', dest='daemon', action='store', metavar='SOCKET',
+                        default=None, help='run a daemon that keeps typechecking state in memory and serves requests on the UNIX socket SOCKET')
+    parser.add_argument('--connect', dest='connect', action='store', metavar='SOCKET',
+                        default=None, help='ask the daemon listening on SOCKET to typecheck the program (or, with -p, to compile and print it)')
     parser.add_argument('--lattice-test', dest='lattice_test_dir', action='store', 
                         type=str, default=None, help='perform full performance analysis, storing intermediate programs in directory DIR')
     typings = parser.add_mutually_exclusive_group()
@@ -28,7 +56,41 @@ def main():
 
     args = parser.parse_args(sys.argv[1:])
     prog_args = args.args.split()
-    if args.program is None:
+    flags.USE_CACHE = args.use_cache
+    flags.CHECK_STATS = args.check_stats
+    flags.INLINE_CHECKS = args.inline_checks
+    flags.PROFILE_CHECKS = args.profile_checks
+    flags.COUNT_CHECKS = args.count_checks
+    flags.CHECK_LEVELS = args.check_levels
+    flags.OPTIMIZE_IMPORTS = args.optimize_imports and args.optimize
+    flags.JOBS = args.jobs
+    flags.SOLVE_TIME_BUDGET = args.solve_time_budget
+    flags.SOLVE_SIZE_BUDGET = args.solve_size_budget
+    flags.SOLVE_ROUND_BUDGET = args.solve_round_budget
+    if args.compile_tree is not None:
+        try:
+            compile_tree.compile_tree(*args.compile_tree, optimize=args.optimize)
+        except IOError as e:
+            print(e)
+    elif args.daemon is not None:
+        try:
+            daemon.serve(args.daemon)
+        except OSError as e:
+            print(e)
+            sys.exit(1)
+    elif args.connect is not None:
+        command = 'status' if args.program is None else 'compile' if args.output_ast else 'check'
+        try:
+            response = daemon.request(args.connect, command, args.program, args.optimize)
+        except OSError as e:
+            print(e)
+            sys.exit(1)
+        print(response['output'], end='')
+        if 'source' in response:
+            print(response['source'], end='')
+        if response['status'] != 'ok':
+            sys.exit(1)
+    elif args.program is None:
         launch_repl(args.semantics)
     else:
         try:
@@ -38,6 +100,8 @@ def main():
                 st, srcdata = static.parse_module(program)
                 
                 if args.lattice_test_dir is None:
+                    if args.jobs > 1:
+                        parallel.check_imports(st, srcdata, args.jobs)
                     st = static.typecheck_module(st, srcdata)
 
                     if args.semantics == 'TRANS':
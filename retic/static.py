@@ -1,7 +1,7 @@
 """ The static.py module is the main interface to the static features of Reticulated."""
 
 
-from . import typecheck, return_checker, check_inserter, check_optimizer, check_compiler, transient, typing, exc, macro_expander, imports, importhook, base_runtime_exception, scope, type_localizer, flags, opt_check_compiler, opt_transient, annot_stripper
+from . import typecheck, return_checker, check_inserter, check_optimizer, check_compiler, transient, typing, exc, macro_expander, imports, importhook, base_runtime_exception, scope, type_localizer, flags, opt_check_compiler, opt_transient, annot_stripper, retic_ast, passes
 from .trust import cscopes, constrgen, usage_check_inserter, return_constrgen, solve, opt, openworld, checkcounter
 from .astor import codegen
 import ast, sys
@@ -59,61 +59,45 @@ def typecheck_module(st: ast.Module, srcdata, topenv=None, exit=True)->ast.Modul
         exc.handle_malformed_type_error(e, srcdata, exit=exit)
     else:
         return st
-    
-def transient_compile_module(st: ast.Module, optimize:bool)->ast.Module:
+
+def typecheck_interface(st: ast.Module, srcdata, topenv=None, exit=True)->ast.Module:
+    """
+    Computes the static interface of a module without typechecking
+    any function bodies. Only the top level of the module (and the
+    bodies of its classes) are examined, so that the types of
+    top-level definitions, class members and fields, and type aliases
+    can be found. When this returns, the Module node has 'retic_type'
+    and 'retic_aliases' attributes identical to those that
+    typecheck_module would produce, but no other typing information
+    is guaranteed to be present. typecheck_module must still be
+    called on the same AST before it is compiled.
+    """
+
+    try:
+        imports.InterfaceImportProcessor().preorder(st, sys.path, srcdata)
+        env, aliases = scope.getModuleScope(st, topenv)
+        st.retic_env = env
+        st.retic_type = retic_ast.Module(imports.InterfaceExportFinder(env).preorder(st))
+    except exc.StaticTypeError as e:
+        exc.handle_static_type_error(e, srcdata, exit=exit)
+    except exc.MalformedTypeError as e:
+        exc.handle_malformed_type_error(e, srcdata, exit=exit)
+    else:
+        return st
+
+def transient_compile_module(st: ast.Module, optimize:bool, library:bool=False)->ast.Module:
     """
     Takes a type-annotated AST and produces a new AST with transient
     checks inserted.  Neither the input nor the output should contain
     non-standard AST nodes, but intermediate passes may. The overall
     structure is to insert retic_ast.Check nodes wherever needed,
     perform postprocessing on that, and then convert the Check nodes
-    into regular Python AST nodes.
+    into regular Python AST nodes. Modules that other code imports
+    (library=True) are optimized without assuming anything about how
+    their exports are used.
     """
-    st = annot_stripper.AnnotationStripper().preorder(st)
-    # Transient check insertion
-    st = check_inserter.CheckInserter().preorder(st)
-    st = macro_expander.MacroExpander().preorder(st)
-    #print('Checks inserted')
-
-    stats = True
-    if optimize:
-        if stats:
-            old_st = st
-        st = usage_check_inserter.UsageCheckInserter().preorder(st)
-        cscopes.ImportProcessor().preorder(st)
-        constraints = cscopes.ScopeFinder().preorder(st, None)
-        constraints |= constrgen.ConstraintGenerator().preorder(st)
-        constraints |= return_constrgen.ReturnConstraintGenerator().preorder(st)
-        #print('Constraints generated')
-        #    constraints |= openworld.OpenWorld().preorder(st)
-        #    print(constraints)
-        #solve.initialize(constraints, st.retic_cctbl)
-        #solution = solve.solve(st.retic_cctbl)
-        solution = solve.solve_vars(constraints, st.retic_cctbl)
-        try:
-            pass
-            #constraints = solve.normalize(constraints, st.retic_cctbl)
-            #print('Constraints solved')
-        except solve.BailOut as ex:
-            print('#Could not solve constraint system:', *ex.args)
-            constraints = []
-
-        st = opt.CheckRemover().preorder(st, solution)
-        if stats:
-            stn = checkcounter.CheckCounter().preorder(st)
-            old_st = check_optimizer.CheckRemover().preorder(old_st)
-            ostn = checkcounter.CheckCounter().preorder(old_st)
-            print('#{}/{} checks remaining ({} removed, for a {}% reduction)'.format(stn, ostn, ostn-stn, (1-(stn/(ostn if ostn else 1)))*100))
-        
-    else: st = check_optimizer.CheckRemover().preorder(st)
-    
-    # Emission to Python3 ast
-    type_localizer.TypeLocalizer().preorder(st)
-    if not flags.optimized():
-        st = check_compiler.CheckCompiler().preorder(st)
-    else:
-        st = opt_check_compiler.CheckCompiler().preorder(st)
-    return st
+    wanted = {'check statistics'} if flags.CHECK_STATS else set()
+    return passes.run(passes.schedule(passes.transient_passes(optimize), wanted), st, {'library': library})
     
 def emit_module(st: ast.Module, imports=True, file=sys.stdout):
     """
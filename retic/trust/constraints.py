@@ -10,6 +10,9 @@ class Constraint:
         raise Exception(type(self))
     def subst(self, x, t):
         raise Exception()
+    def types(self):
+        # The constraint types that the constraint relates
+        raise Exception()
     def vars(self, ctbl):
         raise Exception()
     def solvable(self, v, deps, ctbl):
@@ -29,6 +32,8 @@ class STC(Constraint):
         return hash(self.l) + hash(self.u)
     def subst(self, x, t):
         return STC(self.l.subst(x,t), self.u.subst(x,t))
+    def types(self):
+        return [self.l, self.u]
     def vars(self, ctbl):
         return self.l.vars(ctbl) + self.u.vars(ctbl)
     def solvable(self, v, deps, ctbl):
@@ -47,6 +52,8 @@ class InstanceSTC(Constraint):
         return hash(self.lc) + hash(self.u)
     def subst(self, x, t):
         return InstanceSTC(self.lc.subst(x,t), self.u.subst(x,t))
+    def types(self):
+        return [self.lc, self.u]
     def vars(self, ctbl):
         return self.lc.vars(ctbl) + self.u.vars(ctbl)
     def solvable(self, v, deps, ctbl):
@@ -63,6 +70,8 @@ class InheritsC(Constraint):
         return sum([hash(sup) for sup in self.supers], 0) + hash(self.cls)
     def __eq__(self, other):
         return isinstance(other, InheritsC) and other.supers == self.supers and other.cls == self.cls
+    def types(self):
+        return self.supers
     def vars(self, ctbl):
         return sum([k.vars(ctbl) for k in self.supers], [])
     def solvable(self, v, deps, ctbl):
@@ -84,6 +93,8 @@ class EltSTC(Constraint):
         return hash(self.lc) + hash(self.u)
     def subst(self, x, t):
         return EltSTC(self.lc.subst(x,t), self.u.subst(x,t))
+    def types(self):
+        return [self.lc, self.u]
     def vars(self, ctbl):
         return self.lc.vars(ctbl) + self.u.vars(ctbl)
     def solvable(self, v, deps, ctbl):
@@ -102,6 +113,8 @@ class EqC(Constraint):
         return hash(self.l) + hash(self.r)
     def subst(self, x, t):
         return EqC(self.l.subst(x,t), self.r.subst(x,t))
+    def types(self):
+        return [self.l, self.r]
     def vars(self, ctbl):
         return self.l.vars(ctbl) + self.r.vars(ctbl)
     def solvable(self, v, deps, ctbl):
@@ -121,6 +134,8 @@ class BoundEqC(Constraint):
         return hash(self.l) + hash(self.r)
     def subst(self, x, t):
         return BoundEqC(self.l.subst(x,t), self.r.subst(x,t))
+    def types(self):
+        return [self.l, self.r]
     def vars(self, ctbl):
         return self.l.vars(ctbl) + self.r.vars(ctbl)
     def solvable(self, v, deps, ctbl):
@@ -138,6 +153,8 @@ class DefC(Constraint):
         return isinstance(other, DefC) and other.l == self.l and other.r == self.r
     def subst(self, x, t):
         return DefC(self.l, (self.r.subst(x,t) if self.l is not x else self.r))
+    def types(self):
+        return [self.l, self.r]
     def vars(self, ctbl):
         return self.r.vars(ctbl)
     def solvable(self, v, deps, ctbl):
@@ -159,6 +176,8 @@ class BinopSTC(Constraint):
         return hash(self.op) + hash(self.lo) + hash(self.ro) + hash(self.u)
     def subst(self, x, t):
         return BinopSTC(self.op, self.lo.subst(x,t), self.ro.subst(x,t), self.u.subst(x,t))
+    def types(self):
+        return [self.lo, self.ro, self.u]
     def vars(self, ctbl):
         return self.lo.vars(ctbl) + self.ro.vars(ctbl) + self.u.vars(ctbl)
     def solvable(self, v, deps, ctbl):
@@ -178,6 +197,8 @@ class UnopSTC(Constraint):
         return hash(self.op) + hash(self.lo) + hash(self.u)
     def subst(self, x, t):
         return UnopSTC(self.op, self.lo.subst(x,t), self.u.subst(x,t))
+    def types(self):
+        return [self.lo, self.u]
     def vars(self, ctbl):
         return self.lo.vars(ctbl) + self.u.vars(ctbl)
     def solvable(self, v, deps, ctbl):
@@ -196,6 +217,8 @@ class CheckC(Constraint):
         return hash(self.l) + hash(self.r)
     def subst(self, x, t):
         return CheckC(self.l.subst(x,t), self.s, self.r.subst(x,t))
+    def types(self):
+        return [self.l, self.r]
     def vars(self, ctbl):
         return self.l.vars(ctbl) + self.r.vars(ctbl)
     def solvable(self, v, deps, ctbl):
@@ -312,7 +312,7 @@ class InitialScopeFinder(visitors.DictGatheringVisitor):
                     elif dec.id == 'positional':
                         if n.args.vararg or n.args.kwonlyargs or n.args.kwarg or n.args.defaults:
                             raise Exception()
-                        funty.froms = ctypes.PosCAT([argsty.spec.parameters[p].annotation for p in argsty.spec.parameters])
+                        funty = n.retic_ctype = ctypes.CFunction(ctypes.PosCAT([argsty.spec.parameters[p].annotation for p in argsty.spec.parameters]), retty)
                 elif isinstance(dec, ast.Attribute):
                     if isinstance(dec.value, ast.Name) and dec.attr in ['setter', 'getter', 'deleter']:
                         return {}
@@ -2,13 +2,60 @@ from .. import exc, retic_ast, argspec
 from ..retic_ast import *
 import inspect
 
-class CType: 
+## Constraint types are never modified once they are built, so they
+## have __slots__ and compound types compute their structural hash only
+## once (see cached_hash). Types without any state (Dyn, int, and so
+## on) have a single, shared instance.
+
+def cached_hash(hash):
+    def __hash__(self):
+        try:
+            return self.hashcode
+        except AttributeError:
+            self.hashcode = hash(self)
+            return self.hashcode
+    return __hash__
+
+def getstate(self):
+    # Cached hashes and free variables depend on the identity of
+    # variables, which copies and pickles don't preserve
+    return {slot: getattr(self, slot) for cls in type(self).__mro__ for slot in cls.__dict__.get('__slots__', ())
+            if slot not in ('hashcode', 'freevars') and hasattr(self, slot)}
+
+def setstate(self, state):
+    for slot in state:
+        setattr(self, slot, state[slot])
+
+class Interned:
+    __slots__ = ()
+    def __new__(cls):
+        if 'instance' not in cls.__dict__:
+            cls.instance = super().__new__(cls)
+        return cls.instance
+
+class CType:
+    __slots__ = ('hashcode', 'freevars')
+    __getstate__ = getstate
+    __setstate__ = setstate
     def __repr__(self):
         return self.__str__()
     def parts(self, ctbl):
         return []
     def vars(self, ctbl):
         return []
+    def free_vars(self):
+        # The variables that occur in the type itself (i.e. not
+        # counting those in the class table), with any binding removed
+        try:
+            return self.freevars
+        except AttributeError:
+            fvs = set()
+            for v in self.vars({}):
+                while isinstance(v, CVarBind):
+                    v = v.var
+                fvs.add(v)
+            self.freevars = frozenset(fvs)
+            return self.freevars
     def fields(self):
         return {}
     def subst(self, x, t):
@@ -17,7 +64,10 @@ class CType:
         return self
     def __hash__(self):
         raise Exception
-class CAT: 
+class CAT:
+    __slots__ = ()
+    __getstate__ = getstate
+    __setstate__ = setstate
     def __repr__(self):
         return self.__str__()
     def parts(self, ctbl):
@@ -33,11 +83,13 @@ class CAT:
     def __hash__(self):
         raise Exception
 
-class CPrimitive: 
+class CPrimitive:
+    __slots__ = ()
     def __eq__(self, other):
         return type(self) == type(other)
 
-class CDyn(CType): 
+class CDyn(CType, Interned):
+    __slots__ = ()
     def __str__(self):
         return "*"
     def __eq__(self, other):
@@ -46,7 +98,8 @@ class CDyn(CType):
         return 1001
 
 
-class CBot(CType): 
+class CBot(CType, Interned):
+    __slots__ = ()
     def __str__(self):
         return "bot"#"⊥"
     def __eq__(self, other):
@@ -57,6 +110,7 @@ class CBot(CType):
     
 
 class CForAll(CType):
+    __slots__ = ('var', 'ty')
     def __init__(self, var, ty):
         self.var = var
         self.ty = ty
@@ -75,6 +129,7 @@ class CForAll(CType):
         return CForAll(self.var, self.ty.bind())
     def __eq__(self, other):
         return isinstance(other, CForAll) and self.var == other.var and self.ty == other.ty
+    @cached_hash
     def __hash__(self):
         return (hash(self.var) + hash(self.ty)) * 103
     def instanciate(self):
@@ -85,6 +140,7 @@ class CForAll(CType):
 
 
 class CPolyVar(CType):
+    __slots__ = ('name',)
     def __init__(self, name):
         self.name = name
     def __str__(self):
@@ -100,6 +156,7 @@ class CPolyVar(CType):
         return hash(self.name) * 101
 
 class CIntersection(CType):
+    __slots__ = ('types',)
     def __init__(self, types):
         self.types = types
     def __str__(self):
@@ -115,10 +172,12 @@ class CIntersection(CType):
     def __eq__(self, other):
         import itertools
         return isinstance(other, CIntersection) and all(st == ot for st, ot in itertools.zip_longest(self.types, other.types))
+    @cached_hash
     def __hash__(self):
         return sum(hash(t) for t in self.types) * 137
     
 class CTyVar(CType):
+    __slots__ = ('name',)
     def __init__(self, name):
         self.name = name
     def __str__(self):
@@ -133,12 +192,14 @@ class CTyVar(CType):
     def __hash__(self):
         return hash(self.name) * 19
 
-class CBool(CType, CPrimitive): 
+class CBool(CType, CPrimitive, Interned):
+    __slots__ = ()
     def __str__(self):
         return "bool"
     def __hash__(self):
         return 1
-class CStr(CType, CPrimitive): 
+class CStr(CType, CPrimitive, Interned):
+    __slots__ = ()
     def __str__(self):
         return "str"
     def __hash__(self):
@@ -152,23 +213,27 @@ class CStr(CType, CPrimitive):
             'splitlines': CFunction(PosCAT([]), CList(CStr()))
         })
         return sup
-class CInt(CType, CPrimitive): 
+class CInt(CType, CPrimitive, Interned):
+    __slots__ = ()
     def __str__(self):
         return "int"
     def __hash__(self):
         return 3
-class CFloat(CType, CPrimitive): 
+class CFloat(CType, CPrimitive, Interned):
+    __slots__ = ()
     def __str__(self):
         return "float"
     def __hash__(self):
         return 4
-class CVoid(CType, CPrimitive): 
+class CVoid(CType, CPrimitive, Interned):
+    __slots__ = ()
     def __str__(self):
         return "NoneType"
     def __hash__(self):
         return 5
 
-class CSingletonInt(CType, CPrimitive): 
+class CSingletonInt(CType, CPrimitive):
+    __slots__ = ('n',)
     def __init__(self, n:int):
         self.n = n
     def __str__(self):
@@ -178,7 +243,8 @@ class CSingletonInt(CType, CPrimitive):
     def __hash__(self):
         return self.n+7
 
-class CList(CType): 
+class CList(CType):
+    __slots__ = ('elts',)
     def __init__(self, elts:CType):
         self.elts = elts
     def __str__(self):
@@ -200,10 +266,12 @@ class CList(CType):
         return CList(self.elts.subst(x,t))
     def __eq__(self, other):
         return isinstance(other, CList) and self.elts == other.elts
+    @cached_hash
     def __hash__(self):
         return hash(self.elts) * 5
 
-class CSet(CType): 
+class CSet(CType):
+    __slots__ = ('elts',)
     def __init__(self, elts:CType):
         self.elts = elts
     def __str__(self):
@@ -225,10 +293,12 @@ class CSet(CType):
         return CSet(self.elts.subst(x,t))
     def __eq__(self, other):
         return isinstance(other, CSet) and self.elts == other.elts
+    @cached_hash
     def __hash__(self):
         return hash(self.elts) * 7
 
-class CHTuple(CType): 
+class CHTuple(CType):
+    __slots__ = ('elts',)
     def __init__(self, elts:CType):
         self.elts = elts
     def __str__(self):
@@ -241,10 +311,12 @@ class CHTuple(CType):
         return CHTuple(self.elts.subst(x,t))
     def __eq__(self, other):
         return isinstance(other, CHTuple) and self.elts == other.elts
+    @cached_hash
     def __hash__(self):
         return hash(self.elts) * 11
 
-class CTuple(CType): 
+class CTuple(CType):
+    __slots__ = ('elts',)
     def __init__(self, *elts):
         self.elts = elts
     def __str__(self):
@@ -257,10 +329,12 @@ class CTuple(CType):
         return CTuple(*[v.subst(x,t) for v in self.elts])
     def __eq__(self, other):
         return isinstance(other, CTuple) and self.elts == other.elts
+    @cached_hash
     def __hash__(self):
         return sum([hash(elt) for elt in self.elts], 6)
 
-class CDict(CType): 
+class CDict(CType):
+    __slots__ = ('keys', 'values')
     def __init__(self, keys:CType, values:CType):
         self.keys = keys
         self.values = values
@@ -280,11 +354,13 @@ class CDict(CType):
         return CDict(self.keys.subst(x,t), self.values.subst(x,t))
     def __eq__(self, other):
         return isinstance(other, CDict) and self.values == other.values and self.keys == other.keys
+    @cached_hash
     def __hash__(self):
         return (hash(self.values) + hash(self.keys)) * 13
 
 
-class CFunction(CType): 
+class CFunction(CType):
+    __slots__ = ('froms', 'to')
     def __init__(self, froms:CAT, to:CAT):
         self.froms = froms
         self.to = to
@@ -300,11 +376,13 @@ class CFunction(CType):
         return CFunction(self.froms.bind(), self.to)
     def __eq__(self, other):
         return isinstance(other, CFunction) and self.froms == other.froms and self.to == other.to
+    @cached_hash
     def __hash__(self):
         return (hash(self.froms) + hash(self.to)) * 17
 
 name_counter = 0
 class CVar(CType):
+    __slots__ = ('rootname', 'name')
     def __init__(self, name=None):
         global name_counter
         if name is None:
@@ -325,10 +403,10 @@ class CVar(CType):
             return self
     def __eq__(self, other):
         return other is self
-    def __hash__(self):
-        return hash(self.name)
+    __hash__ = object.__hash__
 
 class CVarBind(CType):
+    __slots__ = ('var', 'rootname')
     def __init__(self, var):
         assert isinstance(var, CVar) or isinstance(var, CVarBind)
         self.var = var
@@ -346,11 +424,13 @@ class CVarBind(CType):
         return CVarBind(self)
     def __eq__(self, other):
         return isinstance(other, CVarBind) and other.var == self.var
+    @cached_hash
     def __hash__(self):
         return hash(self.var) * 27
     
 
 class CClass(CType):
+    __slots__ = ('name',)
     def __init__(self, name):
         self.name = name
     def __str__(self):
@@ -369,6 +449,7 @@ class CClass(CType):
         return hash(self.name) * 31
 
 class CInstance(CType):
+    __slots__ = ('instanceof',)
     def __init__(self, instanceof):
         self.instanceof = instanceof
     def __str__(self):
@@ -397,6 +478,7 @@ class CInstance(CType):
         return hash(self.instanceof) * 37
 
 class CStructural(CType):
+    __slots__ = ('members',)
     def __init__(self, members):
         self.members = members
     def __str__(self):
@@ -413,11 +495,13 @@ class CStructural(CType):
         return isinstance(other, CStructural) and all(mem in other.members for mem in self.members) and \
             all(mem in self.members for mem in other.members) and \
             all(other.members[mem] == self.members[mem] for mem in self.members)
+    @cached_hash
     def __hash__(self):
         return sum([hash(mem) + hash(self.members[mem]) for mem in self.members], 0)
         
         
-class CSubscriptable(CType): 
+class CSubscriptable(CType):
+    __slots__ = ('keys', 'elts')
     def __init__(self, keys:CType, elts:CType):
         self.keys = keys
         self.elts = elts
@@ -431,10 +515,12 @@ class CSubscriptable(CType):
         return CSubscriptable(self.keys.subst(x,t), self.elts.subst(x,t))
     def __eq__(self, other):
         return isinstance(other, CSubscriptable) and other.keys == self.keys and other.elts == self.elts
+    @cached_hash
     def __hash__(self):
         return hash(self.keys) + hash(self.elts) * 37
 
 class PosCAT(CAT):
+    __slots__ = ('types', 'hashcode')
     def __init__(self, types):
         self.types = types
     def __str__(self):
@@ -450,10 +536,12 @@ class PosCAT(CAT):
     def __eq__(self, other):
         return isinstance(other, PosCAT) and len(self.types) == len(other.types) and \
             all(m1 == m2 for m1, m2 in zip(self.types, other.types))
+    @cached_hash
     def __hash__(self):
         return sum([hash(mem) for mem in self.types], 0)
 
-class ArbCAT(CAT): 
+class ArbCAT(CAT, Interned):
+    __slots__ = ()
     def __str__(self):
         return "..."
     def __eq__(self, other):
@@ -462,7 +550,8 @@ class ArbCAT(CAT):
         return 10027
 
 
-class ReadOnlyArbCAT(CAT): 
+class ReadOnlyArbCAT(CAT, Interned):
+    __slots__ = ()
     def __str__(self):
         return "..."
     def __eq__(self, other):
@@ -471,6 +560,7 @@ class ReadOnlyArbCAT(CAT):
         return 10527
 
 class SpecCAT(CAT):
+    __slots__ = ('spec', 'hashcode')
     def __init__(self, spec):
         self.spec = spec
     def __str__(self)->str:
@@ -493,10 +583,12 @@ class SpecCAT(CAT):
         return SpecCAT(inspect.Signature(ret))
     def __eq__(self, other):
         return isinstance(other, SpecCAT) and self.spec == other.spec
+    @cached_hash
     def __hash__(self):
         return sum([hash(self.spec.parameters[mem].name) for mem in self.spec.parameters], 0)
 
 class VarCAT(CAT, CVar):
+    __slots__ = ()
     def __init__(self, name):
         global name_counter
         if name is None:
@@ -27,8 +27,19 @@ class CheckRemover(copy_visitor.CopyVisitor):
     # and dispatch_statements methods), we look for Tombstone values
     # and filter them out. Tombstones should NEVER exist in the final
     # outputted AST.
+    #
+    # Checks on values whose types depend on variables that the solver
+    # gave up on (the keys of unsolved, which maps them to the reason)
+    # get the same result as from check_optimizer.CheckRemover: usage
+    # checks, which only exist for the sake of the solution, are
+    # dropped, and other checks are kept.
 
     examine_functions = True
+
+    def __init__(self, unsolved=None):
+        super().__init__()
+        self.unsolved = {} if unsolved is None else unsolved
+        self.function = None
     
     def reduce(self, ns, *args):
         lst = [self.dispatch(n, *args) for n in ns]
@@ -71,7 +82,18 @@ class CheckRemover(copy_visitor.CopyVisitor):
         
         rty = n.type
         cty = subst(n.value.retic_ctype, sol)
-        _, matchcode = ctypes.match(cty, rty, ctbl)
+        reasons = [self.unsolved[v] for v in cty.free_vars() if v in self.unsolved]
+        if reasons:
+            if isinstance(n, retic_ast.UseCheck):
+                return val
+            print('#Falling back at line {} in {} ({})'.format(n.lineno, self.function.name if self.function else 'module', reasons[0]))
+            return cx(value=val, type=n.type, lineno=n.lineno, col_offset=n.col_offset)
+        try:
+            _, matchcode = ctypes.match(cty, rty, ctbl)
+        except KeyError:
+            # The solution refers to a class that isn't in the class
+            # table, e.g. one imported from another module
+            matchcode = ctypes.PENDING
         if matchcode == ctypes.CONFIRM:
             if not isinstance(n, retic_ast.UseCheck):
                 print('#Losing check at line {} ({}:{} ~ {})'.format(n.lineno, n.value.retic_ctype, cty, rty))
@@ -94,6 +116,12 @@ class CheckRemover(copy_visitor.CopyVisitor):
         else: raise Exception()
         
     
+    def visitFunctionDef(self, n, *args):
+        function, self.function = self.function, n
+        ret = super().visitFunctionDef(n, *args)
+        self.function = function
+        return ret
+
     def visitProtCheck(self, n, *args):
         return self.visitcheck_generic(retic_ast.ProtCheck, n, *args)
 
@@ -1,12 +1,20 @@
 from .constraints import *
 from .ctypes import *
 from . import cgen_helpers
-from .. import retic_ast, exc
+from .. import retic_ast, exc, flags
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import heapq, pickle, io, ast, multiprocessing, threading, sys, time
 
 class BailOut(Exception): pass
 
+# Raised when solving a component exceeds one of the budgets set in
+# flags (see check_budget)
+class OverBudget(BailOut): pass
+
 linked = set()
 passed = set()
+joins = {}
 
         
 
@@ -50,24 +58,285 @@ class Link:
         s += ('\n>>Subclass bounds:' +  str(self.subclass_bounds) + '\n')
         return s
 
-def setup_link(dct, k):
-    if k not in dct:
-        l = Link()
-        dct[k] = l
-        return l
-    else:
-        return dct[k]
+class Links:
+    """
+    The bounds of every constraint variable, kept in a union-find
+    structure over the equivalence classes that EqC constraints between
+    two CVars induce. Only the representative of each class owns a
+    Link, so a chain of equalities never copies bounds more than once
+    per union, and every member of a class sees the same bounds.
+    Iterating over a Links yields every variable, in the order in which
+    they were first seen.
+    """
+    def __init__(self):
+        self.parent = {}
+        self.rank = {}
+        self.links = {}
+    def find(self, var):
+        root = var
+        while self.parent[root] is not root:
+            root = self.parent[root]
+        while var is not root:
+            self.parent[var], var = root, self.parent[var]
+        return root
+    def setup(self, var):
+        if var not in self.parent:
+            self.parent[var] = var
+            self.rank[var] = 0
+            self.links[var] = Link()
+        return self.links[self.find(var)]
+    def union(self, l, r):
+        self.setup(l)
+        self.setup(r)
+        l, r = self.find(l), self.find(r)
+        if l is r:
+            return
+        if self.rank[l] < self.rank[r]:
+            l, r = r, l
+        elif self.rank[l] == self.rank[r]:
+            self.rank[l] += 1
+        self.parent[r] = l
+        self.links[l].merge(self.links.pop(r))
+    def __getitem__(self, var):
+        return self.links[self.find(var)]
+    def __contains__(self, var):
+        return var in self.parent
+    def __iter__(self):
+        return iter(self.parent)
+    def __len__(self):
+        return len(self.parent)
+    def __repr__(self):
+        return '\n'.join('{}: {}'.format(var, self[var]) for var in self)
 
 def solve_vars(constraints, ctbl):
+    """
+    Solve a constraint system. The system is split into independent
+    components (see partition), and if flags.JOBS allows it, large
+    components are solved in forked worker processes while the rest
+    are solved here. Returns a DefC for every variable of the
+    components that could be solved, and a dictionary mapping the
+    variables of the components that could not be solved (or that
+    went over budget) to the reason why.
+    """
+    global forked, deadline
+    deadline = None if flags.SOLVE_TIME_BUDGET is None else time.monotonic() + flags.SOLVE_TIME_BUDGET
+    components = partition(constraints, ctbl)
+    large = [comp for comp in components if len(comp) >= PARALLEL_COMPONENT_SIZE]
+    if flags.JOBS < 2 or len(large) < 2 or not can_fork():
+        large = []
+    small = [comp for comp in components if not any(comp is lcomp for lcomp in large)]
+    solved = []
+    unsolved = {}
+    # Any exception from a component, not just a BailOut, only leaves
+    # that component unsolved
+    def give_up(comp, ex):
+        if isinstance(ex, OverBudget):
+            reason = ex.args[0]
+        elif isinstance(ex, BailOut):
+            reason = 'could not solve {}'.format(' '.join(str(arg) for arg in ex.args))
+        else: reason = 'could not solve: {}: {}'.format(type(ex).__name__, ex)
+        unsolved.update((v, reason) for c in comp for ty in c.types() for v in ty.free_vars())
+    if not large:
+        for comp in small:
+            try:
+                solved += solve_component(comp, ctbl)
+            except Exception as ex:
+                give_up(comp, ex)
+    else:
+        # The workers inherit the components and the class table when
+        # they are forked
+        forked = large, ctbl, shared_objects(large, ctbl)
+        try:
+            with fork_pool(min(flags.JOBS, len(large))) as pool:
+                futures = [pool.submit(solve_forked, i) for i in range(len(large))]
+                for comp in small:
+                    try:
+                        solved += solve_component(comp, ctbl)
+                    except Exception as ex:
+                        give_up(comp, ex)
+                for comp, future in zip(large, futures):
+                    try:
+                        result = future.result()
+                    except Exception as ex:
+                        give_up(comp, ex)
+                        continue
+                    csolved, inherits = SharedUnpickler(io.BytesIO(result), forked[2]).load()
+                    solved += csolved
+                    for cls in inherits:
+                        ctbl[cls].inherits, ctbl[cls].dynamized = inherits[cls]
+        finally:
+            forked = None
+    substitute(ctbl, solved)
+    return list(reversed(solved)), unsolved
+
+def solve_component(constraints, ctbl):
     global linked
     global passed
+    global joins
+    global rounds
     linked = set()
     passed = set()
-    links = {}
+    joins = {}
+    rounds = 0
+    links = Links()
     initialize(links, constraints, ctbl)
     #print('\n\n\nVariable links:', links, '\n\n')
-    solved = solve(links, ctbl)
-    return list(reversed(solved))
+    return solve(links, ctbl)
+
+def class_names(ty):
+    if isinstance(ty, CInstance):
+        return {ty.instanceof}
+    elif isinstance(ty, CClass):
+        return {ty.name}
+    elif isinstance(ty, CForAll):
+        return class_names(ty.ty)
+    elif isinstance(ty, CIntersection):
+        return set().union(*[class_names(t) for t in ty.types])
+    else:
+        return set().union(*[class_names(t) for t in ty.parts({})])
+
+def partition(constraints, ctbl):
+    """
+    Split constraints into components that can be solved
+    independently. Constraints are in the same component if they
+    (transitively) share a variable or a class, and each class is
+    connected to the variables and classes in its members and fields
+    and to the classes that it inherits from. Constraints that mention
+    neither are put together in one component.
+    """
+    parent = {}
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    def connect(nodes):
+        nodes = iter(nodes)
+        root = find(next(nodes))
+        for node in nodes:
+            other = find(node)
+            if other != root:
+                parent[other] = root
+
+    for cls in ctbl:
+        entry = ctbl[cls]
+        tys = list(entry.members.values()) + list(entry.fields.values())
+        connect([cls] + entry.inherits + [v for ty in tys for v in ty.free_vars()] + [c for ty in tys for c in class_names(ty)])
+
+    firsts = []
+    for c in constraints:
+        nodes = [v for ty in c.types() for v in ty.free_vars()] + [cls for ty in c.types() for cls in class_names(ty)]
+        if isinstance(c, InheritsC):
+            nodes.append(c.cls)
+        if nodes:
+            connect(nodes)
+        firsts.append((c, nodes[0] if nodes else None))
+
+    components = {}
+    for c, first in firsts:
+        components.setdefault(None if first is None else find(first), []).append(c)
+    return list(components.values())
+
+# Components with fewer constraints than this are always solved in
+# the main process, since forking and pickling would cost more than
+# solving them
+PARALLEL_COMPONENT_SIZE = 500
+
+# When solving the current module has to stop (per flags.SOLVE_TIME_BUDGET),
+# and how many times initialize has run for the current component
+deadline = None
+rounds = 0
+
+def check_budget(size=0):
+    # Gives up on the current component if the module is out of time,
+    # or if the component has grown to more than size constraints
+    if deadline is not None and time.monotonic() > deadline:
+        raise OverBudget('time budget of {}s exceeded'.format(flags.SOLVE_TIME_BUDGET))
+    if flags.SOLVE_SIZE_BUDGET is not None and size > flags.SOLVE_SIZE_BUDGET:
+        raise OverBudget('size budget of {} constraints exceeded'.format(flags.SOLVE_SIZE_BUDGET))
+
+# The components, class table and shared objects that solve_vars
+# hands to its forked workers
+forked = None
+
+def can_fork()->bool:
+    # Workers have to be forked to inherit `forked`, which we don't do
+    # if the program asked for another start method, or while other
+    # threads (such as daemon.py's watcher) are running, since a forked
+    # child only gets the calling thread and may deadlock on locks the
+    # others held. Asking doesn't fix the start method, unlike
+    # get_start_method() without allow_none.
+    return threading.active_count() == 1 and 'fork' in multiprocessing.get_all_start_methods() and \
+        multiprocessing.get_start_method(allow_none=True) in [None, 'fork']
+
+def fork_pool(workers:int)->ProcessPoolExecutor:
+    if sys.version_info >= (3, 7):
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+    # Before 3.7, the pool always uses (and fixes) the default start
+    # method, which is fork wherever it's available
+    return ProcessPoolExecutor(max_workers=workers)
+
+def shared_objects(components, ctbl):
+    """
+    Find the variables and AST nodes (parameter defaults) that
+    solutions computed by forked workers may refer to. Workers pickle
+    these by id, which is the same in the worker as in the parent, so
+    that their identity is preserved.
+    """
+    shared = {}
+    seen = set()
+    stack = [ty for comp in components for c in comp for ty in c.types()]
+    for cls in ctbl:
+        stack += list(ctbl[cls].members.values()) + list(ctbl[cls].fields.values())
+    while stack:
+        ty = stack.pop()
+        if id(ty) in seen:
+            continue
+        seen.add(id(ty))
+        if isinstance(ty, CVar):
+            shared[id(ty)] = ty
+        elif isinstance(ty, CVarBind):
+            stack.append(ty.var)
+        elif isinstance(ty, CForAll):
+            stack += [ty.var, ty.ty]
+        elif isinstance(ty, CIntersection):
+            stack += ty.types
+        elif isinstance(ty, CFunction):
+            stack += [ty.froms, ty.to]
+        elif isinstance(ty, SpecCAT):
+            for param in ty.spec.parameters.values():
+                stack.append(param.annotation)
+                if isinstance(param.default, ast.AST):
+                    shared[id(param.default)] = param.default
+        else:
+            stack += ty.parts({})
+    return shared
+
+class SharedPickler(pickle.Pickler):
+    def __init__(self, file, shared):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.shared = shared
+    def persistent_id(self, obj):
+        if self.shared.get(id(obj)) is obj:
+            return id(obj)
+        return None
+
+class SharedUnpickler(pickle.Unpickler):
+    def __init__(self, file, shared):
+        super().__init__(file)
+        self.shared = shared
+    def persistent_load(self, pid):
+        return self.shared[pid]
+
+def solve_forked(i):
+    # Runs in a worker process
+    components, ctbl, shared = forked
+    solved = solve_component(components[i], ctbl)
+    inherits = {c.cls: (ctbl[c.cls].inherits, ctbl[c.cls].dynamized) for c in components[i] if isinstance(c, InheritsC)}
+    buf = io.BytesIO()
+    SharedPickler(buf, shared).dump((solved, inherits))
+    return buf.getvalue()
 
 def unsolvable(ctbl):
     return set(sum([c.r.vars(ctbl) for c in anormal_constraints if isinstance(c, CheckC)], []))
@@ -94,13 +363,14 @@ def iter_unbind(l, n):
 
 
 def initialize(links, constraints, ctbl):
+    global rounds
+    rounds += 1
+    if flags.SOLVE_ROUND_BUDGET is not None and rounds > flags.SOLVE_ROUND_BUDGET:
+        raise OverBudget('round budget of {} exceeded'.format(flags.SOLVE_ROUND_BUDGET))
     var_constraints = []
     type_constraints = []
     #print('Our Constraints', constraints)
-    oc = None
-    while oc != constraints:
-        oc = constraints
-        constraints = decompose(constraints, ctbl)
+    constraints = normalize(constraints, ctbl)
     #print('Simpl Constraints', constraints)
 
 
@@ -110,11 +380,11 @@ def initialize(links, constraints, ctbl):
                 if isinstance(c.l, CVar) or isinstance(c.u, CVar) or isinstance(c.l, CVarBind) or isinstance(c.u, CVarBind):
                     if isinstance(c.l, CVar) or isinstance(c.l, CVarBind):
                         v, n = unbinds_needed(c.l)
-                        link = setup_link(links, v)
+                        link = links.setup(v)
                         link.upper_bounds.add((c.u, n))
                     if isinstance(c.u, CVar) or isinstance(c.u, CVarBind):
                         v, n = unbinds_needed(c.u)
-                        link = setup_link(links, v)
+                        link = links.setup(v)
                         link.lower_bounds.add((c.l, n))
                 elif c.vars(ctbl):
                     var_constraints.append(c)
@@ -124,18 +394,15 @@ def initialize(links, constraints, ctbl):
             if c.l != c.r:
                 if isinstance(c.l, CVar) or isinstance(c.r, CVar) or isinstance(c.l, CVarBind) or isinstance(c.r, CVarBind):
                     if isinstance(c.l, CVar) and isinstance(c.r, CVar):
-                        linkl = setup_link(links, c.l)
-                        linkr = setup_link(links, c.r)
-                        linkl.merge(linkr)
-                        links[c.r] = linkl
+                        links.union(c.l, c.r)
 
                     if isinstance(c.l, CVar) or isinstance(c.l, CVarBind):
                         v, n = unbinds_needed(c.l)
-                        link = setup_link(links, v)
+                        link = links.setup(v)
                         link.equal_bounds.add((c.r, n))
                     if isinstance(c.r, CVar) or isinstance(c.r, CVarBind):
                         v, n = unbinds_needed(c.r)
-                        link = setup_link(links, v)
+                        link = links.setup(v)
                         link.equal_bounds.add((c.l, n))
                 elif c.vars(ctbl):
                     var_constraints.append(c)
@@ -145,7 +412,7 @@ def initialize(links, constraints, ctbl):
             if c.l != c.r:
                 if isinstance(c.l, CVar) or isinstance(c.l, CVarBind):
                     v, n = unbinds_needed(c.l)
-                    link = setup_link(links, v)
+                    link = links.setup(v)
                     link.check_bounds.add(((c.r, c.s), n))
                 elif c.vars(ctbl):
                     var_constraints.append(c)
@@ -156,19 +423,19 @@ def initialize(links, constraints, ctbl):
             if isinstance(c.lo, CVar) or isinstance(c.lo, CVarBind):
                 varfound = True
                 v, n = unbinds_needed(c.lo)
-                link = setup_link(links, v)
+                link = links.setup(v)
                 link.op_upper_bounds.add(((LEFT, c), n))
             if isinstance(c.ro, CVar) or isinstance(c.ro, CVarBind):
                 varfound = True
                 v, n = unbinds_needed(c.ro)
-                link = setup_link(links, v)
+                link = links.setup(v)
                 link.op_upper_bounds.add(((RIGHT, c), n))
             if not varfound:
                 raise exc.InternalReticulatedError()
         elif isinstance(c, UnopSTC):
             if isinstance(c.lo, CVar) or isinstance(c.lo, CVarBind):
                 v, n = unbinds_needed(c.lo)
-                link = setup_link(links, v)
+                link = links.setup(v)
                 link.op_upper_bounds.add(((UN, c), n))
             else: 
                 raise exc.InternalReticulatedError()
@@ -181,21 +448,21 @@ def initialize(links, constraints, ctbl):
                     cls.dynamized = True
                 elif isinstance(sup, CVar) or isinstance(sup, CVarBind):
                     v, n = unbinds_needed(sup)
-                    link = setup_link(links, v)
+                    link = links.setup(v)
                     link.subclass_bounds.add((c.cls, n))
                 else:
                     raise Exception(c)
         elif isinstance(c, InstanceSTC):
             if isinstance(c.lc, CVar) or isinstance(c.lc, CVarBind):
                 v, n = unbinds_needed(c.lc)
-                link = setup_link(links, v)
+                link = links.setup(v)
                 link.inst_upper_bounds.add((c.u, n))
             else:
                 raise Exception(c)
         elif isinstance(c, EltSTC):
             if isinstance(c.lc, CVar) or isinstance(c.lc, CVarBind):
                 v, n = unbinds_needed(c.lc)
-                link = setup_link(links, v)
+                link = links.setup(v)
                 link.elt_upper_bounds.add((c.u, n))
             else:
                 raise Exception(c)
@@ -272,6 +539,7 @@ def initialize(links, constraints, ctbl):
         #     print ('\tcb', all_bounds(var, 'check_bounds', links))
         #     print ('\teq', all_bounds(var, 'equal_bounds', links), flush=True)
         for var in links:
+            check_budget()
             int_passed = False
             int_dynamized = False
             for i, n in all_bounds(var, bstring, links):
@@ -465,6 +733,7 @@ def all_bounds(var, bound, links):
 def solve(links, ctbl):
     solved = []
     for var in links:
+        check_budget()
         vlb = all_bounds(var, 'lower_bounds', links)
         veq = all_bounds(var, 'equal_bounds', links)
         jtys = [v for v in (vlb | veq) if not isinstance(v[0], CVar) and not isinstance(v[0], CVarBind)]
@@ -473,10 +742,40 @@ def solve(links, ctbl):
         all2 = [v for v in veq]
         #print('solved', var, 'at', jty, 'with', (vlb | veq))
         solved.append(DefC(var, jty))
-        [ctbl[cls].subst(var, jty) for cls in ctbl]
     #print(ctbl)
     return solved
 
+def substitute(ctbl, solved):
+    """
+    Substitute the solutions in solved (a list of DefCs, in the order
+    that the variables were solved) into every class in ctbl. The
+    result is the same as substituting each solution into the whole
+    table in turn, but each member and field only substitutes the
+    variables that actually occur in it (or in the solutions
+    substituted into it), in solution order.
+    """
+    order = {c.l: i for i, c in enumerate(solved)}
+    for cls in ctbl.values():
+        sols = {}
+        def resolve(ty):
+            pending = [order[v] for v in ty.free_vars() if v in order]
+            heapq.heapify(pending)
+            done = set()
+            while pending:
+                i = heapq.heappop(pending)
+                if i in done:
+                    continue
+                done.add(i)
+                if i not in sols:
+                    sols[i] = solved[i].r.subst(CInstance(cls.name), cls.tyvar)
+                ty = ty.subst(solved[i].l, sols[i])
+                for v in sols[i].free_vars():
+                    if order.get(v, -1) > i:
+                        heapq.heappush(pending, order[v])
+            return ty
+        cls.members = {mem: resolve(cls.members[mem]) for mem in cls.members}
+        cls.fields = {fld: resolve(cls.fields[fld]) for fld in cls.fields}
+
 def unbind(ty):
     if isinstance(ty, CFunction):
         if isinstance(ty.froms, PosCAT):
@@ -504,6 +803,17 @@ def unbind(ty):
         return ty
 
 def join(ntys):
+    # Joins that don't introduce new variables are shared between all
+    # the variables being solved
+    key = tuple(ntys)
+    if key in joins:
+        return joins[key]
+    ret = join_types(ntys)
+    if not ret.free_vars() and not any(isinstance(ty, CForAll) for ty, n in ntys):
+        joins[key] = ret
+    return ret
+
+def join_types(ntys):
     tys = [((ty if not isinstance(ty, CForAll) else ty.instanciate()), n) for ty, n in ntys if not isinstance(ty, CBot)]
     if len(tys) == 0:
         return CDyn()
@@ -681,11 +991,11 @@ def transitive(constraints, ctbl, used):
 
 
 
-def decompose_bivariant(constraints, c, l, r, ctbl, sym):
+def decompose_bivariant(unsolved, c, l, r, ctbl, sym):
     if isinstance(l, CStructural) and not any(isinstance(r, ty) for ty in [CClass, CInstance, CStructural]):
-        return decompose_bivariant(constraints, c, l, CStructural(r.fields()), ctbl, sym)
+        return decompose_bivariant(unsolved, c, l, CStructural(r.fields()), ctbl, sym)
     if isinstance(r, CStructural) and not any(isinstance(l, ty) for ty in [CClass, CInstance, CStructural]):
-        return decompose_bivariant(constraints, c, CStructural(l.fields()), r, ctbl, sym)
+        return decompose_bivariant(unsolved, c, CStructural(l.fields()), r, ctbl, sym)
 
     ret = []
     assert not (isinstance(r, CVar) or isinstance(r, CDyn) or isinstance(r, CFunction)), (l, r)
@@ -719,12 +1029,12 @@ def decompose_bivariant(constraints, c, l, r, ctbl, sym):
             ret += [STC(CInt(), r.keys)] + [EqC(elt, l.elts) for elt in r.elts]
         else: raise BailOut(l, sym, r)
     elif isinstance(r, CInstance):
-        if unsolvable_inherits(r, constraints):
+        if unsolvable_inherits(r, unsolved):
             ret.append(c)
         elif isinstance(l, CVoid):
             pass
         elif isinstance(l, CInstance):
-            if unsolvable_inherits(l, constraints):
+            if unsolvable_inherits(l, unsolved):
                 ret.append(c)
             elif r.instanceof in ctbl[l.instanceof].superclasses(ctbl):
                 pass
@@ -739,12 +1049,12 @@ def decompose_bivariant(constraints, c, l, r, ctbl, sym):
         if isinstance(l, CStructural):
             ret += [EqC(l.members[mem], r.members[mem]) for mem in l.members if mem in r.members]
         elif isinstance(l, CInstance):
-            if unsolvable_inherits(l, constraints):
+            if unsolvable_inherits(l, unsolved):
                 ret.append(c)
             cls = ctbl[l.instanceof]
             ret += [EqC(cls.instance_lookup(mem, ctbl), r.members[mem]) for mem in r.members if cls.instance_supports(mem, ctbl)]
         elif isinstance(l, CClass):
-            if unsolvable_inherits(l, constraints):
+            if unsolvable_inherits(l, unsolved):
                 ret.append(c)
             cls = ctbl[l.name]
             ret += [EqC(cls.lookup(mem, ctbl), r.members[mem]) for mem in r.members if cls.supports(mem, ctbl)]
@@ -779,11 +1089,43 @@ def decompose_bivariant(constraints, c, l, r, ctbl, sym):
     else: raise BailOut(l, sym, r)
     return ret
 
-def unsolvable_inherits(ty, constraints):
-    us = [c.cls for c in constraints if isinstance(c, InheritsC)]
-    return (isinstance(ty, CClass) and ty.name in us) or (isinstance(ty, CInstance) and ty.instanceof in us) 
+def unsolvable_inherits(ty, unsolved):
+    # unsolved holds the names of the classes whose superclasses are
+    # still unknown
+    return (isinstance(ty, CClass) and ty.name in unsolved) or (isinstance(ty, CInstance) and ty.instanceof in unsolved)
+
+def normalize(constraints, ctbl):
+    """
+    Decompose the constraints until they can't be decomposed any
+    further. Constraints only affect each other's decomposition through
+    the inheritance constraints of classes whose superclasses are not
+    known yet, and those are decomposed first, after which the
+    remaining ones never change. The rest are run through a worklist,
+    so each distinct constraint is decomposed once, and the ones that
+    decompose into themselves make up the result.
+    """
+    inherits = [c for c in constraints if isinstance(c, InheritsC)]
+    ret = decompose(inherits, ctbl, {c.cls for c in inherits})
+    unsolved = {c.cls for c in ret}
+
+    seen = set()
+    worklist = deque()
+    for c in constraints:
+        if not isinstance(c, InheritsC) and c not in seen:
+            seen.add(c)
+            worklist.append(c)
+    while worklist:
+        check_budget(len(ret) + len(worklist))
+        c = worklist.popleft()
+        for d in decompose([c], ctbl, unsolved):
+            if d == c:
+                ret.append(c)
+            elif d not in seen:
+                seen.add(d)
+                worklist.append(d)
+    return ret
 
-def decompose(constraints, ctbl):
+def decompose(constraints, ctbl, unsolved):
     ret = []
     for c in constraints:
         if isinstance(c, InstanceSTC):
@@ -839,7 +1181,7 @@ def decompose(constraints, ctbl):
         elif isinstance(c, BinopSTC):
             if not isinstance(c.lo, CVar) and not isinstance(c.ro, CVar) and \
                not isinstance(c.lo, CVarBind) and not isinstance(c.ro, CVarBind) and \
-               not unsolvable_inherits(c.lo, constraints) and not unsolvable_inherits(c.ro, constraints):
+               not unsolvable_inherits(c.lo, unsolved) and not unsolvable_inherits(c.ro, unsolved):
                 sol, sp = binop_solve(c.lo, c.op, c.ro, ctbl)
                 ret.append(STC(sol, c.u))
                 ret += sp
@@ -863,7 +1205,7 @@ def decompose(constraints, ctbl):
                 if c.u is not c.l:
                     ret.append(c)
             elif isinstance(c.u, CInstance) and isinstance(c.l, CInstance):
-                if unsolvable_inherits(c.u, constraints) or unsolvable_inherits(c.l, constraints):
+                if unsolvable_inherits(c.u, unsolved) or unsolvable_inherits(c.l, unsolved):
                     ret.append(c)
                 if c.u.instanceof in ctbl[c.l.instanceof].superclasses(ctbl):
                     pass
@@ -910,7 +1252,7 @@ def decompose(constraints, ctbl):
                 elif isinstance(c.l, CInstance):
                     pass
                 elif isinstance(c.l, CClass):
-                    if unsolvable_inherits(c.l, constraints):
+                    if unsolvable_inherits(c.l, unsolved):
                         ret.append(c)
                         continue
                     def st_dyn_class(cls):
@@ -1036,7 +1378,7 @@ def decompose(constraints, ctbl):
                                 else: raise BailOut(c)
                         else: raise BailOut(c)
                 else: raise BailOut(c)
-            else: ret += decompose_bivariant(constraints, c, c.l, c.u, ctbl, '<:')
+            else: ret += decompose_bivariant(unsolved, c, c.l, c.u, ctbl, '<:')
         elif isinstance(c, EqC):
             if isinstance(c.r, CVar) or isinstance(c.r, CVarBind):
                 if c.r is not c.l:
@@ -1135,7 +1477,7 @@ def decompose(constraints, ctbl):
                             ret.append(EqC(CDyn(), r.annotation))
                     else: raise BailOut(c)
                 elif isinstance(c.l, CClass):
-                    if unsolvable_inherits(c.l, constraints):
+                    if unsolvable_inherits(c.l, unsolved):
                         ret.append(c)
                         continue
                     if ctbl[c.l.name].supports('__init__', ctbl):
@@ -1143,9 +1485,9 @@ def decompose(constraints, ctbl):
                         ret.append(EqC(init, c.r))
                     else: raise BailOut(c)
                 else: raise BailOut(c)
-            else: ret += decompose_bivariant(constraints, c, c.l, c.r, ctbl, '=')
+            else: ret += decompose_bivariant(unsolved, c, c.l, c.r, ctbl, '=')
         elif isinstance(c, CheckC):
-            if unsolvable_inherits(c.l, constraints):
+            if unsolvable_inherits(c.l, unsolved):
                 ret.append(c)
                 continue
 
@@ -39,7 +39,36 @@ class TypeLocalizer(visitors.InPlaceVisitor):
 
     def visitCheck(self, n, env):
         super().visitCheck(n, env)
-        if isinstance(n.type, retic_ast.Instance) and n.type.instanceof in env:
-            n.type = retic_ast.OutputAlias(env[n.type.instanceof], n.type)
-        elif isinstance(n.type, retic_ast.Class) and n.type in env:
-            n.type = retic_ast.ClassOutputAlias(env[n.type], n.type)
+        n.type = localize(n.type, env)
+
+def localize(ty, env):
+    if isinstance(ty, retic_ast.Instance) and ty.instanceof in env:
+        return retic_ast.OutputAlias(env[ty.instanceof], ty)
+    elif isinstance(ty, retic_ast.Class) and ty in env:
+        return retic_ast.ClassOutputAlias(env[ty], ty)
+    else: return ty
+
+class LocalizingCompiler:
+    # Mixin for check compilers (which are CopyVisitors) that does the
+    # work of TypeLocalizer on the way down, so that localization
+    # doesn't need a traversal of its own. See passes.py.
+
+    def visitModule(self, n):
+        return super().visitModule(n, TypeLocalityFinder().preorder(n))
+
+    def visitClassDef(self, n, env):
+        env = env.copy()
+        env.update(TypeLocalityFinder().preorder(n))
+        return super().visitClassDef(n, env)
+
+    def visitCheck(self, n, env):
+        # Compilers may hand ProtChecks to visitCheck too, but
+        # TypeLocalizer leaves those alone
+        if isinstance(n, retic_ast.Check):
+            n.type = localize(n.type, env)
+        return super().visitCheck(n, env)
+
+    def check_type(self, n, env):
+        if isinstance(n, retic_ast.Check):
+            n.type = localize(n.type, env)
+        return super().check_type(n, env)
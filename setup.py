@@ -2,7 +2,7 @@
 
 from setuptools import setup, find_packages
 
-version = '0.1.0'
+version = '0.1.1'
 description = 'Static and runtime typechecking for Python'
 url='https://github.com/mvitousek/reticulated'
 long_description = '''
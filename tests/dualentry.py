@@ -0,0 +1,12 @@
+def f(x:int)->int:
+    return x + 1
+
+def typed(n:int)->int:
+    return f(n)
+
+def untyped(v):
+    return f(v)
+
+print(typed(1))
+print(untyped(2))
+untyped('a')
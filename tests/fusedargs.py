@@ -0,0 +1,9 @@
+def f(x:int, y:str, z:float)->str:
+    return y * x
+
+def call(g, *args):
+    return g(*args)
+
+print(call(f, 2, 'ab', 1.5))
+print(call(f, 1, 'c', 2))
+call(f, 1, 2, 2.0)
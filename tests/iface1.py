@@ -0,0 +1,14 @@
+import ifacelib1
+
+def total(xs:List(int))->int:
+    s = 0
+    for x in ifacelib1.apply(ifacelib1.f, xs):
+        s = s + x
+    return s
+
+def call(h, v):
+    return h(v)
+
+print(total([1, 2, 3]))
+print(ifacelib1.scale)
+call(ifacelib1.f, 'a')
@@ -0,0 +1,3 @@
+import ifacelib2
+
+print(ifacelib2.f(1))
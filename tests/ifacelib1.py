@@ -0,0 +1,10 @@
+scale = 2
+
+def f(x:int)->int:
+    return x * scale
+
+def apply(k:Callable[[int], int], xs:List(int))->List(int):
+    ys = []
+    for x in xs:
+        ys.append(k(x))
+    return ys
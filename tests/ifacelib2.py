@@ -0,0 +1,5 @@
+def f(x:int)->int:
+    return x + 1
+
+def g(x:int)->str:
+    return x
@@ -0,0 +1,27 @@
+@fields({'x':int})
+class C:
+    def __init__(self, x):
+        self.x = x
+
+def total(o:C, n:int)->int:
+    s = 0
+    i = 0
+    while i < n:
+        s = s + o.x
+        i = i + 1
+    return s
+
+def loop(o:C, l:List(int), n:int)->int:
+    s = 0
+    for i in range(n):
+        s = s + o.x + l[0]
+    return s
+
+def call(h, *args):
+    return h(*args)
+
+print(call(total, C(1), 3))
+print(call(total, C('a'), 0))
+print(call(loop, C(1), [1], 3))
+print(call(loop, C('a'), [1], 0))
+call(loop, C('a'), [1], 2)
@@ -0,0 +1,53 @@
+import unittest
+import sys, os, subprocess, tempfile, shutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def retic(dir, *args, program='prog.py', **env):
+    """
+    Run retic.py with the given arguments on program (if not None) in
+    dir, and return everything it printed. Imports aren't cached unless
+    RETIC_CACHE_DIR is given; other keyword arguments are added to the
+    environment as well.
+    """
+    env = dict(os.environ, **dict({'RETIC_CACHE_DIR': ''}, **env))
+    cmd = [sys.executable, os.path.join(ROOT, 'retic.py')] + list(args) + ([program] if program else [])
+    return subprocess.run(cmd, cwd=dir, env=env, stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT).stdout.decode('utf-8')
+
+def write(dir, files):
+    for name, text in files.items():
+        path = os.path.join(dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+def retic_once(files, *args, **kwargs):
+    """
+    Like retic, but in a temporary directory holding files, which maps
+    file names to their contents.
+    """
+    dir = tempfile.mkdtemp()
+    try:
+        write(dir, files)
+        return retic(dir, *args, **kwargs)
+    finally:
+        shutil.rmtree(dir)
+
+class ProgramTestCase(unittest.TestCase):
+    # Tests that run Reticulated on programs. Every test gets a fresh
+    # directory holding FILES, which maps file names to their contents.
+    FILES = {}
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.write(self.FILES)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, files):
+        write(self.dir, files)
+
+    def retic(self, *args, **kwargs):
+        return retic(self.dir, *args, **kwargs)
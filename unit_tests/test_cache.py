@@ -0,0 +1,51 @@
+import unittest
+import os
+
+from retic import cache, flags
+from unit_tests import ProgramTestCase
+
+class TestCache(ProgramTestCase):
+    FILES = {'lib.py': 'def f(x:int)->int:\n    return x + 1\n',
+             'prog.py': 'import lib\nprint(lib.f(1))\n'}
+
+    def setUp(self):
+        super().setUp()
+        self.saved = flags.INLINE_CHECKS, cache.REMEMBERED, list(cache.remembered.items())
+
+    def tearDown(self):
+        flags.INLINE_CHECKS, cache.REMEMBERED, remembered = self.saved
+        cache.remembered.clear()
+        cache.remembered.update(remembered)
+        super().tearDown()
+
+    def test_keys(self):
+        key = cache.source_key('prog.py', b'x = 1', False)
+        assert key == cache.source_key('prog.py', b'x = 1', False)
+        assert key != cache.source_key('prog.py', b'x = 2', False)
+        assert key != cache.source_key('prog.py', b'x = 1', True)
+        flags.INLINE_CHECKS = not flags.INLINE_CHECKS
+        assert key != cache.source_key('prog.py', b'x = 1', False)
+
+    def test_remembered(self):
+        cache.REMEMBERED = 2
+        cache.remembered.clear()
+        for name in 'abc':
+            cache._write(os.path.join(self.dir, name), name)
+        assert list(cache.remembered) == [os.path.join(self.dir, name) for name in 'bc']
+        assert cache._read(os.path.join(self.dir, 'a')) == 'a'
+        assert list(cache.remembered) == [os.path.join(self.dir, name) for name in 'ca']
+
+    def run_program(self):
+        return self.retic(RETIC_CACHE_DIR=os.path.join(self.dir, 'cache'))
+
+    def test_imports(self):
+        assert self.run_program().split('\n')[-2] == '2'
+        assert any(name.endswith('.retic') for name in os.listdir(os.path.join(self.dir, 'cache')))
+        assert self.run_program().split('\n')[-2] == '2'
+        # A changed interface is typechecked again
+        self.write({'lib.py': 'def f(x:str)->str:\n    return x\n'})
+        assert 'Static type error' in self.run_program()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import os
+
+from retic import opt_transient
+from unit_tests import ProgramTestCase
+
+PROGRAM = '''\
+def f(x:int)->int:
+    return x + 1
+
+def call(h, v):
+    return h(v)
+
+print(call(f, 1))
+call(f, 'a')
+'''
+
+class TestCheckLevels(ProgramTestCase):
+    FILES = {'prog.py': PROGRAM}
+
+    def setUp(self):
+        super().setUp()
+        self.saved = {var: os.environ.get(var) for var in ['RETIC_CHECK_LEVEL', 'RETIC_CHECK_LEVELS']}
+
+    def tearDown(self):
+        for var, value in self.saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else: os.environ[var] = value
+        super().tearDown()
+
+    def test_level(self):
+        os.environ.pop('RETIC_CHECK_LEVEL', None)
+        os.environ['RETIC_CHECK_LEVELS'] = 'pkg=off, pkg.mod=boundary, other=full'
+        assert opt_transient.__retic_check_level__('pkg') == 'off'
+        assert opt_transient.__retic_check_level__('pkg.sub') == 'off'
+        assert opt_transient.__retic_check_level__('pkg.mod.sub') == 'boundary'
+        assert opt_transient.__retic_check_level__('pkgs') == 'full'
+        os.environ['RETIC_CHECK_LEVEL'] = 'off'
+        assert opt_transient.__retic_check_level__('pkgs') == 'off'
+        assert opt_transient.__retic_check_level__('other') == 'full'
+
+    def test_run(self):
+        # f's argument is checked at its boundary
+        assert self.retic('--check-levels', RETIC_CHECK_LEVEL='full').rstrip().endswith('Value a is not an integer')
+        assert self.retic('--check-levels', RETIC_CHECK_LEVEL='boundary').rstrip().endswith('Value a is not an integer')
+        assert self.retic('--check-levels', RETIC_CHECK_LEVEL='off').rstrip().endswith('TypeError: must be str, not int')
+
+
+if __name__ == '__main__':
+    unittest.main()
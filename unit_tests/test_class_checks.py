@@ -0,0 +1,56 @@
+import unittest
+import sys, ast
+
+sys.path.insert(0, '..')
+
+from retic import opt_transient, opt_check_compiler, retic_ast
+from retic.base_runtime_exception import NormalRuntimeError
+
+check = opt_transient.__retic_check_class__
+
+class A: pass
+class B(A): pass
+
+class TestClassChecks(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = opt_transient.ENABLE_EXCEPTHOOK
+        opt_transient.ENABLE_EXCEPTHOOK = False
+
+    def tearDown(self):
+        opt_transient.ENABLE_EXCEPTHOOK = self.saved
+
+    def test_subclass(self):
+        assert check(A, A) is A
+        assert check(B, A) is B
+
+    def test_not_subclass(self):
+        with self.assertRaises(NormalRuntimeError):
+            check(A, B)
+        with self.assertRaises(NormalRuntimeError):
+            check(int, A)
+
+    def test_not_class(self):
+        # Instances and non-class targets fail the check rather than
+        # raising TypeError
+        with self.assertRaises(NormalRuntimeError):
+            check(A(), A)
+        with self.assertRaises(NormalRuntimeError):
+            check(A, A())
+
+    def test_inline(self):
+        compiler = opt_check_compiler.CheckCompiler()
+        compiler.preorder(ast.Module(body=[]))
+        def inline(id):
+            val = ast.Name(id=id, ctx=ast.Load(), lineno=1, col_offset=0)
+            ty = ast.Name(id='A', ctx=ast.Load(), lineno=1, col_offset=0)
+            test = compiler.inline('__retic_check_class__', val, [ty], retic_ast.Class('A'), 1, 0)
+            return eval(compile(ast.Expression(body=test), '<check>', 'eval'),
+                        dict(vars(opt_transient), A=A, B=B, a=A()))
+        assert inline('B') is B
+        with self.assertRaises(NormalRuntimeError):
+            inline('a')
+
+
+if __name__ == '__main__':
+    unittest.main()
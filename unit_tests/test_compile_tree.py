@@ -0,0 +1,64 @@
+import unittest
+import sys, os, subprocess
+
+from unit_tests import ProgramTestCase, ROOT
+
+LIB = '''\
+def f(x:int)->int:
+    return x+1
+
+def g()->int:
+    return f(2)
+'''
+
+MAIN = '''\
+import lib
+
+def h(x):
+    return x
+
+print(lib.f(h('a')))
+'''
+
+class TestCompileTree(ProgramTestCase):
+    FILES = {'src/lib.py': LIB, 'src/main.py': MAIN}
+
+    def setUp(self):
+        super().setUp()
+        self.out = os.path.join(self.dir, 'out')
+
+    def compile(self, *args):
+        return self.retic(*(args + ('--compile-tree', 'src', 'out')), program=None)
+
+    def read(self, name):
+        with open(os.path.join(self.out, name)) as f:
+            return f.read()
+
+    def test_modules_checked_for_untyped_callers(self):
+        self.compile()
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        run = subprocess.run([sys.executable, 'main.py'], cwd=self.out, env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        assert run.returncode != 0
+        assert 'Value a is not an integer' in run.stdout.decode('utf-8')
+
+    def test_incremental(self):
+        assert 'Compiled 2 of 2' in self.compile()
+        assert 'Compiled 0 of 2' in self.compile()
+        # Changing an implementation only rebuilds its own module
+        self.write({'src/lib.py': LIB.replace('x+1', 'x+2')})
+        assert 'Compiled 1 of 2' in self.compile()
+        # Changing an interface also rebuilds the modules importing it
+        self.write({'src/lib.py': LIB + '\ndef k()->int:\n    return 1\n'})
+        assert 'Compiled 2 of 2' in self.compile()
+
+    def test_rebuild_when_flags_change(self):
+        assert 'Compiled 2 of 2' in self.compile('-n')
+        assert '__retic_isinstance__' not in self.read('lib.py')
+        assert 'Compiled 0 of 2' in self.compile('-n')
+        assert 'Compiled 2 of 2' in self.compile('-n', '--inline-checks')
+        assert '__retic_isinstance__' in self.read('lib.py')
+
+
+if __name__ == '__main__':
+    unittest.main()
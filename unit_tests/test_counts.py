@@ -0,0 +1,49 @@
+import unittest
+import sys, os, json, tempfile, shutil, threading
+
+sys.path.insert(0, '..')
+
+from retic import opt_transient
+from retic.base_runtime_exception import NormalRuntimeError
+
+class TestCounts(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.file = os.path.join(self.dir, 'metrics.json')
+        self.saved = os.environ.get('RETIC_CHECK_METRICS')
+        os.environ['RETIC_CHECK_METRICS'] = self.file
+        self.table = ('mod', [(1, 0, 'int'), (2, 4, 'str')], [0, 0], [0, 0])
+        opt_transient.__retic_site_tables__.append(self.table)
+        self.excepthook = opt_transient.ENABLE_EXCEPTHOOK
+        opt_transient.ENABLE_EXCEPTHOOK = False
+
+    def tearDown(self):
+        opt_transient.__retic_site_tables__.remove(self.table)
+        opt_transient.ENABLE_EXCEPTHOOK = self.excepthook
+        if self.saved is None:
+            del os.environ['RETIC_CHECK_METRICS']
+        else: os.environ['RETIC_CHECK_METRICS'] = self.saved
+        shutil.rmtree(self.dir)
+
+    def test_count(self):
+        executions, failures = self.table[2], self.table[3]
+        opt_transient.__retic_count_check__(executions, failures, 0, opt_transient.__retic_check_int__, 1)
+        with self.assertRaises(NormalRuntimeError):
+            opt_transient.__retic_count_check__(executions, failures, 1, opt_transient.__retic_check_str__, 1)
+        assert executions == [1, 1] and failures == [0, 1]
+
+    def test_concurrent_flushes(self):
+        threads = [threading.Thread(target=opt_transient.__retic_flush_counts__) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert os.listdir(self.dir) == ['metrics.json']
+        with open(self.file) as f:
+            sites = json.load(f)
+        assert [(site['module'], site['line']) for site in sites] == [('mod', 1), ('mod', 2)]
+
+
+if __name__ == '__main__':
+    unittest.main()
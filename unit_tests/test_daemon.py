@@ -0,0 +1,63 @@
+import unittest
+import sys, os, time, subprocess
+
+from retic import daemon
+from unit_tests import ProgramTestCase, ROOT
+
+class TestDaemon(ProgramTestCase):
+    FILES = {'lib.py': 'def f(x:int)->int:\n    return x\n',
+             'prog.py': 'import lib\nlib.f(1)\n'}
+
+    def setUp(self):
+        super().setUp()
+        self.socket = os.path.join(self.dir, 'retic.sock')
+        self.program = os.path.join(self.dir, 'prog.py')
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            try:
+                daemon.request(self.socket, 'stop')
+            except OSError:
+                self.server.kill()
+            self.server.wait()
+        super().tearDown()
+
+    def start(self, *args):
+        env = dict(os.environ, RETIC_CACHE_DIR=os.path.join(self.dir, 'cache'))
+        self.server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'retic.py')] + list(args) +
+                                       ['--daemon', self.socket], env=env, cwd=self.dir,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for _ in range(100):
+            if os.path.exists(self.socket):
+                return
+            time.sleep(0.05)
+        self.fail('daemon did not start')
+
+    def test_check(self):
+        self.start()
+        assert daemon.request(self.socket, 'check', self.program)['status'] == 'ok'
+        assert daemon.request(self.socket, 'check', self.program)['status'] == 'ok'
+        status = daemon.request(self.socket, 'status')['output']
+        assert '3 requests served' in status
+        assert daemon.NO_CACHE not in status
+        with open(self.program, 'w') as f:
+            f.write('import lib\nlib.f("a")\n')
+        assert daemon.request(self.socket, 'check', self.program)['status'] == 'error'
+
+    def test_no_cache_reported(self):
+        self.start('--no-cache')
+        assert daemon.request(self.socket, 'check', self.program)['status'] == 'ok'
+        assert daemon.NO_CACHE in daemon.request(self.socket, 'status')['output']
+
+
+    def test_not_a_socket(self):
+        # Only sockets are removed from the daemon's path
+        self.write({'retic.sock': 'data'})
+        assert 'Not a socket' in self.retic('--daemon', self.socket, program=None)
+        with open(self.socket) as f:
+            assert f.read() == 'data'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from unit_tests import ProgramTestCase
+
+PROGRAM = '''\
+def total(xs:List(int), k:int)->int:
+    s = 0
+    for x in xs:
+        s = s + x * k
+    return s
+
+def call(h, *args):
+    return h(*args)
+
+print(call(total, [1, 2], 3))
+call(total, [1, 'a'], 3)
+'''
+
+class TestFastLocals(ProgramTestCase):
+    FILES = {'prog.py': PROGRAM}
+
+    def test_compiled(self):
+        source = self.retic('-p')
+        body = source[source.index('def total'):source.index('def call')]
+        assert '__retic_fast_retic_check_int__ = __retic_check_int__' in body
+        assert '__retic_fast_retic_check_int__(x)' in body
+        # Helpers that a function uses at most once aren't rebound
+        assert '__retic_fast_' not in source[source.index('def call'):]
+
+    def test_run(self):
+        output = self.retic()
+        assert '\n9\n' in output
+        assert output.rstrip().endswith('Value a is not an integer')
+
+
+if __name__ == '__main__':
+    unittest.main()
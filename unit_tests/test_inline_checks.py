@@ -0,0 +1,40 @@
+import unittest
+
+from unit_tests import ProgramTestCase
+
+PROGRAM = '''\
+def f(x:int)->int:
+    return x + 1
+
+def g(y:str)->str:
+    return y * 2
+
+def first(z:List(int))->int:
+    return z[0]
+
+def call(h, v):
+    return h(v)
+
+print(call(f, 1))
+print(call(g, 'ab'))
+call(g, 2)
+'''
+
+class TestInlineChecks(ProgramTestCase):
+    FILES = {'prog.py': PROGRAM}
+
+    def test_compiled(self):
+        source = self.retic('--inline-checks', '-p')
+        assert '__retic_isinstance__(x, __retic_int__) else __retic_check_int__(x)' in source
+        assert '__retic_isinstance__(y, __retic_str__) else __retic_check_str__(y)' in source
+        # Only variables and constants are inlined
+        assert 'return __retic_check_int__(z[0])' in source
+
+    def test_run(self):
+        output = self.retic('--inline-checks')
+        assert '\n2\nabab\n' in output
+        assert output.rstrip().endswith('Value 2 is not a string')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from unit_tests import ProgramTestCase
+
+LIBRARY = '''\
+def f(x:int)->int:
+    return x + 1
+
+def g(x:int)->int:
+    return f(x) + f(x)
+'''
+
+PROGRAM = '''\
+import lib
+
+def call(h, v):
+    return h(v)
+
+print(call(lib.g, 1))
+call(lib.g, 'a')
+'''
+
+class TestOptimizeImports(ProgramTestCase):
+    FILES = {'lib.py': LIBRARY, 'prog.py': PROGRAM}
+
+    def test_optimized(self):
+        assert '2/4 checks remaining' not in self.retic('--check-stats')
+        # Only the library's return checks are removed, since its
+        # exports may be called with anything
+        output = self.retic('--check-stats', '--optimize-imports')
+        assert '2/4 checks remaining' in output
+        assert '\n4\n' in output
+        assert output.rstrip().endswith('Value a is not an integer')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import sys, os, re, tempfile, shutil
+
+sys.path.insert(0, '..')
+
+from retic import parallel, static, flags
+from unit_tests import ProgramTestCase
+
+LIB = '''\
+def f(x:int)->int:
+    return x * 2
+
+def never():
+    import bad
+    return bad.g()
+'''
+
+OTHER = '''\
+def h(x:int)->int:
+    return x + 1
+'''
+
+BAD = '''\
+def g()->int:
+    return 'a'
+'''
+
+PROGRAM = '''\
+import lib, other
+print(lib.f(1), other.h(3))
+'''
+
+class TestParallel(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.saved = [('USE_CACHE', flags.USE_CACHE)] + flags.codegen_flags()
+        self.settings = self.saved[1:] + [('USE_CACHE', False)]
+        self.path = [self.dir] + sys.path
+        for name, text in [('lib.py', LIB), ('other.py', OTHER), ('bad.py', BAD)]:
+            with open(os.path.join(self.dir, name), 'w') as f:
+                f.write(text)
+
+    def tearDown(self):
+        parallel.reset_worker(sys.path, self.saved)
+        shutil.rmtree(self.dir)
+
+    def test_components(self):
+        graph = {'a': {'b'}, 'b': {'c'}, 'c': {'b'}, 'd': set()}
+        assert parallel.components(graph) == [['b', 'c'], ['a'], ['d']]
+
+    def test_import_graph(self):
+        # Imports inside function bodies are only followed when the
+        # function's module is executed
+        with open(os.path.join(self.dir, 'prog.py'), 'w') as f:
+            f.write(PROGRAM)
+        with open(os.path.join(self.dir, 'prog.py')) as data:
+            st, srcdata = static.parse_module(data)
+        graph = parallel.import_graph(st, srcdata, self.path)
+        assert graph == {os.path.join(self.dir, 'lib.py'): set(), os.path.join(self.dir, 'other.py'): set()}
+
+    def test_bodies_deferred(self):
+        file = os.path.join(self.dir, 'lib.py')
+        data, hashes, codes, deferred = parallel.check_component([file], [], self.path, self.settings)
+        assert codes == {}
+        assert list(deferred) == [file]
+        assert deferred[file][0] == LIB.encode('utf-8')
+
+    def test_failed_component(self):
+        file = os.path.join(self.dir, 'bad.py')
+        with open(file, 'w') as f:
+            f.write('def g()->int:\n    return 1\ng(\n')
+        assert parallel.check_component([file], [], self.path, self.settings) is None
+
+
+class TestParallelPrograms(ProgramTestCase):
+    FILES = {'lib.py': LIB, 'other.py': OTHER, 'bad.py': BAD, 'prog.py': PROGRAM}
+
+    def output(self, *args):
+        # -j reports the modules it looks for up front
+        lines = self.retic(*args).split('\n')
+        return [re.sub('0x[0-9a-f]+', '', line) for line in lines if not line.startswith(('#', 'looking'))]
+
+    def test_same_as_serial(self):
+        assert self.output() == ['2 4', '']
+        assert self.output('-j', '4') == self.output()
+
+
+if __name__ == '__main__':
+    unittest.main()
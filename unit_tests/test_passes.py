@@ -0,0 +1,73 @@
+import unittest
+import sys, io, contextlib
+
+sys.path.insert(0, '..')
+
+from retic import passes, static
+
+MODULE = '''\
+def f(x:int)->int:
+    return x + 1
+
+def g()->int:
+    return f(1)
+'''
+
+def names(ps):
+    return [p.name for p in ps]
+
+class TestPasses(unittest.TestCase):
+
+    def test_schedule(self):
+        ran = []
+        def step(name):
+            return lambda st, state: ran.append(name) or st
+        a = passes.Pass('a', step('a'), provides={'x'})
+        b = passes.Pass('b', step('b'), requires={'x'}, provides={'y'})
+        c = passes.Pass('c', step('c'), provides={'z'})
+        d = passes.Pass('d', step('d'), requires={'y'}, transforms=True)
+        # Passes that nothing needs are dropped, the rest keep their
+        # order
+        assert names(passes.schedule([a, b, c, d])) == ['a', 'b', 'd']
+        assert names(passes.schedule([a, b, c, d], {'z'})) == ['a', 'b', 'c', 'd']
+        assert names(passes.schedule([c, a, b])) == []
+        passes.run(passes.schedule([a, b, c, d]), None)
+        assert ran == ['a', 'b', 'd']
+
+    def test_transient_schedule(self):
+        optimized = names(passes.schedule(passes.transient_passes(True)))
+        assert optimized == ['strip_annotations', 'insert_checks+expand_macros', 'save_unoptimized', 'insert_usage_checks',
+                             'generate_constraints', 'solve_constraints', 'remove_trusted_checks', 'hoist_invariant_checks',
+                             'remove_redundant_checks', 'localize_types+compile_checks']
+        assert names(passes.schedule(passes.transient_passes(True), {'check statistics'})) == \
+            optimized[:-1] + ['report_check_statistics', optimized[-1]]
+        assert names(passes.schedule(passes.transient_passes(False))) == \
+            ['strip_annotations', 'insert_checks+expand_macros', 'remove_checks', 'hoist_invariant_checks',
+             'remove_redundant_checks', 'localize_types+compile_checks']
+
+    def compile(self, library):
+        data = io.StringIO(MODULE)
+        data.name = 'mod.py'
+        st, srcdata = static.parse_module(data)
+        st = static.typecheck_module(st, srcdata)
+        state = {'library': library}
+        out = io.StringIO()
+        with contextlib.redirect_stdout(io.StringIO()):
+            st = passes.run(passes.schedule(passes.transient_passes(True)), st, state)
+        static.emit_module(st, file=out)
+        return out.getvalue(), state
+
+    def test_run(self):
+        program, pstate = self.compile(False)
+        library, lstate = self.compile(True)
+        # f is only called with ints within the module, but a library's
+        # exports may be called with anything (the OpenWorld
+        # constraints)
+        assert '__retic_check_int__(x)' not in program
+        assert '__retic_check_int__(x)' in library
+        assert len(lstate['constraints']) > len(pstate['constraints'])
+        assert pstate['unsolved'] == lstate['unsolved'] == {}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+import os, json
+
+from unit_tests import ProgramTestCase
+
+PROGRAM = '''\
+def f(x:int)->int:
+    return x + 1
+
+def call(h, v):
+    return h(v)
+
+for i in eval('range(5)'):
+    call(f, i)
+'''
+
+class TestProfile(ProgramTestCase):
+    FILES = {'prog.py': PROGRAM}
+
+    def test_profile(self):
+        profile = os.path.join(self.dir, 'profile.json')
+        output = self.retic('--profile-checks', RETIC_CHECK_PROFILE=profile)
+        assert '1 sites, 5 checks' in output
+        with open(profile) as f:
+            sites = json.load(f)
+        assert [(site['module'], site['line'], site['type'], site['count']) for site in sites] == [('__main__', 1, 'int', 5)]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from unit_tests import retic_once
+
+PROGRAM = '''\
+@fields({'x':int})
+class C:
+    def __init__(self):
+        self.x = 1
+
+def f(x:int)->int:
+    return x
+
+def put(o:C, v)->int:
+    o.x = f(v)
+    return o.x
+
+def get(o:C)->int:
+    a = o.x
+    return o.x
+
+import lib
+def mod()->int:
+    lib.y = f(1)
+    return lib.y
+'''
+
+def function(source, name):
+    lines = source.split('\n')
+    start = lines.index('def {}:'.format(name))
+    end = start + 1
+    while end < len(lines) and lines[end].startswith(' '):
+        end += 1
+    return '\n'.join(lines[start:end])
+
+class TestRedundantChecks(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.source = retic_once({'lib.py': 'y = 3\n', 'prog.py': PROGRAM}, '-n', '-p')
+
+    def checks(self, name):
+        return function(self.source, name).count('check_int__(')
+
+    def test_attribute_store(self):
+        # o may belong to a subclass whose __setattr__ stores something
+        # else
+        assert self.checks('put(o, v)') == 2
+
+    def test_attribute_load(self):
+        # or whose x is a property
+        assert self.checks('get(o)') == 2
+
+    def test_module_attribute(self):
+        assert self.checks('mod()') == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
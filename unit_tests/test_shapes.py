@@ -0,0 +1,69 @@
+import unittest
+import sys
+
+sys.path.insert(0, '..')
+
+from retic import opt_transient
+from retic.base_runtime_exception import NormalRuntimeError
+
+check = opt_transient.__retic_check_structural__
+
+class TestShapes(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = opt_transient.ENABLE_EXCEPTHOOK
+        opt_transient.ENABLE_EXCEPTHOOK = False
+
+    def tearDown(self):
+        opt_transient.ENABLE_EXCEPTHOOK = self.saved
+
+    def test_deleted_member(self):
+        class C:
+            def m(self): pass
+        check(C(), ('m',))
+        delattr(C, 'm')
+        with self.assertRaises(NormalRuntimeError):
+            check(C(), ('m',))
+
+    def test_replaced_member(self):
+        class C:
+            def m(self): pass
+        check(C(), ('m',))
+        C.m = property(lambda self: 1/0)
+        with self.assertRaises(NormalRuntimeError):
+            check(C(), ('m',))
+
+    def test_shadowed_member(self):
+        class B:
+            def m(self): pass
+        class C(B): pass
+        check(C(), ('m',))
+        C.m = property(lambda self: 1/0)
+        with self.assertRaises(NormalRuntimeError):
+            check(C(), ('m',))
+
+    def test_getattribute(self):
+        class C:
+            def m(self): pass
+        check(C(), ('m',))
+        def getattribute(self, k):
+            raise AttributeError(k)
+        C.__getattribute__ = getattribute
+        with self.assertRaises(NormalRuntimeError):
+            check(C(), ('m',))
+
+    def test_instance_members(self):
+        class C:
+            @classmethod
+            def n(cls): pass
+            def __init__(self):
+                self.x = 1
+        check(C(), ('x', 'n'))
+        c = C()
+        del c.x
+        with self.assertRaises(NormalRuntimeError):
+            check(c, ('x', 'n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
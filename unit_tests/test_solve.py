@@ -0,0 +1,100 @@
+import unittest
+import sys, threading, multiprocessing
+
+sys.path.insert(0, '..')
+
+from retic import flags
+from retic.trust import solve
+from retic.trust.constraints import STC, EqC
+from retic.trust.ctypes import CVar, CInt, CStr
+from unit_tests import ProgramTestCase
+
+class TestSolve(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = flags.SOLVE_TIME_BUDGET, flags.SOLVE_SIZE_BUDGET
+
+    def tearDown(self):
+        flags.SOLVE_TIME_BUDGET, flags.SOLVE_SIZE_BUDGET = self.saved
+
+    def test_links(self):
+        a, b, c = CVar('a'), CVar('b'), CVar('c')
+        links = solve.Links()
+        links.setup(a).upper_bounds.add(CInt())
+        links.setup(b).lower_bounds.add(CStr())
+        links.setup(c)
+        links.union(a, b)
+        assert links[a] is links[b] and links[a] is not links[c]
+        assert links[b].upper_bounds == {CInt()} and links[a].lower_bounds == {CStr()}
+        links.union(c, b)
+        assert links.find(a) is links.find(c)
+        assert list(links) == [a, b, c] and len(links) == 3 and c in links
+
+    def test_partition(self):
+        a, b, c = CVar('a'), CVar('b'), CVar('c')
+        constraints = [STC(a, CInt()), STC(c, CStr()), STC(CInt(), CInt()), STC(b, a)]
+        components = solve.partition(constraints, {})
+        assert sorted(map(str, components)) == sorted(map(str, [[constraints[0], constraints[3]], [constraints[1]], [constraints[2]]]))
+
+    def test_solve(self):
+        a, b, c = CVar('a'), CVar('b'), CVar('c')
+        solved, unsolved = solve.solve_vars([STC(CInt(), a), STC(a, b), EqC(b, c)], {})
+        assert {str(sol) for sol in solved} == {'{} := int'.format(v) for v in [a, b, c]}
+        assert unsolved == {}
+
+    def test_check_budget(self):
+        flags.SOLVE_SIZE_BUDGET = 10
+        solve.check_budget(10)
+        with self.assertRaises(solve.OverBudget):
+            solve.check_budget(11)
+
+    def test_over_budget(self):
+        # Components over budget are left unsolved, the rest are still
+        # solved
+        a, b, c = CVar('a'), CVar('b'), CVar('c')
+        flags.SOLVE_SIZE_BUDGET = 1
+        solved, unsolved = solve.solve_vars([STC(a, CInt()), STC(b, a), STC(c, CStr())], {})
+        assert [str(sol) for sol in solved] == ['{} := *'.format(c)]
+        assert set(unsolved) == {a, b} and 'size budget' in unsolved[a]
+
+    def test_time_budget(self):
+        flags.SOLVE_TIME_BUDGET = -1
+        a = CVar('a')
+        solved, unsolved = solve.solve_vars([STC(a, CInt())], {})
+        assert solved == [] and 'time budget' in unsolved[a]
+
+    def test_can_fork(self):
+        assert solve.can_fork() == ('fork' in multiprocessing.get_all_start_methods() and
+                                    multiprocessing.get_start_method(allow_none=True) in [None, 'fork'])
+        # Asking doesn't fix the start method
+        assert multiprocessing.get_start_method(allow_none=True) is None
+
+    def test_no_fork_with_threads(self):
+        stop = threading.Event()
+        thread = threading.Thread(target=stop.wait)
+        thread.start()
+        try:
+            assert not solve.can_fork()
+        finally:
+            stop.set()
+            thread.join()
+
+
+class TestSolvePrograms(ProgramTestCase):
+    # Programs whose constraint systems crash the solver (corpus tests
+    # dominit and imptyclient9), which should only lose the optimization
+    FILES = {'dominit.py': 'class A:\n    def a(self):\n        pass\n\n\nclass B(A):\n    b = 10\nprint(B().b)\nprint(B.b)\n',
+             'imptylib.py': 'class A: pass\n\nclass C:\n    x = 20\n',
+             'imptyclient9.py': 'import imptylib \n\ndef f(x:imptylib.A): pass\n\nf(imptylib.A())\nprint("done")\n'}
+
+    def test_solver_error(self):
+        assert self.retic(program='dominit.py').endswith('\n10\n10\n')
+
+    def test_imported_class(self):
+        output = self.retic(program='imptyclient9.py')
+        assert "could not solve: KeyError: 'A'" in output
+        assert output.endswith('\ndone\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
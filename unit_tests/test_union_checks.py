@@ -0,0 +1,83 @@
+import unittest
+
+from retic import opt_transient, opt_check_compiler, retic_ast
+from retic.base_runtime_exception import NormalRuntimeError
+from unit_tests import retic_once
+
+PROGRAM = '''\
+class C:
+    pass
+
+def f(x:Union[int, str])->int:
+    return 0
+
+def g(x:Union[List(int), None, Tuple(int, int)])->int:
+    return 0
+
+def h(x:Union[C, int])->int:
+    return 0
+
+def k(x:Union[complex, Set(int)])->int:
+    return 0
+
+def m(x:Union[float, str])->int:
+    return 0
+'''
+
+class TestUnionChecks(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.source = retic_once({'prog.py': PROGRAM}, '-n', '-p')
+        cls.env = {}
+        exec(cls.source, cls.env)
+
+    def setUp(self):
+        self.saved = opt_transient.ENABLE_EXCEPTHOOK
+        opt_transient.ENABLE_EXCEPTHOOK = False
+
+    def tearDown(self):
+        opt_transient.ENABLE_EXCEPTHOOK = self.saved
+
+    def test_predicates(self):
+        assert self.source.count('def __retic_union_') == 5
+        assert '__retic_check_union__(x' not in self.source
+
+    def test_alternatives(self):
+        f, g = self.env['f'], self.env['g']
+        for v in [1, 'a', True]:
+            assert f(v) == 0
+        for v in [[1], None, (1, 2)]:
+            assert g(v) == 0
+        h, k, m = self.env['h'], self.env['k'], self.env['m']
+        for v in [self.env['C'](), 1]:
+            assert h(v) == 0
+        for v in [1j, {1}]:
+            assert k(v) == 0
+        # Like the generic check, floats accept ints
+        for v in [1.5, 1, True, 'a']:
+            assert m(v) == 0
+        # A tuple of the wrong length falls back to the generic check,
+        # which only tests its class
+        assert g((1, 2, 3)) == 0
+
+    def test_failures(self):
+        f, g = self.env['f'], self.env['g']
+        h, k = self.env['h'], self.env['k']
+        # The predicates reject what __retic_check_union__ rejects:
+        # instances aren't None, complex numbers aren't ints or floats,
+        # and sets aren't frozensets
+        for fn, v in [(f, 1.5), (f, None), (g, 'a'), (g, 0), (h, None), (h, 'a'),
+                      (k, 1), (k, 1.5), (k, frozenset())]:
+            with self.assertRaises(NormalRuntimeError):
+                fn(v)
+
+    def test_class_alternative(self):
+        compiler = opt_check_compiler.CheckCompiler()
+        compiler.preorder([])
+        compiler.roots, compiler.statement = {'C': (0, False)}, 1
+        assert compiler.union_predicate(retic_ast.Union([retic_ast.Class('C'), retic_ast.Int()]), 2, 0) is None
+
+
+if __name__ == '__main__':
+    unittest.main()